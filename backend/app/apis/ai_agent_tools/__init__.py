@@ -17,7 +17,18 @@ from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 
 from app.apis.preview import create_backend_workspace
-from app.libs.database import get_db_connection
+from app.libs.code_index import code_index
+from app.libs.code_search import (
+    DEFAULT_CONTEXT_LINES,
+    DEFAULT_MAX_BYTES,
+    DEFAULT_MAX_RESULTS,
+    build_results,
+    search_files,
+)
+from app.libs.database import db_connection, get_pool_stats
+from app.libs.file_patch import PatchError, apply_search_replace, apply_unified_diff
+from app.libs.file_store import content_hash, list_versions, record_version, record_versions, rollback_file
+from app.libs.schema_introspection import get_cached_schema, invalidate_schema_cache
 from app.libs.ai_orchestrator import AIOrchestrator
 from app.libs.models import ChatRole, TaskPriority, TaskStatus
 
@@ -72,12 +83,28 @@ class CreateFileRequest(BaseModel):
     file_type: Optional[str] = None
 
 
+class SearchReplaceEdit(BaseModel):
+    """A single search/replace edit"""
+
+    search: str = Field(..., min_length=1)
+    replace: str
+
+
 class UpdateFileRequest(BaseModel):
-    """Request to update a file"""
+    """Request to update a file
+
+    Send exactly one of file_content (whole file), patch (unified diff) or
+    edits (search/replace pairs). expected_hash is the SHA-256 of the
+    content the change was based on, the update is rejected with 409 if
+    the file changed in the meantime.
+    """
 
     project_id: str
     file_path: str
-    file_content: str
+    file_content: Optional[str] = None
+    patch: Optional[str] = None
+    edits: Optional[list[SearchReplaceEdit]] = None
+    expected_hash: Optional[str] = None
     language: Optional[str] = None
 
 
@@ -86,6 +113,41 @@ class SearchCodeRequest(BaseModel):
 
     project_id: str
     keywords: list[str] = Field(..., min_items=1)
+    max_results: int = Field(default=DEFAULT_MAX_RESULTS, ge=1, le=100)
+    context_lines: int = Field(default=DEFAULT_CONTEXT_LINES, ge=0, le=10)
+    max_bytes: int = Field(default=DEFAULT_MAX_BYTES, ge=1_000, le=200_000)
+
+
+class BatchWriteFile(BaseModel):
+    """A single file in a batch write"""
+
+    file_path: str = Field(..., min_length=1)
+    file_content: str
+    language: Optional[str] = None
+    file_type: Optional[str] = None
+
+
+class BatchWriteRequest(BaseModel):
+    """Request to create or update many files at once"""
+
+    project_id: str
+    files: list[BatchWriteFile] = Field(..., min_items=1, max_items=200)
+
+
+class RollbackFileRequest(BaseModel):
+    """Request to roll a file back to an earlier version"""
+
+    project_id: str
+    file_path: str
+    version: int = Field(..., ge=1)
+
+
+class FindSymbolRequest(BaseModel):
+    """Request to find symbol definitions"""
+
+    project_id: str
+    name: str = Field(..., min_length=1)
+    exact: bool = True
 
 
 class RunMigrationRequest(BaseModel):
@@ -168,11 +230,6 @@ class ToolResponse(BaseModel):
     data: Optional[dict[str, Any]] = None
 
 
-# =============================================================================
-# DATABASE HELPER
-# =============================================================================
-
-
 # =============================================================================
 # TASK MANAGEMENT TOOLS
 # =============================================================================
@@ -184,8 +241,7 @@ async def create_task(request: CreateTaskRequest) -> ToolResponse:
     Create a new task for a project.
     This is used by the AI to break down work into manageable pieces.
     """
-    conn = await get_db_connection()
-    try:
+    async with db_connection() as conn:
         # Create task
         task_id = uuid4()
         await conn.execute(
@@ -213,9 +269,6 @@ async def create_task(request: CreateTaskRequest) -> ToolResponse:
             data={"task_id": str(task_id)},
         )
 
-    finally:
-        await conn.close()
-
 
 @router.post("/tasks/update")
 async def update_task(request: UpdateTaskRequest) -> ToolResponse:
@@ -223,8 +276,7 @@ async def update_task(request: UpdateTaskRequest) -> ToolResponse:
     Update an existing task.
     Used by AI to change task status, update descriptions, etc.
     """
-    conn = await get_db_connection()
-    try:
+    async with db_connection() as conn:
         # Verify task exists
         task = await conn.fetchrow(
             "SELECT id FROM tasks WHERE id = $1",
@@ -285,9 +337,6 @@ async def update_task(request: UpdateTaskRequest) -> ToolResponse:
             data={"task_id": request.task_id},
         )
 
-    finally:
-        await conn.close()
-
 
 @router.get("/tasks/list/{project_id}")
 async def list_tasks(project_id: str) -> dict[str, Any]:
@@ -295,8 +344,7 @@ async def list_tasks(project_id: str) -> dict[str, Any]:
     List all tasks for a project.
     Used by AI to understand what work is planned/in progress.
     """
-    conn = await get_db_connection()
-    try:
+    async with db_connection() as conn:
         # Get tasks
         tasks = await conn.fetch(
             """
@@ -334,9 +382,6 @@ async def list_tasks(project_id: str) -> dict[str, Any]:
             ],
         }
 
-    finally:
-        await conn.close()
-
 
 @router.delete("/tasks/delete/{task_id}")
 async def delete_task(task_id: str) -> ToolResponse:
@@ -344,8 +389,7 @@ async def delete_task(task_id: str) -> ToolResponse:
     Delete a task.
     Used by AI to remove obsolete or duplicate tasks.
     """
-    conn = await get_db_connection()
-    try:
+    async with db_connection() as conn:
         # Verify task exists
         task = await conn.fetchrow(
             "SELECT id FROM tasks WHERE id = $1",
@@ -362,9 +406,6 @@ async def delete_task(task_id: str) -> ToolResponse:
             success=True, message="Task deleted successfully", data={"task_id": task_id}
         )
 
-    finally:
-        await conn.close()
-
 
 @router.post("/tasks/add-comment")
 async def add_task_comment(request: AddTaskCommentRequest) -> ToolResponse:
@@ -372,8 +413,7 @@ async def add_task_comment(request: AddTaskCommentRequest) -> ToolResponse:
     Add a comment/note to a task.
     Used by AI to document progress, decisions, and learnings.
     """
-    conn = await get_db_connection()
-    try:
+    async with db_connection() as conn:
         # Verify task exists
         task = await conn.fetchrow(
             "SELECT id, metadata FROM tasks WHERE id = $1",
@@ -411,9 +451,6 @@ async def add_task_comment(request: AddTaskCommentRequest) -> ToolResponse:
             data={"task_id": request.task_id},
         )
 
-    finally:
-        await conn.close()
-
 # =============================================================================
 # ERROR DETECTION TOOLS
 # =============================================================================
@@ -425,8 +462,7 @@ async def get_project_errors(project_id: str) -> dict[str, Any]:
     Used by AI to check if there are build/runtime errors after code generation.
     Returns errors sorted by most recent first.
     """
-    conn = await get_db_connection()
-    try:
+    async with db_connection() as conn:
         query = """
         SELECT id, error_type, message, stack_trace,
                file_path, line_number, code_snippet, context,
@@ -471,8 +507,6 @@ async def get_project_errors(project_id: str) -> dict[str, Any]:
             "errors": errors,
             "summary": error_summary
         }
-    finally:
-        await conn.close()
 
 @router.get("/errors/{project_id}/open")
 async def get_open_errors(project_id: str) -> dict[str, Any]:
@@ -480,8 +514,7 @@ async def get_open_errors(project_id: str) -> dict[str, Any]:
     Get only open/unresolved errors for a project.
     This is what AI should check after code generation to see if fixes are needed.
     """
-    conn = await get_db_connection()
-    try:
+    async with db_connection() as conn:
         query = """
         SELECT id, error_type, message, stack_trace,
                file_path, line_number, code_snippet, context,
@@ -513,8 +546,6 @@ async def get_open_errors(project_id: str) -> dict[str, Any]:
             "count": len(errors),
             "errors": errors
         }
-    finally:
-        await conn.close()
 
 # =============================================================================
 # FILE MANAGEMENT TOOLS
@@ -528,6 +559,8 @@ class CreateFileResponse(BaseModel):
     message: str
     file_id: str
     file_path: str
+    version: Optional[int] = None
+    content_hash: Optional[str] = None
 
 
 @router.post("/files/create")
@@ -620,8 +653,7 @@ async def create_file(request: CreateFileRequest) -> CreateFileResponse:
                 await create_backend_workspace(request.project_id)
                 print(f"✅ Backend workspace created at {workspace_path}")
         
-        conn = await get_db_connection()
-        try:
+        async with db_connection() as conn:
             # Check if file already exists in project_files
             existing = await conn.fetchrow(
                 """
@@ -637,135 +669,17 @@ async def create_file(request: CreateFileRequest) -> CreateFileResponse:
                     status_code=400, detail="File already exists. Use update endpoint."
                 )
 
-            # Create file in project_files table
-            file_id = uuid4()
-            await conn.execute(
-                """
-                INSERT INTO project_files (
-                    id, project_id, filepath, content, language
+            # Create file in project_files table, with healed code if available
+            async with conn.transaction():
+                version = await record_version(
+                    conn, UUID(request.project_id), request.file_path, final_code, request.language
                 )
-                VALUES ($1, $2, $3, $4, $5)
-                """,
-                file_id,
-                UUID(request.project_id),
-                request.file_path,
-                final_code,  # Use healed code if available
-                request.language,
-            )
-
-            # Auto-detect and install packages from generated code
-            if request.language == "python":
-                from app.apis.preview import detect_python_imports, install_packages_in_project
-                
-                try:
-                    # Use imports from validation if available, otherwise detect
-                    packages_to_install = []
-                    if validation_result and validation_result.imports:
-                        # We already have imports from validation
-                        from app.libs.code_validator import get_missing_packages, PYTHON_IMPORT_TO_PACKAGE
-                        
-                        # Map imports to package names
-                        packages_to_install = [
-                            PYTHON_IMPORT_TO_PACKAGE.get(imp, imp) 
-                            for imp in validation_result.imports
-                        ]
-                    else:
-                        # Fallback to old detection method
-                        packages_to_install = await detect_python_imports(request.file_content)
-                    
-                    if packages_to_install:
-                        print(f"[AI] Detected Python packages in {request.file_path}: {packages_to_install}")
-                        install_result = await install_packages_in_project(
-                            request.project_id,
-                            packages_to_install
-                        )
-                        print(f"[AI] Package installation result: {install_result}")
-                except Exception as e:
-                    print(f"[AI] Warning: Failed to auto-install packages: {e}")
-                    # Don't fail file creation if package installation fails
-
-            elif request.language == "typescript" and request.file_path.startswith("frontend/"):
-                from app.apis.preview import detect_npm_imports, update_project_package_json
-                
-                try:
-                    packages = await detect_npm_imports(request.file_content)
-                    if packages:
-                        print(f"[AI] Detected NPM packages in {request.file_path}: {packages}")
-                        # Update package.json in project workspace
-                        await update_project_package_json(request.project_id, packages)
-                        print(f"[AI] Updated package.json with packages: {packages}")
-                except Exception as e:
-                    print(f"[AI] Warning: Failed to auto-detect NPM packages: {e}")
-                    # Don't fail file creation if package detection fails
-
-            return CreateFileResponse(
-                success=True,
-                message=f"File created: {request.file_path}",
-                file_id=str(file_id),
-                file_path=request.file_path,
-            )
-
-        finally:
-            await conn.close()
-
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"File creation failed: {str(e)}")
-
-
-@router.put("/files/update")
-async def update_file(request: UpdateFileRequest) -> ToolResponse:
-    """
-    Update an existing file.
-    Used by AI to modify generated code.
-    """
-    # Validate code syntax before updating
-    validation_result: ValidationResult | None = None
-    
-    if request.language == "python":
-        validation_result = validate_python_syntax(request.file_content)
-        if not validation_result.is_valid:
-            error_details = "\n".join([
-                f"Line {err.line_number}: {err.message}" + 
-                (f" (Suggestion: {err.suggestion})" if err.suggestion else "")
-                for err in validation_result.errors
-            ])
-            raise HTTPException(
-                status_code=400,
-                detail=f"Python syntax validation failed:\n{error_details}"
-            )
-    
-    elif request.language == "typescript":
-        validation_result = validate_typescript_syntax(request.file_content)
-        if not validation_result.is_valid:
-            error_details = "\n".join([
-                f"{err.message}" + 
-                (f" (Suggestion: {err.suggestion})" if err.suggestion else "")
-                for err in validation_result.errors
-            ])
-            raise HTTPException(
-                status_code=400,
-                detail=f"TypeScript syntax validation failed:\n{error_details}"
+            file_id = version["file_id"]
+            code_index.upsert_file(
+                request.project_id, request.file_path, final_code, request.language, file_id
             )
-    
-    conn = await get_db_connection()
-    try:
-        # Update the file in project_files table
-        result = await conn.execute(
-            """
-            UPDATE project_files
-            SET content = $1, language = $2, updated_at = CURRENT_TIMESTAMP
-            WHERE project_id = $3 AND filepath = $4
-            """,
-            request.file_content,
-            request.language,
-            UUID(request.project_id),
-            request.file_path,
-        )
 
-        if result == "UPDATE 0":
-            raise HTTPException(status_code=404, detail="File not found")
-        
-        # Auto-detect and install packages from updated code
+        # Auto-detect and install packages from generated code
         if request.language == "python":
             from app.apis.preview import detect_python_imports, install_packages_in_project
             
@@ -774,7 +688,7 @@ async def update_file(request: UpdateFileRequest) -> ToolResponse:
                 packages_to_install = []
                 if validation_result and validation_result.imports:
                     # We already have imports from validation
-                    from app.libs.code_validator import PYTHON_IMPORT_TO_PACKAGE
+                    from app.libs.code_validator import get_missing_packages, PYTHON_IMPORT_TO_PACKAGE
                     
                     # Map imports to package names
                     packages_to_install = [
@@ -794,8 +708,8 @@ async def update_file(request: UpdateFileRequest) -> ToolResponse:
                     print(f"[AI] Package installation result: {install_result}")
             except Exception as e:
                 print(f"[AI] Warning: Failed to auto-install packages: {e}")
-                # Don't fail file update if package installation fails
-        
+                # Don't fail file creation if package installation fails
+
         elif request.language == "typescript" and request.file_path.startswith("frontend/"):
             from app.apis.preview import detect_npm_imports, update_project_package_json
             
@@ -803,19 +717,386 @@ async def update_file(request: UpdateFileRequest) -> ToolResponse:
                 packages = await detect_npm_imports(request.file_content)
                 if packages:
                     print(f"[AI] Detected NPM packages in {request.file_path}: {packages}")
+                    # Update package.json in project workspace
                     await update_project_package_json(request.project_id, packages)
                     print(f"[AI] Updated package.json with packages: {packages}")
             except Exception as e:
                 print(f"[AI] Warning: Failed to auto-detect NPM packages: {e}")
-                # Don't fail file update if package detection fails
+                # Don't fail file creation if package detection fails
 
-        return ToolResponse(
+        return CreateFileResponse(
             success=True,
-            message=f"File updated: {request.file_path}",
+            message=f"File created: {request.file_path}",
+            file_id=file_id,
+            file_path=request.file_path,
+            version=version["version"],
+            content_hash=version["hash"],
         )
 
-    finally:
-        await conn.close()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"File creation failed: {str(e)}")
+
+
+def _validate_or_raise(language: Optional[str], content: str) -> ValidationResult | None:
+    """Validate code syntax, raises 400 with the errors if it is invalid."""
+    if language == "python":
+        validation_result = validate_python_syntax(content)
+        if not validation_result.is_valid:
+            error_details = "\n".join([
+                f"Line {err.line_number}: {err.message}" + 
+                (f" (Suggestion: {err.suggestion})" if err.suggestion else "")
+                for err in validation_result.errors
+            ])
+            raise HTTPException(
+                status_code=400,
+                detail=f"Python syntax validation failed:\n{error_details}"
+            )
+        return validation_result
+
+    if language == "typescript":
+        validation_result = validate_typescript_syntax(content)
+        if not validation_result.is_valid:
+            error_details = "\n".join([
+                f"{err.message}" + 
+                (f" (Suggestion: {err.suggestion})" if err.suggestion else "")
+                for err in validation_result.errors
+            ])
+            raise HTTPException(
+                status_code=400,
+                detail=f"TypeScript syntax validation failed:\n{error_details}"
+            )
+        return validation_result
+
+    return None
+
+
+UPDATE_FILE_ATTEMPTS = 3
+
+
+def _apply_file_change(current: str, request: UpdateFileRequest) -> str:
+    """New content for update_file, CPU bound so it runs in a thread."""
+    if request.patch is not None:
+        return apply_unified_diff(current, request.patch)
+    if request.edits is not None:
+        return apply_search_replace(current, [(e.search, e.replace) for e in request.edits])
+    return request.file_content
+
+
+@router.put("/files/update")
+async def update_file(request: UpdateFileRequest) -> ToolResponse:
+    """
+    Update an existing file.
+    Used by AI to modify generated code.
+
+    Besides the complete new content this accepts a unified diff or
+    search/replace edits, which are applied to the stored content.
+    """
+    modes = [m for m in (request.file_content, request.patch, request.edits) if m is not None]
+    if len(modes) != 1:
+        raise HTTPException(
+            status_code=400, detail="Provide exactly one of file_content, patch or edits"
+        )
+
+    async with db_connection() as conn:
+        # Patches are computed in a thread before taking the row lock, fuzzy
+        # hunk matching can take seconds. If the row changed meanwhile the
+        # patch is recomputed against the new content.
+        for _ in range(UPDATE_FILE_ATTEMPTS):
+            language = request.language
+            base_hash = None
+            if request.file_content is not None and request.expected_hash is None:
+                new_content = request.file_content
+            else:
+                row = await conn.fetchrow(
+                    """
+                    SELECT content, language FROM project_file_contents
+                    WHERE project_id = $1 AND filepath = $2
+                    """,
+                    UUID(request.project_id),
+                    request.file_path,
+                )
+                if row is None:
+                    raise HTTPException(status_code=404, detail="File not found")
+                current = row["content"] or ""
+                language = language or row["language"]
+
+                base_hash = content_hash(current)
+                if request.expected_hash and request.expected_hash != base_hash:
+                    raise HTTPException(
+                        status_code=409,
+                        detail=f"File changed since it was read (current hash {base_hash}), re-read it and retry",
+                    )
+
+                try:
+                    new_content = await asyncio.to_thread(_apply_file_change, current, request)
+                except PatchError as e:
+                    raise HTTPException(status_code=422, detail=f"Patch failed: {e}")
+
+            # Validate code syntax before updating
+            validation_result = _validate_or_raise(language, new_content)
+
+            # Update the file in project_files table
+            async with conn.transaction():
+                locked = await conn.fetchrow(
+                    """
+                    SELECT blob_hash FROM project_files
+                    WHERE project_id = $1 AND filepath = $2
+                    FOR UPDATE
+                    """,
+                    UUID(request.project_id),
+                    request.file_path,
+                )
+                if locked is None:
+                    raise HTTPException(status_code=404, detail="File not found")
+                if base_hash is not None and locked["blob_hash"] != base_hash:
+                    continue
+
+                version = await record_version(
+                    conn, UUID(request.project_id), request.file_path, new_content, language
+                )
+            break
+        else:
+            raise HTTPException(
+                status_code=409,
+                detail="File kept changing while the patch was applied, re-read it and retry",
+            )
+        code_index.upsert_file(
+            request.project_id, request.file_path, new_content, language
+        )
+        
+    # Auto-detect and install packages from updated code
+    if language == "python":
+        from app.apis.preview import detect_python_imports, install_packages_in_project
+        
+        try:
+            # Use imports from validation if available, otherwise detect
+            packages_to_install = []
+            if validation_result and validation_result.imports:
+                # We already have imports from validation
+                from app.libs.code_validator import PYTHON_IMPORT_TO_PACKAGE
+                
+                # Map imports to package names
+                packages_to_install = [
+                    PYTHON_IMPORT_TO_PACKAGE.get(imp, imp) 
+                    for imp in validation_result.imports
+                ]
+            else:
+                # Fallback to old detection method
+                packages_to_install = await detect_python_imports(new_content)
+            
+            if packages_to_install:
+                print(f"[AI] Detected Python packages in {request.file_path}: {packages_to_install}")
+                install_result = await install_packages_in_project(
+                    request.project_id,
+                    packages_to_install
+                )
+                print(f"[AI] Package installation result: {install_result}")
+        except Exception as e:
+            print(f"[AI] Warning: Failed to auto-install packages: {e}")
+            # Don't fail file update if package installation fails
+    
+    elif language == "typescript" and request.file_path.startswith("frontend/"):
+        from app.apis.preview import detect_npm_imports, update_project_package_json
+        
+        try:
+            packages = await detect_npm_imports(new_content)
+            if packages:
+                print(f"[AI] Detected NPM packages in {request.file_path}: {packages}")
+                await update_project_package_json(request.project_id, packages)
+                print(f"[AI] Updated package.json with packages: {packages}")
+        except Exception as e:
+            print(f"[AI] Warning: Failed to auto-detect NPM packages: {e}")
+            # Don't fail file update if package detection fails
+
+    return ToolResponse(
+        success=True,
+        message=f"File updated: {request.file_path}",
+        data={"version": version["version"], "content_hash": version["hash"]},
+    )
+
+
+_VALIDATORS = {
+    "python": validate_python_syntax,
+    "typescript": validate_typescript_syntax,
+}
+
+
+async def _validate_file(file: BatchWriteFile) -> tuple[str, ValidationResult | None]:
+    """Validate a file, auto-healing invalid code like create_file does.
+
+    Returns the content to write (healed if needed) and its validation.
+    """
+    validate = _VALIDATORS.get(file.language)
+    if validate is None:
+        return file.file_content, None
+    result = await asyncio.to_thread(validate, file.file_content)
+    if result.is_valid:
+        return file.file_content, result
+
+    print(f"[AUTO-HEAL] {file.language} validation failed for {file.file_path}, attempting fix...")
+    try:
+        from app.libs.code_validator import auto_heal_code
+        healed_code = await auto_heal_code(file.file_content, result.errors, file.language)
+        healed = await asyncio.to_thread(validate, healed_code)
+    except Exception as heal_error:
+        print(f"[AUTO-HEAL] ⚠️ Auto-healing failed: {heal_error}")
+        return file.file_content, result
+    if not healed.is_valid:
+        print(f"[AUTO-HEAL] ❌ Healed code still has errors")
+        return file.file_content, result
+    print(f"[AUTO-HEAL] ✅ Successfully healed {file.file_path}")
+    return healed_code, healed
+
+
+@router.post("/files/batch-write")
+async def batch_write_files(request: BatchWriteRequest) -> ToolResponse:
+    """
+    Create or update many files in one transaction.
+    Used by AI when generating several files at once, e.g. from a plan.
+
+    All files are validated in parallel, invalid ones are auto-healed like
+    in create_file. Files that are still invalid are not written and are
+    reported under "invalid", the others are written. Packages are detected
+    once over all written files.
+    """
+    project_uuid = UUID(request.project_id)
+    paths = [f.file_path for f in request.files]
+    if len(set(paths)) != len(paths):
+        raise HTTPException(status_code=400, detail="Duplicate file paths in batch")
+
+    checked = await asyncio.gather(*(_validate_file(f) for f in request.files))
+    files = []
+    invalid = []
+    for f, (content, result) in zip(request.files, checked):
+        if result is not None and not result.is_valid:
+            invalid.append({
+                "file_path": f.file_path,
+                "errors": [
+                    (f"Line {err.line_number}: " if err.line_number else "") + err.message
+                    for err in result.errors
+                ],
+            })
+        else:
+            files.append((f, content, result))
+
+    if not files:
+        raise HTTPException(
+            status_code=400,
+            detail="Syntax validation failed:\n" + "\n\n".join(
+                f"{item['file_path']}:\n" + "\n".join(item["errors"]) for item in invalid
+            ),
+        )
+
+    # Auto-create backend workspace once if the batch contains Python API files
+    if any(f.file_type == "api" and f.language == "python" for f, _, _ in files):
+        workspace_path = Path("/disk/backend/.preview-builds") / request.project_id / "backend"
+        if not workspace_path.exists():
+            await create_backend_workspace(request.project_id)
+
+    async with db_connection() as conn:
+        async with conn.transaction():
+            # Upserts, also correct for concurrent batches creating the same new path
+            versions = await record_versions(
+                conn,
+                project_uuid,
+                [(f.file_path, content, f.language) for f, content, _ in files],
+            )
+
+    code_index.invalidate(request.project_id)
+
+    # Detect dependencies once over the union of all imports
+    from app.apis.preview import detect_npm_imports, install_packages_in_project, update_project_package_json
+    from app.libs.code_validator import PYTHON_IMPORT_TO_PACKAGE
+
+    python_packages: set[str] = set()
+    npm_packages: set[str] = set()
+    for f, content, result in files:
+        if f.language == "python" and result is not None:
+            python_packages.update(PYTHON_IMPORT_TO_PACKAGE.get(imp, imp) for imp in result.imports)
+        elif f.language == "typescript" and f.file_path.startswith("frontend/"):
+            npm_packages.update(await detect_npm_imports(content))
+
+    if python_packages:
+        try:
+            print(f"[AI] Detected Python packages in batch: {sorted(python_packages)}")
+            install_result = await install_packages_in_project(request.project_id, sorted(python_packages))
+            print(f"[AI] Package installation result: {install_result}")
+        except Exception as e:
+            print(f"[AI] Warning: Failed to auto-install packages: {e}")
+
+    if npm_packages:
+        try:
+            print(f"[AI] Detected NPM packages in batch: {sorted(npm_packages)}")
+            await update_project_package_json(request.project_id, sorted(npm_packages))
+        except Exception as e:
+            print(f"[AI] Warning: Failed to auto-detect NPM packages: {e}")
+
+    created = sum(1 for version in versions.values() if version["created"])
+    message = f"Wrote {len(files)} files ({created} created, {len(files) - created} updated)"
+    if invalid:
+        message += f", skipped {len(invalid)} with syntax errors"
+    return ToolResponse(
+        success=True,
+        message=message,
+        data={
+            "files": [
+                {
+                    "file_path": f.file_path,
+                    "file_id": versions[f.file_path]["file_id"],
+                    "created": versions[f.file_path]["created"],
+                    "healed": content != f.file_content,
+                    "version": versions[f.file_path]["version"],
+                    "content_hash": versions[f.file_path]["hash"],
+                }
+                for f, content, _ in files
+            ],
+            "invalid": invalid,
+            "python_packages": sorted(python_packages),
+            "npm_packages": sorted(npm_packages),
+        },
+    )
+
+
+@router.get("/files/versions/{project_id}/{file_path:path}")
+async def list_file_versions(
+    project_id: str, file_path: str
+) -> dict[str, Any]:
+    """
+    List the version history of a file, newest first.
+    Used by AI to find a version to roll back to.
+    """
+    async with db_connection() as conn:
+        versions = await list_versions(conn, UUID(project_id), file_path)
+
+    if not versions:
+        raise HTTPException(status_code=404, detail="File not found")
+
+    return {"success": True, "file_path": file_path, "versions": versions}
+
+
+@router.post("/files/rollback")
+async def rollback_file_version(request: RollbackFileRequest) -> ToolResponse:
+    """
+    Roll a file back to an earlier version.
+    No new version is appended, the file points at the earlier version and
+    its content is restored from that version's blob.
+    """
+    async with db_connection() as conn:
+        async with conn.transaction():
+            rolled_back = await rollback_file(
+                conn, UUID(request.project_id), request.file_path, request.version
+            )
+
+    if rolled_back is None:
+        raise HTTPException(status_code=404, detail="File version not found")
+
+    code_index.invalidate(request.project_id)
+
+    return ToolResponse(
+        success=True,
+        message=f"File {request.file_path} rolled back to version {request.version}",
+        data={"version": request.version, "content_hash": rolled_back["hash"]},
+    )
 
 
 @router.get("/files/read/{project_id}")
@@ -826,14 +1107,13 @@ async def read_files(
     Read file(s) from the virtual file system.
     If file_path provided, returns that file. Otherwise returns all files.
     """
-    conn = await get_db_connection()
-    try:
+    async with db_connection() as conn:
         if file_path:
             # Get specific file from project_files table
             file = await conn.fetchrow(
                 """
                 SELECT id, filepath, content, language
-                FROM project_files 
+                FROM project_file_contents
                 WHERE project_id = $1 AND filepath = $2
                 """,
                 UUID(project_id),
@@ -849,6 +1129,7 @@ async def read_files(
                     "id": str(file["id"]),
                     "file_path": file["filepath"],
                     "file_content": file["content"],
+                    "content_hash": content_hash(file["content"] or ""),
                     "language": file["language"],
                     "is_active": True,
                 },
@@ -858,7 +1139,7 @@ async def read_files(
             files = await conn.fetch(
                 """
                 SELECT id, filepath, content, language
-                FROM project_files 
+                FROM project_file_contents
                 WHERE project_id = $1
                 ORDER BY filepath
                 """,
@@ -872,6 +1153,7 @@ async def read_files(
                         "id": str(f["id"]),
                         "file_path": f["filepath"],
                         "file_content": f["content"],
+                        "content_hash": content_hash(f["content"] or ""),
                         "language": f["language"],
                         "is_active": True,
                     }
@@ -879,9 +1161,6 @@ async def read_files(
                 ],
             }
 
-    finally:
-        await conn.close()
-
 
 @router.post("/files/search")
 async def search_code(
@@ -890,40 +1169,65 @@ async def search_code(
     """
     Search for code across all files in a project.
     Used by AI to find relevant code before making changes.
+
+    Files are ranked by keyword occurrences and returned as line snippets
+    with context, bounded by max_results and max_bytes. Answered from the
+    in-memory code index, projects too large for it are searched in SQL.
     """
-    conn = await get_db_connection()
-    try:
-        # Build search query (case-insensitive OR search)
-        search_conditions = " OR ".join(
-            ["file_content ILIKE $" + str(i + 2) for i in range(len(request.keywords))]
+    index = await code_index.get(request.project_id)
+    if index is not None:
+        found = index.search(
+            request.keywords, request.max_results, request.context_lines, request.max_bytes
         )
-        search_params = [f"%{kw}%" for kw in request.keywords]
+        return {"success": True, **found}
 
-        query = f"""
-            SELECT id, filepath, file_content, language
-            FROM generated_files 
-            WHERE project_id = $1 AND is_active = true
-            AND ({search_conditions})
-            ORDER BY filepath
-        """
+    async with db_connection() as conn:
+        rows = await search_files(
+            conn, UUID(request.project_id), request.keywords, request.max_results
+        )
+
+    found = build_results(
+        rows, request.keywords, request.context_lines, request.max_bytes
+    )
+    return {"success": True, **found}
 
-        results = await conn.fetch(query, UUID(request.project_id), *search_params)
 
-        return {
-            "success": True,
-            "results": [
-                {
-                    "id": str(r["id"]),
-                    "filepath": r["filepath"],
-                    "file_content": r["file_content"],
-                    "language": r["language"],
-                }
-                for r in results
-            ],
-        }
+@router.post("/files/find-symbol")
+async def find_symbol(
+    request: FindSymbolRequest
+) -> dict[str, Any]:
+    """
+    Find where a function, class, component, type or variable is defined.
+    Used by AI to jump to definitions instead of reading whole files.
+    """
+    index = await code_index.get(request.project_id)
+    if index is None:
+        raise HTTPException(
+            status_code=413, detail="Project too large for the code index, use search_code"
+        )
 
-    finally:
-        await conn.close()
+    definitions = index.find_symbol(request.name, exact=request.exact)
+    return {
+        "success": True,
+        "definitions": [
+            {
+                "name": d.name,
+                "kind": d.kind,
+                "filepath": d.filepath,
+                "line": d.line,
+                "text": d.text,
+            }
+            for d in definitions
+        ],
+    }
+
+
+@router.get("/files/index-stats")
+async def get_code_index_stats() -> dict[str, Any]:
+    """
+    Get usage statistics of the in-memory code index.
+    """
+    return {"success": True, "index": code_index.stats()}
 
 
 @router.delete("/files/delete/{project_id}/{file_path:path}")
@@ -934,22 +1238,29 @@ async def delete_file(
     Delete a file from the virtual file system.
     Used by AI to remove obsolete files.
     """
-    conn = await get_db_connection()
-    try:
-        # Mark file as inactive (soft delete)
-        result = await conn.execute(
-            """
-            UPDATE generated_files 
-            SET is_active = false, updated_at = $1
-            WHERE project_id = $2 AND filepath = $3 AND is_active = true
-            """,
-            datetime.utcnow(),
-            UUID(project_id),
-            file_path,
-        )
+    async with db_connection() as conn:
+        async with conn.transaction():
+            # Mark file as inactive (soft delete)
+            result = await conn.execute(
+                """
+                UPDATE generated_files 
+                SET is_active = false, updated_at = $1
+                WHERE project_id = $2 AND filepath = $3 AND is_active = true
+                """,
+                datetime.utcnow(),
+                UUID(project_id),
+                file_path,
+            )
+            # The version history in file_versions is kept
+            removed = await conn.execute(
+                "DELETE FROM project_files WHERE project_id = $1 AND filepath = $2",
+                UUID(project_id),
+                file_path,
+            )
 
-        if result == "UPDATE 0":
+        if result == "UPDATE 0" and removed == "DELETE 0":
             raise HTTPException(status_code=404, detail="File not found")
+        code_index.invalidate(project_id)
 
         return ToolResponse(
             success=True,
@@ -957,9 +1268,6 @@ async def delete_file(
             data={"file_path": file_path},
         )
 
-    finally:
-        await conn.close()
-
 # =============================================================================
 # TEST ENDPOINT
 # =============================================================================
@@ -974,8 +1282,7 @@ async def test_error_feedback_loop(project_id: str) -> dict[str, Any]:
     4. Fix errors (simulated)
     5. Verify resolution
     """
-    conn = await get_db_connection()
-    try:
+    async with db_connection() as conn:
         log = []
         log.append("🧪 Starting Error Feedback Loop Test")
         
@@ -996,19 +1303,10 @@ function BrokenComponent() {
 export default BrokenComponent;
 """
         
-        file_id = uuid4()
-        await conn.execute(
-            """
-            INSERT INTO project_files (id, project_id, filepath, content, created_at, updated_at)
-            VALUES ($1, $2, $3, $4, NOW(), NOW())
-            ON CONFLICT (project_id, filepath) 
-            DO UPDATE SET content = $4, updated_at = NOW()
-            """,
-            file_id,
-            project_id,
-            "src/components/BrokenComponent.tsx",
-            broken_code
-        )
+        async with conn.transaction():
+            await record_version(
+                conn, UUID(project_id), "src/components/BrokenComponent.tsx", broken_code
+            )
         log.append("   ✅ Created src/components/BrokenComponent.tsx with syntax error")
         
         # Step 2: Simulate error detection (normally done by build process)
@@ -1067,16 +1365,11 @@ function BrokenComponent() {
 export default BrokenComponent;
 """
         
-        await conn.execute(
-            """
-            UPDATE project_files
-            SET content = $1, updated_at = NOW()
-            WHERE project_id = $2 AND filepath = $3
-            """,
-            fixed_code,
-            project_id,
-            "src/components/BrokenComponent.tsx"
-        )
+        async with conn.transaction():
+            await record_version(
+                conn, UUID(project_id), "src/components/BrokenComponent.tsx", fixed_code
+            )
+        code_index.invalidate(project_id)
         log.append("   ✅ Updated file with fixed code")
         
         # Step 5: Mark error as resolved
@@ -1112,9 +1405,6 @@ export default BrokenComponent;
             "errors_fixed": 1,
             "errors_remaining": remaining_errors
         }
-        
-    finally:
-        await conn.close()
 
 # =============================================================================
 # CHAT MANAGEMENT TOOLS
@@ -1177,8 +1467,7 @@ async def get_chat_history(
     Get chat message history for a project.
     Used by AI to load context.
     """
-    conn = await get_db_connection()
-    try:
+    async with db_connection() as conn:
         # Get messages
         messages = await conn.fetch(
             """
@@ -1206,9 +1495,6 @@ async def get_chat_history(
             ],
         }
 
-    finally:
-        await conn.close()
-
 
 # =============================================================================
 # PROJECT INSPECTION TOOLS
@@ -1222,8 +1508,7 @@ async def init_project() -> dict[str, Any]:
     Creates a project if none exists, otherwise returns existing project.
     Used by frontend to get a valid project_id on mount.
     """
-    conn = await get_db_connection()
-    try:
+    async with db_connection() as conn:
         # For now, use a default user_id since auth is disabled
         # In a real app, this would come from the authenticated user
         default_user_id = "default-user"
@@ -1270,9 +1555,6 @@ async def init_project() -> dict[str, Any]:
             "description": "AI-powered app builder",
             "is_new": True,
         }
-    
-    finally:
-        await conn.close()
 
 
 @router.get("/project/file-tree/{project_id}")
@@ -1283,8 +1565,7 @@ async def get_file_tree(
     Get the file tree structure for a project.
     Used by AI to understand project structure.
     """
-    conn = await get_db_connection()
-    try:
+    async with db_connection() as conn:
         # Get all file paths
         files = await conn.fetch(
             """
@@ -1318,9 +1599,6 @@ async def get_file_tree(
 
         return {"success": True, "tree": tree}
 
-    finally:
-        await conn.close()
-
 
 @router.get("/project/stats/{project_id}")
 async def get_project_stats(
@@ -1330,8 +1608,7 @@ async def get_project_stats(
     Get statistics about a project.
     Used by AI to understand project size and complexity.
     """
-    conn = await get_db_connection()
-    try:
+    async with db_connection() as conn:
         # Get stats
         stats = await conn.fetchrow(
             """
@@ -1366,9 +1643,6 @@ async def get_project_stats(
             },
         }
 
-    finally:
-        await conn.close()
-
 # =============================================================================
 # DATABASE TOOLS
 # =============================================================================
@@ -1382,8 +1656,7 @@ async def run_migration_endpoint(
     Run a database migration.
     Used by AI to create/modify database schema.
     """
-    conn = await get_db_connection()
-    try:
+    async with db_connection() as conn:
         # Store migration record
         migration_id = uuid4()
         await conn.execute(
@@ -1411,6 +1684,7 @@ async def run_migration_endpoint(
                 "success",
                 migration_id,
             )
+            invalidate_schema_cache()
 
             return ToolResponse(
                 success=True,
@@ -1434,9 +1708,6 @@ async def run_migration_endpoint(
                 status_code=400, detail=f"Migration failed: {str(e)}"
             )
 
-    finally:
-        await conn.close()
-
 
 @router.post("/database/run-query")
 async def run_sql_query(
@@ -1446,35 +1717,41 @@ async def run_sql_query(
     Execute a SQL query.
     Used by AI to query data for analysis or verification.
     """
-    conn = await get_db_connection()
-    try:
-        # Execute query
-        params = request.params or []
+    async with db_connection() as conn:
+        try:
+            # Execute query
+            params = request.params or []
         
-        if request.query.strip().upper().startswith("SELECT"):
-            # SELECT query - return results
-            rows = await conn.fetch(request.query, *params)
+            if request.query.strip().upper().startswith("SELECT"):
+                # SELECT query - return results
+                rows = await conn.fetch(request.query, *params)
             
-            return {
-                "success": True,
-                "rows": [dict(row) for row in rows],
-                "row_count": len(rows),
-            }
-        else:
-            # INSERT/UPDATE/DELETE - return affected rows
-            result = await conn.execute(request.query, *params)
+                return {
+                    "success": True,
+                    "rows": [dict(row) for row in rows],
+                    "row_count": len(rows),
+                }
+            else:
+                # INSERT/UPDATE/DELETE - return affected rows
+                result = await conn.execute(request.query, *params)
             
-            return {
-                "success": True,
-                "result": result,
-                "message": "Query executed successfully",
-            }
+                return {
+                    "success": True,
+                    "result": result,
+                    "message": "Query executed successfully",
+                }
 
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Query failed: {str(e)}")
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"Query failed: {str(e)}")
 
-    finally:
-        await conn.close()
+
+@router.get("/database/pool-stats")
+async def get_database_pool_stats() -> dict[str, Any]:
+    """
+    Get usage statistics of the shared database connection pool.
+    Used to monitor in-use/idle connections, waiters and acquire latency.
+    """
+    return {"success": True, "pool": get_pool_stats()}
 
 
 @router.get("/database/schema/{project_id}")
@@ -1484,52 +1761,12 @@ async def get_sql_schema(
     """
     Get the database schema for tables related to a project.
     Used by AI to understand data structure.
-    """
-    conn = await get_db_connection()
-    try:
-        # Get all tables (you might want to filter to project-specific tables)
-        tables = await conn.fetch(
-            """
-            SELECT table_name 
-            FROM information_schema.tables 
-            WHERE table_schema = 'public'
-            ORDER BY table_name
-            """
-        )
-
-        schema = {}
-        for table in tables:
-            table_name = table["table_name"]
-            
-            # Get columns for this table
-            columns = await conn.fetch(
-                """
-                SELECT 
-                    column_name, 
-                    data_type, 
-                    is_nullable,
-                    column_default
-                FROM information_schema.columns
-                WHERE table_schema = 'public' AND table_name = $1
-                ORDER BY ordinal_position
-                """,
-                table_name,
-            )
-
-            schema[table_name] = [
-                {
-                    "name": col["column_name"],
-                    "type": col["data_type"],
-                    "nullable": col["is_nullable"] == "YES",
-                    "default": col["column_default"],
-                }
-                for col in columns
-            ]
-
-        return {"success": True, "schema": schema}
 
-    finally:
-        await conn.close()
+    Loaded with a single catalog query and cached until a migration or
+    DDL event invalidates it.
+    """
+    schema, cached = await get_cached_schema(project_id)
+    return {"success": True, "schema": schema, "cached": cached}
 
 
 # =============================================================================
@@ -1545,55 +1782,50 @@ async def run_python_script(
     Execute Python code in a sandboxed environment.
     Used by AI to test logic, experiment with APIs, etc.
     """
-    conn = await get_db_connection()
-    try:
-        # Capture stdout and stderr
-        old_stdout = sys.stdout
-        old_stderr = sys.stderr
-        redirected_output = StringIO()
-        redirected_error = StringIO()
-
-        try:
-            sys.stdout = redirected_output
-            sys.stderr = redirected_error
+    # Capture stdout and stderr
+    old_stdout = sys.stdout
+    old_stderr = sys.stderr
+    redirected_output = StringIO()
+    redirected_error = StringIO()
 
-            # Create a restricted globals dict
-            restricted_globals = {
-                "__builtins__": __builtins__,
-                "print": print,
-            }
+    try:
+        sys.stdout = redirected_output
+        sys.stderr = redirected_error
 
-            # Execute code
-            exec(request.code, restricted_globals)
+        # Create a restricted globals dict
+        restricted_globals = {
+            "__builtins__": __builtins__,
+            "print": print,
+        }
 
-            stdout_value = redirected_output.getvalue()
-            stderr_value = redirected_error.getvalue()
+        # Execute code
+        exec(request.code, restricted_globals)
 
-            return {
-                "success": True,
-                "stdout": stdout_value,
-                "stderr": stderr_value,
-                "error": None,
-            }
+        stdout_value = redirected_output.getvalue()
+        stderr_value = redirected_error.getvalue()
 
-        except Exception as e:
-            return {
-                "success": False,
-                "stdout": redirected_output.getvalue(),
-                "stderr": redirected_error.getvalue(),
-                "error": {
-                    "type": type(e).__name__,
-                    "message": str(e),
-                    "traceback": traceback.format_exc(),
-                },
-            }
+        return {
+            "success": True,
+            "stdout": stdout_value,
+            "stderr": stderr_value,
+            "error": None,
+        }
 
-        finally:
-            sys.stdout = old_stdout
-            sys.stderr = old_stderr
+    except Exception as e:
+        return {
+            "success": False,
+            "stdout": redirected_output.getvalue(),
+            "stderr": redirected_error.getvalue(),
+            "error": {
+                "type": type(e).__name__,
+                "message": str(e),
+                "traceback": traceback.format_exc(),
+            },
+        }
 
     finally:
-        await conn.close()
+        sys.stdout = old_stdout
+        sys.stderr = old_stderr
 
 
 @router.get("/development/logs/{project_id}")
@@ -1606,8 +1838,7 @@ async def read_logs(
     Read application logs for a project.
     Used by AI to debug issues.
     """
-    conn = await get_db_connection()
-    try:
+    async with db_connection() as conn:
         # Build query
         query = """
             SELECT id, level, message, metadata, created_at
@@ -1639,9 +1870,6 @@ async def read_logs(
             ],
         }
 
-    finally:
-        await conn.close()
-
 
 @router.post("/development/test-endpoint")
 async def test_endpoint(
@@ -1651,22 +1879,17 @@ async def test_endpoint(
     Test an API endpoint.
     Used by AI to verify endpoints are working correctly.
     """
-    conn = await get_db_connection()
-    try:
-        # This is a placeholder - in a real implementation, you'd:
-        # 1. Use httpx to make internal API calls
-        # 2. Or use TestClient from FastAPI
-        # 3. Return the response details
-
-        return {
-            "success": True,
-            "message": "Endpoint testing requires runtime environment",
-            "endpoint": request.endpoint_path,
-            "method": request.method,
-        }
+    # This is a placeholder - in a real implementation, you'd:
+    # 1. Use httpx to make internal API calls
+    # 2. Or use TestClient from FastAPI
+    # 3. Return the response details
 
-    finally:
-        await conn.close()
+    return {
+        "success": True,
+        "message": "Endpoint testing requires runtime environment",
+        "endpoint": request.endpoint_path,
+        "method": request.method,
+    }
 
 
 @router.post("/development/troubleshoot")
@@ -1677,46 +1900,41 @@ async def troubleshoot(
     Analyze an error and suggest solutions.
     Used by AI to debug issues.
     """
-    conn = await get_db_connection()
-    try:
-        # Basic error analysis
-        suggestions = []
-
-        error_lower = request.error_message.lower()
+    # Basic error analysis
+    suggestions = []
 
-        # Database errors
-        if "relation" in error_lower and "does not exist" in error_lower:
-            suggestions.append(
-                "Table doesn't exist. Run migration to create the table."
-            )
-        elif "duplicate key" in error_lower:
-            suggestions.append(
-                "Unique constraint violation. Check for duplicate data."
-            )
-        elif "null value" in error_lower and "violates not-null" in error_lower:
-            suggestions.append("Required field is missing. Check input data.")
-        
-        # Import errors
-        elif "modulenotfounderror" in error_lower or "no module named" in error_lower:
-            suggestions.append(
-                "Missing Python package. Install required dependencies."
-            )
-        
-        # Type errors
-        elif "typeerror" in error_lower:
-            suggestions.append(
-                "Type mismatch. Check function arguments and data types."
-            )
+    error_lower = request.error_message.lower()
 
-        return {
-            "success": True,
-            "error_type": request.error_type or "Unknown",
-            "suggestions": suggestions,
-            "context": request.context,
-        }
+    # Database errors
+    if "relation" in error_lower and "does not exist" in error_lower:
+        suggestions.append(
+            "Table doesn't exist. Run migration to create the table."
+        )
+    elif "duplicate key" in error_lower:
+        suggestions.append(
+            "Unique constraint violation. Check for duplicate data."
+        )
+    elif "null value" in error_lower and "violates not-null" in error_lower:
+        suggestions.append("Required field is missing. Check input data.")
+    
+    # Import errors
+    elif "modulenotfounderror" in error_lower or "no module named" in error_lower:
+        suggestions.append(
+            "Missing Python package. Install required dependencies."
+        )
+    
+    # Type errors
+    elif "typeerror" in error_lower:
+        suggestions.append(
+            "Type mismatch. Check function arguments and data types."
+        )
 
-    finally:
-        await conn.close()
+    return {
+        "success": True,
+        "error_type": request.error_type or "Unknown",
+        "suggestions": suggestions,
+        "context": request.context,
+    }
 
 
 # =============================================================================
@@ -1740,8 +1958,7 @@ async def enable_integration(
     Enable a third-party integration for a project.
     Used by AI to connect external services.
     """
-    conn = await get_db_connection()
-    try:
+    async with db_connection() as conn:
         # Check if integration already exists
         existing = await conn.fetchrow(
             """
@@ -1798,9 +2015,6 @@ async def enable_integration(
                 },
             )
 
-    finally:
-        await conn.close()
-
 
 @router.get("/integrations/list/{project_id}")
 async def list_integrations(
@@ -1810,8 +2024,7 @@ async def list_integrations(
     List all integrations for a project.
     Used by AI to see what services are connected.
     """
-    conn = await get_db_connection()
-    try:
+    async with db_connection() as conn:
         integrations = await conn.fetch(
             """
             SELECT id, integration_name, config, created_at, updated_at
@@ -1836,9 +2049,6 @@ async def list_integrations(
             ],
         }
 
-    finally:
-        await conn.close()
-
 
 # =============================================================================
 # DATA & VISUALIZATION TOOLS
@@ -1853,8 +2063,7 @@ async def visualize_data(
     Create a data visualization.
     Used by AI to display data insights to user.
     """
-    conn = await get_db_connection()
-    try:
+    async with db_connection() as conn:
         # Store visualization config
         viz_id = uuid4()
         await conn.execute(
@@ -1882,9 +2091,6 @@ async def visualize_data(
             "data_preview": request.data[:5] if len(request.data) > 5 else request.data,
         }
 
-    finally:
-        await conn.close()
-
 
 @router.post("/data/request")
 async def request_data(
@@ -1894,8 +2100,7 @@ async def request_data(
     Request data from user.
     Used by AI to ask user for files or information.
     """
-    conn = await get_db_connection()
-    try:
+    async with db_connection() as conn:
         # Store data request
         request_id = uuid4()
         await conn.execute(
@@ -1918,6 +2123,3 @@ async def request_data(
             message=f"Data request created: {request.message}",
             data={"request_id": str(request_id), "status": "pending"},
         )
-
-    finally:
-        await conn.close()
@@ -12,7 +12,7 @@ import os
 from uuid import UUID
 from datetime import datetime
 
-from app.libs.database import get_db_connection
+from app.libs.database import db_connection
 
 router = APIRouter()
 
@@ -52,8 +52,7 @@ async def get_context(project_id: str) -> ContextResponse:
     Get AI context for a project.
     Returns the agent's memory and awareness of project state.
     """
-    conn = await get_db_connection()
-    try:
+    async with db_connection() as conn:
         context = await conn.fetchrow(
             """
             SELECT 
@@ -82,9 +81,6 @@ async def get_context(project_id: str) -> ContextResponse:
             created_at=context["created_at"],
             updated_at=context["updated_at"],
         )
-        
-    finally:
-        await conn.close()
 
 
 @router.post("/context/update")
@@ -94,8 +90,7 @@ async def update_context(request: UpdateContextRequest) -> ContextResponse:
     If merge=True, merges with existing context.
     If merge=False, replaces entire context.
     """
-    conn = await get_db_connection()
-    try:
+    async with db_connection() as conn:
         # Check if context exists
         existing = await conn.fetchrow(
             "SELECT context_data FROM agent_context WHERE project_id = $1",
@@ -169,9 +164,6 @@ async def update_context(request: UpdateContextRequest) -> ContextResponse:
             created_at=result["created_at"],
             updated_at=result["updated_at"],
         )
-        
-    finally:
-        await conn.close()
 
 
 @router.post("/context/reset/{project_id}")
@@ -180,8 +172,7 @@ async def reset_context(project_id: str) -> dict[str, str]:
     Reset AI context for a project.
     Clears all stored memory and state.
     """
-    conn = await get_db_connection()
-    try:
+    async with db_connection() as conn:
         await conn.execute(
             "DELETE FROM agent_context WHERE project_id = $1",
             UUID(project_id),
@@ -191,6 +182,3 @@ async def reset_context(project_id: str) -> dict[str, str]:
             "success": True,
             "message": f"Context reset for project {project_id}",
         }
-        
-    finally:
-        await conn.close()
@@ -1,13 +1,11 @@
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 from typing import Optional, List
-import os
-import asyncpg
 from datetime import datetime
 
-router = APIRouter()
+from app.libs.database import db_connection
 
-DATABASE_URL = os.environ.get("DATABASE_URL")
+router = APIRouter()
 
 # ============================================================================
 # MODELS
@@ -62,8 +60,7 @@ async def get_errors(project_id: str, status: Optional[str] = None) -> ErrorsRes
         project_id: The project ID
         status: Filter by status ('open', 'resolved') - optional
     """
-    conn = await asyncpg.connect(DATABASE_URL)
-    try:
+    async with db_connection() as conn:
         if status:
             query = """
             SELECT id, project_id, error_type, message, stack_trace,
@@ -105,8 +102,6 @@ async def get_errors(project_id: str, status: Optional[str] = None) -> ErrorsRes
         ]
         
         return ErrorsResponse(errors=errors, total=len(errors))
-    finally:
-        await conn.close()
 
 @router.post("/errors/report")
 async def report_error(error: ErrorReport) -> dict:
@@ -116,8 +111,7 @@ async def report_error(error: ErrorReport) -> dict:
     Args:
         error: Error details
     """
-    conn = await asyncpg.connect(DATABASE_URL)
-    try:
+    async with db_connection() as conn:
         query = """
         INSERT INTO errors (
             project_id, error_type, message, stack_trace,
@@ -143,8 +137,6 @@ async def report_error(error: ErrorReport) -> dict:
             "error_id": str(error_id),
             "message": "Error reported successfully"
         }
-    finally:
-        await conn.close()
 
 @router.put("/errors/{error_id}/resolve")
 async def resolve_error(error_id: str, request: ResolveErrorRequest) -> dict:
@@ -155,8 +147,7 @@ async def resolve_error(error_id: str, request: ResolveErrorRequest) -> dict:
         error_id: The error ID
         request: Optional resolution notes
     """
-    conn = await asyncpg.connect(DATABASE_URL)
-    try:
+    async with db_connection() as conn:
         # Update context with resolution notes if provided
         if request.resolution_notes:
             query = """
@@ -185,8 +176,6 @@ async def resolve_error(error_id: str, request: ResolveErrorRequest) -> dict:
             "success": True,
             "message": "Error marked as resolved"
         }
-    finally:
-        await conn.close()
 
 @router.delete("/errors/{error_id}")
 async def delete_error(error_id: str) -> dict:
@@ -196,8 +185,7 @@ async def delete_error(error_id: str) -> dict:
     Args:
         error_id: The error ID
     """
-    conn = await asyncpg.connect(DATABASE_URL)
-    try:
+    async with db_connection() as conn:
         query = "DELETE FROM errors WHERE id = $1 RETURNING id"
         result = await conn.fetchval(query, error_id)
         
@@ -208,8 +196,6 @@ async def delete_error(error_id: str) -> dict:
             "success": True,
             "message": "Error deleted successfully"
         }
-    finally:
-        await conn.close()
 
 @router.post("/errors/test/{project_id}")
 async def test_error_detection(project_id: str):
@@ -217,8 +203,7 @@ async def test_error_detection(project_id: str):
     Test endpoint to verify error detection is working.
     Creates a test project with intentional errors.
     """
-    conn = await asyncpg.connect(DATABASE_URL)
-    try:
+    async with db_connection() as conn:
         # Create test files with errors
         test_files = [
             {
@@ -278,5 +263,3 @@ export const PromiseError = () => {
             "files_created": len(test_files),
             "next_step": f"POST /preview/build/{project_id}"
         }
-    finally:
-        await conn.close()
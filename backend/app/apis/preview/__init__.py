@@ -4,57 +4,60 @@ import json
 import os
 import subprocess
 import re
+import sys
 import asyncio
+import time
 import traceback
+from datetime import datetime, timezone
 from pathlib import Path
-from typing import Dict, Optional, Any
+from typing import Any, Dict, List, Optional, Set, Tuple
 
-from fastapi import APIRouter, HTTPException, BackgroundTasks
-from fastapi.responses import FileResponse, HTMLResponse, JSONResponse
+from fastapi import APIRouter, HTTPException, BackgroundTasks, Request
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse
 from pydantic import BaseModel
 
-router = APIRouter()
-
-DATABASE_URL = os.environ.get("DATABASE_URL")
+from app.libs.build_manager import BUILD_MAX_CONCURRENCY, Build, BuildError, BuildManager, run_command
+from app.libs.build_worker import BUILD_WORKERS, build_worker_pool
+from app.libs.database import db_connection
+from app.libs.node_modules_store import dependency_hash, node_modules_store
+from app.libs.preview_artifact_store import BUILD_CONFIG_VERSION, artifact_store, compute_build_key
+from app.libs.preview_assets import (
+    IMMUTABLE_CACHE_CONTROL,
+    ASSET_MANIFEST_NAME,
+    PREVIEW_HTML_NAME,
+    asset_cache,
+    cached_asset_manifest,
+    file_response,
+    html_response,
+    load_asset_manifest,
+)
+from app.libs.preview_registry import preview_registry, workspace_lock
+from app.libs.preview_scaffold import scaffold_version, seed_workspace
+from app.libs.preview_watch import PREVIEW_WATCH_AUTOSTART, ViteWatcher, preview_watchers
+from app.libs.typecheck import TYPECHECK_ENABLED, report_diagnostics, typecheck_servers
+from app.libs.venv_pool import BASE_DEPENDENCIES, venv_pool
+from app.libs.workspace_sync import (
+    load_manifest,
+    save_manifest,
+    sync_files,
+    write_if_changed,
+)
 
-# Build cache to store compiled apps
-BUILD_CACHE: Dict[str, Path] = {}
+router = APIRouter()
 
 # Workspace base directory (created on-demand)
 WORKSPACE_BASE = Path("/disk/backend/.preview-builds")
 
+VITE_BUILD_TIMEOUT = float(os.environ.get("VITE_BUILD_TIMEOUT", 300))
+# Vite watchers do not reload these, a change restarts the watcher
+WATCH_RESTART_FILES = {"package.json", "vite.config.ts", "tailwind.config.js", "postcss.config.js", "tsconfig.json"}
+
 async def _create_venv_background(backend_workspace: Path, project_id: str):
-    """Background task to create virtual environment with dependencies."""
+    """Background task to give the workspace a venv with the base dependencies."""
     try:
-        venv_path = backend_workspace / ".venv"
-        print(f"[{project_id}] Creating Python venv...")
-        
-        # Create venv
-        subprocess.run(
-            ["python", "-m", "venv", str(venv_path)],
-            check=True,
-            capture_output=True
-        )
-        print(f"[{project_id}] ✅ Venv created")
-        
-        # Install uv
-        pip_path = venv_path / "bin" / "pip"
-        subprocess.run(
-            [str(pip_path), "install", "uv"],
-            check=True,
-            capture_output=True
-        )
-        print(f"[{project_id}] ✅ uv installed")
-        
-        # Install base dependencies
-        subprocess.run(
-            ["uv", "pip", "install", "-r", "pyproject.toml"],
-            cwd=backend_workspace,
-            check=True,
-            capture_output=True
-        )
-        print(f"[{project_id}] ✅ Base dependencies installed")
-        
+        started = time.perf_counter()
+        outcome = await venv_pool.claim(backend_workspace / ".venv")
+        print(f"[{project_id}] ✅ Venv ready ({outcome}) in {time.perf_counter() - started:.1f}s")
     except Exception as e:
         print(f"[{project_id}] ❌ Venv creation failed: {e}")
         traceback.print_exc()
@@ -95,27 +98,14 @@ dependencies = []
 
 [dependency-groups]
 base = [
-  "databutton==0.39.0",
-  "uvicorn[standard]>=0.34.0",
-  "fastapi>=0.115.7",
-  "pydantic>=2.10.5",
-  "httpx>=0.28.1",
-  "python-multipart>=0.0.9",
-  "pyjwt>=2.10.1",
-  "cryptography>=44.0.0",
-  "asyncpg>=0.30.0",
-  "dotenv>=0.9.9",
-  "openai",
-  "beautifulsoup4",
-  "requests",
-  "anthropic",
-  "scrapy",
-  "psutil",
-  "toml",
+{base_dependencies}
 ]
 app = []  # User-installed packages go here
 """
-    (backend_workspace / "pyproject.toml").write_text(pyproject_content)
+    base_dependencies = "\n".join(f'  "{dep}",' for dep in BASE_DEPENDENCIES)
+    (backend_workspace / "pyproject.toml").write_text(
+        pyproject_content.replace("{base_dependencies}", base_dependencies)
+    )
     
     # Create FastAPI main.py template
     main_py_content = """from fastapi import FastAPI
@@ -179,12 +169,11 @@ async def parse_and_report_build_errors(project_id: str, build_output: str, buil
     """
     Parse Vite build errors and report them to the error API.
     
-    Handles two formats:
-    1. TypeScript: src/App.tsx:10:5 - error TS2304: Cannot find name 'foo'.
-    2. esbuild: /path/file.tsx:16:12: ERROR: Expected "}" but found ";"
+    Handles esbuild errors: /path/file.tsx:16:12: ERROR: Expected "}" but found ";"
+    Type errors come from the type checker as structured diagnostics, see
+    app.libs.typecheck.
     """
-    conn = await asyncpg.connect(DATABASE_URL)
-    try:
+    async with db_connection() as conn:
         errors_found = []
         
         # Pattern 1: esbuild format
@@ -206,22 +195,6 @@ async def parse_and_report_build_errors(project_id: str, build_output: str, buil
                 'error_code': 'ESBUILD'
             })
         
-        # Pattern 2: TypeScript compiler format
-        # src/App.tsx:10:5 - error TS2304: Cannot find name 'foo'.
-        ts_pattern = r'([^:]+\.tsx?):?(\d+)?:?(\d+)?\s*-\s*error\s*([^:]+):\s*(.+)'
-        for match in re.finditer(ts_pattern, build_output, re.MULTILINE):
-            file_path = match.group(1)
-            line_number = int(match.group(2)) if match.group(2) else None
-            error_code = match.group(4)
-            message = match.group(5).strip()
-            
-            errors_found.append({
-                'file_path': file_path,
-                'line_number': line_number,
-                'message': message,
-                'error_code': error_code
-            })
-        
         # Insert all found errors into database
         for error in errors_found:
             file_path = error['file_path']
@@ -267,8 +240,6 @@ async def parse_and_report_build_errors(project_id: str, build_output: str, buil
             
         if errors_found:
             build_logs.append(f"[TOTAL ERRORS] Found and reported {len(errors_found)} errors")
-    finally:
-        await conn.close()
 
 async def detect_python_imports(code: str) -> list[str]:
     """
@@ -332,6 +303,14 @@ async def detect_python_imports(code: str) -> list[str]:
 
 
 async def detect_npm_imports(code: str) -> list[str]:
+    """
+    Detect imported NPM packages from TypeScript/JavaScript code.
+    See _npm_imports, which preview builds call from a worker thread.
+    """
+    return _npm_imports(code)
+
+
+def _npm_imports(code: str) -> list[str]:
     """
     Detect imported NPM packages from TypeScript/JavaScript code.
     Returns list of third-party package names.
@@ -797,157 +776,323 @@ async def simple_preview(project_id: str):
         """
     )
 
-@router.post("/preview/build/{project_id}")
-async def build_preview(project_id: str) -> JSONResponse:
-    """
-    Build preview from AI-generated code in database.
-    """
-    build_logs = []
+def _workspace_path(file_path: str) -> Optional[str]:
+    """Map a generated file path to its path in the frontend workspace,
+    None for backend files."""
+    if file_path.startswith('backend/'):
+        return None
+    if file_path.startswith('frontend/'):
+        file_path = file_path[len('frontend/'):]
+    if file_path.startswith('backend/'):
+        return None
+    if not file_path.startswith('src/'):
+        file_path = f"src/{file_path}"
+    return file_path
+
+
+async def _build_with_vite(build: Build, workspace: Path):
+    """Cold production build with npm run build."""
+    project_id = build.project_id
+    print("Building with Vite...")
+    build.log("🔨 Building with Vite...")
+    build_result = await run_command(
+        build,
+        ["npm", "run", "build"],
+        cwd=workspace,
+        timeout=VITE_BUILD_TIMEOUT,
+    )
     
-    # Ensure workspace directory exists
-    WORKSPACE_BASE.mkdir(parents=True, exist_ok=True)
+    if build_result.stdout:
+        print(f"Vite build stdout: {build_result.stdout}")
+        build.log(f"Build output:\n{build_result.stdout}")
+    if build_result.stderr:
+        print(f"Vite build stderr: {build_result.stderr}")
+        build.log(f"Build errors:\n{build_result.stderr}")
+    
+    if build_result.returncode != 0:
+        error_detail = f"Vite build failed: {build_result.stderr}"
+        build.log(f"❌ {error_detail}")
+        
+        # Parse and report errors to database
+        span = build.start_span("error_parse")
+        await parse_and_report_build_errors(project_id, build_result.stderr, build.logs)
+        build.end_span(span)
+        
+        raise BuildError(error_detail)
     
+    build.log("✅ Build completed successfully")
+
+
+async def _build_with_watcher(build: Build, watcher: ViteWatcher, after_generation: int, files_written: bool) -> bool:
+    """Incremental build through a running Vite watcher.
+
+    Returns False when the watcher stopped and a cold build is needed.
+    """
+    project_id = build.project_id
+    watcher.touch()
+    build.log("⚡ Building incrementally with the Vite watcher...")
     try:
-        # Fetch all generated files for this project
-        conn = await asyncpg.connect(DATABASE_URL)
-        try:
-            # Fetch files from database
-            build_logs.append("[DB] Fetching generated files from database...")
-            query = """
-            SELECT file_path, file_content
-            FROM generated_files
-            WHERE project_id = $1 AND is_active = true
-            """
-            rows = await conn.fetch(query, project_id)
-            
-            if not rows:
-                return JSONResponse(
-                    status_code=404,
-                    content={"success": False, "error": "No files found for project", "logs": build_logs}
-                )
-            
-            build_logs.append(f"[DB] Found {len(rows)} files")
-            
-            # Normalize file paths: strip 'frontend/' prefix if present
-            files = {}
-            for row in rows:
-                file_path = row['file_path']
-                # Strip 'frontend/' prefix to get correct relative path
-                if file_path.startswith('frontend/'):
-                    normalized_path = file_path[len('frontend/'):]
-                else:
-                    normalized_path = file_path
-                
-                # Skip backend files
-                if normalized_path.startswith('backend/') or file_path.startswith('backend/'):
-                    continue
-                    
-                files[normalized_path] = row['file_content']
-                build_logs.append(f"[FILE] Mapped {file_path} -> {normalized_path}")
-            
-            if not files:
-                return JSONResponse(
-                    status_code=400,
-                    content={"success": False, "error": "No frontend files found", "logs": build_logs}
-                )
-        finally:
-            await conn.close()
+        if files_written:
+            state = await watcher.wait_for_build(after_generation, VITE_BUILD_TIMEOUT)
+        else:
+            state = await watcher.wait_until_idle(VITE_BUILD_TIMEOUT)
+    except asyncio.TimeoutError:
+        await preview_watchers.stop(project_id)
+        raise BuildError(f"Vite watcher did not finish within {VITE_BUILD_TIMEOUT:.0f}s")
+    
+    if state == "stopped":
+        build.log("⚠️ Vite watcher stopped, falling back to a full build")
+        return False
+    
+    if state == "error":
+        errors = "\n".join(watcher.errors)
+        build.log(f"❌ Vite build failed:\n{errors}")
+        span = build.start_span("error_parse")
+        await parse_and_report_build_errors(project_id, errors, build.logs)
+        build.end_span(span)
+        raise BuildError(f"Vite build failed: {errors}")
+    
+    build.log(f"✅ Build completed successfully ({watcher.last_build_ms or 0:.0f} ms)")
+    return True
 
-        # Use workspace directory instead of temp
-        workspace = WORKSPACE_BASE / project_id / "frontend"
-        workspace.mkdir(parents=True, exist_ok=True)
-        src_dir = workspace / "src"
-        src_dir.mkdir(exist_ok=True)
-        
-        build_logs.append(f"[SETUP] Created workspace at {workspace}")
+
+async def _finalize_dist(build: Build, dist_dir: Path) -> dict:
+    """finalize_dist() in a child process, with the build command limits."""
+    result = await run_command(
+        build,
+        [sys.executable, "-m", "app.libs.preview_assets", str(dist_dir)],
+        cwd=None,
+        timeout=VITE_BUILD_TIMEOUT,
+    )
+    if result.returncode != 0:
+        raise BuildError(f"Preparing the dist failed: {result.stderr[-2000:]}")
+    return json.loads((dist_dir / ASSET_MANIFEST_NAME).read_text())
+
+
+async def _typecheck(build: Build, workspace: Path, changed: list) -> Optional[dict]:
+    """Type check the changed files and sync the errors table.
+    
+    Never fails the build, problems are logged and None returned.
+    """
+    if not TYPECHECK_ENABLED:
+        return None
+    span = build.start_span("typecheck")
+    try:
+        result = await typecheck_servers.check(build.project_id, workspace, changed)
+        counts = await report_diagnostics(build.project_id, workspace, result)
+    except Exception as e:
+        build.log(f"⚠️ Type check failed: {e}")
+        build.end_span(span, failed=True)
+        return None
+    
+    for d in result.diagnostics:
+        build.log(f"[TYPECHECK] {d.file}:{d.line}:{d.column} TS{d.code}: {d.message}")
+    build.log(
+        f"[TYPECHECK] {len(result.affected)} files checked in {result.duration_ms}ms, "
+        f"{len(result.diagnostics)} errors"
+    )
+    build.end_span(span, files=len(result.affected), errors=len(result.diagnostics))
+    return {"files": len(result.affected), "errors": len(result.diagnostics), **counts}
+
+
+def _stub_missing_imports_and_detect_packages(workspace: Path) -> Tuple[List[str], List[str], Set[str]]:
+    """Create stubs for missing page/component imports and detect NPM packages.
+    
+    Reads every source file, so it runs in a worker thread. Returns the
+    workspace paths it wrote, log messages and the detected packages.
+    """
+    import re
+    
+    src_dir = workspace / "src"
+    written: List[str] = []
+    messages: List[str] = []
+    
+    def materialize(path: Path, content: str) -> bool:
+        if write_if_changed(path, content):
+            written.append(str(path.relative_to(workspace)))
+            return True
+        return False
+    
+    # Auto-fix missing imports: check if App.tsx imports missing pages
+    app_tsx_path = src_dir / "App.tsx"
+    if app_tsx_path.exists():
+        app_content = app_tsx_path.read_text()
+        # Find imports like: import HomePage from './pages/HomePage'
+        page_imports = re.findall(r"import\s+(\w+)\s+from\s+['\"]\./pages/(\w+)['\"]", app_content)
         
-        # Normalize file paths and organize by directory
-        normalized_files = {}
-        for file_path, content in files.items():
-            # Strip 'frontend/' prefix if present
-            clean_path = file_path
-            if clean_path.startswith('frontend/'):
-                clean_path = clean_path[len('frontend/'):]
-            
-            # Ensure files are under src/ directory
-            if not clean_path.startswith('src/'):
-                clean_path = f"src/{clean_path}"
-            
-            normalized_files[clean_path] = content
-            build_logs.append(f"[NORMALIZE] {file_path} → {clean_path}")
+        pages_dir = src_dir / "pages"
+        pages_dir.mkdir(exist_ok=True)
         
-        # Write all files to workspace
-        for file_path, content in normalized_files.items():
-            full_path = workspace / file_path
-            full_path.parent.mkdir(parents=True, exist_ok=True)
-            full_path.write_text(content, encoding='utf-8')
-            build_logs.append(f"[WRITE] {file_path}")
+        # Check which pages actually exist
+        existing_pages = {f.stem for f in pages_dir.glob("*.tsx")} if pages_dir.exists() else set()
         
-        # Auto-fix missing imports: check if App.tsx imports missing pages
-        app_tsx_path = src_dir / "App.tsx"
-        if app_tsx_path.exists():
-            app_content = app_tsx_path.read_text()
-            import re
-            # Find imports like: import HomePage from './pages/HomePage'
-            page_imports = re.findall(r"import\s+(\w+)\s+from\s+['\"]\./pages/(\w+)['\"]", app_content)
-            
-            pages_dir = src_dir / "pages"
-            pages_dir.mkdir(exist_ok=True)
-            
-            # Check which pages actually exist
-            existing_pages = {f.stem for f in pages_dir.glob("*.tsx")} if pages_dir.exists() else set()
-            
-            for component_name, file_name in page_imports:
-                if file_name not in existing_pages:
-                    # Find first existing page to use as fallback
-                    if existing_pages:
-                        fallback_page = list(existing_pages)[0]
-                        stub_content = f"""import React from 'react';
+        for component_name, file_name in page_imports:
+            if file_name not in existing_pages:
+                # Find first existing page to use as fallback
+                if existing_pages:
+                    fallback_page = list(existing_pages)[0]
+                    stub_content = f"""import React from 'react';
 import {fallback_page} from './{fallback_page}';
 
 // Auto-generated stub - redirects to {fallback_page}
 export default {fallback_page};
 """
-                        stub_path = pages_dir / f"{file_name}.tsx"
-                        stub_path.write_text(stub_content)
-                        build_logs.append(f"[AUTO-GEN] Created {file_name}.tsx → re-exports {fallback_page}.tsx")
+                    stub_path = pages_dir / f"{file_name}.tsx"
+                    if materialize(stub_path, stub_content):
+                        messages.append(f"[AUTO-GEN] Created {file_name}.tsx → re-exports {fallback_page}.tsx")
+    
+    # Auto-fix component imports: scan all files for missing component imports
+    components_dir = src_dir / "components"
+    if components_dir.exists():
+        # Get list of existing components
+        existing_components = {f.stem for f in components_dir.glob("*.tsx")}
         
-        # Auto-fix component imports: scan all files for missing component imports
-        components_dir = src_dir / "components"
-        if components_dir.exists():
-            # Get list of existing components
-            existing_components = {f.stem for f in components_dir.glob("*.tsx")}
+        # Scan all .tsx files for component imports
+        for tsx_file in src_dir.rglob("*.tsx"):
+            content = tsx_file.read_text()
+            # Find imports like: import { Button } from './components' or './components/Button'
+            comp_imports = re.findall(r"import\s+\{\s*([^}]+)\s*\}\s+from\s+['\"]\./components(?:/?(\w+))?['\"];", content)
             
-            # Scan all .tsx files for component imports
-            import re
-            for tsx_file in src_dir.rglob("*.tsx"):
-                content = tsx_file.read_text()
-                # Find imports like: import { Button } from './components' or './components/Button'
-                comp_imports = re.findall(r"import\s+\{\s*([^}]+)\s*\}\s+from\s+['\"]\./components(?:/?(\w+))?['\"];", content)
-                
-                for match in comp_imports:
-                    components = [c.strip() for c in match[0].split(',')]
-                    for comp_name in components:
-                        if comp_name not in existing_components:
-                            # Create stub component
-                            stub_content = f"""import React from 'react';
+            for match in comp_imports:
+                components = [c.strip() for c in match[0].split(',')]
+                for comp_name in components:
+                    if comp_name not in existing_components:
+                        # Create stub component
+                        stub_content = f"""import React from 'react';
 
 export function {comp_name}() {{
   return <div>{comp_name} (auto-generated stub)</div>;
 }}
 """
-                            stub_path = components_dir / f"{comp_name}.tsx"
-                            stub_path.write_text(stub_content)
-                            existing_components.add(comp_name)
-                            build_logs.append(f"[AUTO-GEN] Created {comp_name}.tsx stub")
-            
-            # Generate components/index.tsx to export all components
-            if existing_components:
-                exports = [f"export {{ {comp} }} from './{comp}';" for comp in sorted(existing_components)]
-                index_content = "\n".join(exports) + "\n"
-                index_path = components_dir / "index.tsx"
-                index_path.write_text(index_content)
-                build_logs.append(f"[AUTO-GEN] Created components/index.tsx with {len(existing_components)} exports")
+                        stub_path = components_dir / f"{comp_name}.tsx"
+                        materialize(stub_path, stub_content)
+                        existing_components.add(comp_name)
+                        messages.append(f"[AUTO-GEN] Created {comp_name}.tsx stub")
+        
+        # Generate components/index.tsx to export all components
+        if existing_components:
+            exports = [f"export {{ {comp} }} from './{comp}';" for comp in sorted(existing_components)]
+            index_content = "\n".join(exports) + "\n"
+            index_path = components_dir / "index.tsx"
+            if materialize(index_path, index_content):
+                messages.append(f"[AUTO-GEN] Created components/index.tsx with {len(existing_components)} exports")
+    
+    # Auto-detect NPM packages from all frontend files
+    detected_packages: Set[str] = set()
+    for pattern in ("*.tsx", "*.ts"):
+        for source_file in src_dir.rglob(pattern):
+            try:
+                detected_packages.update(_npm_imports(source_file.read_text()))
+            except Exception as e:
+                print(f"Warning: Failed to detect imports from {source_file}: {e}")
+    
+    return written, messages, detected_packages
+
+
+async def _run_preview_build(build: Build) -> dict:
+    """
+    Build preview from AI-generated code in database.
+    Runs inside the build manager, see build_preview.
+    """
+    project_id = build.project_id
+    # Keeps the janitor away from a workspace that is being built
+    preview_registry.touch(project_id)
+    
+    # Ensure workspace directory exists
+    WORKSPACE_BASE.mkdir(parents=True, exist_ok=True)
+    
+    try:
+        workspace = WORKSPACE_BASE / project_id / "frontend"
+        workspace.mkdir(parents=True, exist_ok=True)
+        src_dir = workspace / "src"
+        src_dir.mkdir(exist_ok=True)
+        
+        manifest = load_manifest(workspace)
+        
+        # Compare content hashes of all active files with the manifest and
+        # only fetch the content of files that differ. Unlike a timestamp
+        # cursor this cannot miss transactions that commit late
+        span = build.start_span("db_fetch", incremental=bool(manifest["files"]))
+        async with db_connection() as conn:
+            hashes = await conn.fetch(
+                """
+                SELECT file_path, encode(sha256(convert_to(file_content, 'UTF8')), 'hex') AS hash
+                FROM generated_files
+                WHERE project_id = $1 AND is_active = true
+                ORDER BY COALESCE(updated_at, created_at)
+                """,
+                project_id,
+            )
+            active_paths = {row['file_path'] for row in hashes}
+            latest_hashes = {row['file_path']: row['hash'] for row in hashes}
+            stale_paths = [
+                path for path, digest in latest_hashes.items()
+                if (workspace_path := _workspace_path(path))
+                and manifest["files"].get(workspace_path) != digest
+            ]
+            build.log(f"[DB] {len(stale_paths)} of {len(active_paths)} files changed, fetching them...")
+            rows = await conn.fetch(
+                """
+                SELECT file_path, file_content, is_active
+                FROM generated_files
+                WHERE project_id = $1 AND is_active = true AND file_path = ANY($2::text[])
+                ORDER BY COALESCE(updated_at, created_at)
+                """,
+                project_id,
+                stale_paths,
+            ) if stale_paths else []
+        
+        build.end_span(
+            span,
+            rows=len(rows),
+            bytes=sum(len(row['file_content'] or '') for row in rows),
+        )
+        
+        if not active_paths:
+            raise BuildError("No files found for project", status_code=404)
+        
+        active_workspace_paths = {
+            path for path in map(_workspace_path, active_paths) if path
+        }
+        if not active_workspace_paths:
+            raise BuildError("No frontend files found", status_code=400)
+        
+        span = build.start_span("materialize")
+        changed_files = {}
+        for row in rows:
+            if not row['is_active'] or row['file_path'] not in active_paths:
+                continue
+            path = _workspace_path(row['file_path'])
+            if path:
+                changed_files[path] = row['file_content']
+        
+        deleted_paths = set(manifest["files"]) - active_workspace_paths
+        watcher = preview_watchers.get(project_id)
+        watch_generation = watcher.generation if watcher is not None else 0
+        sync = sync_files(workspace, manifest, changed_files, deleted_paths)
+        build.log(
+            f"[SYNC] {len(active_workspace_paths)} files: {len(sync.written)} written, "
+            f"{len(sync.deleted)} deleted, {sync.unchanged} unchanged"
+        )
+        for path in sync.changed:
+            build.log(f"[SYNC] {'deleted' if path in sync.deleted else 'wrote'} {path}")
+        save_manifest(workspace, manifest)
+        written = list(sync.changed)
+        
+        def materialize(path: Path, content: str) -> bool:
+            """write_if_changed() that records what it wrote."""
+            if write_if_changed(path, content):
+                written.append(str(path.relative_to(workspace)))
+                return True
+            return False
+        
+        # Stub missing imports and scan sources for NPM packages off the loop
+        generated, messages, detected_packages = await asyncio.to_thread(
+            _stub_missing_imports_and_detect_packages, workspace
+        )
+        for message in messages:
+            build.log(message)
+        written.extend(generated)
         
         # Create minimal package.json for frontend
         package_json = {
@@ -976,335 +1121,466 @@ export function {comp_name}() {{
             }
         }
         
-        # Auto-detect NPM packages from all frontend files
-        detected_packages = set()
-        for tsx_file in src_dir.rglob("*.tsx"):
-            try:
-                content = tsx_file.read_text()
-                packages = await detect_npm_imports(content)
-                detected_packages.update(packages)
-            except Exception as e:
-                print(f"Warning: Failed to detect imports from {tsx_file}: {e}")
-        
-        for ts_file in src_dir.rglob("*.ts"):
-            try:
-                content = ts_file.read_text()
-                packages = await detect_npm_imports(content)
-                detected_packages.update(packages)
-            except Exception as e:
-                print(f"Warning: Failed to detect imports from {ts_file}: {e}")
-        
         # Add detected packages to dependencies
         if detected_packages:
-            build_logs.append(f"[AUTO-DETECT] Found NPM packages: {sorted(detected_packages)}")
+            build.log(f"[AUTO-DETECT] Found NPM packages: {sorted(detected_packages)}")
             print(f"[{project_id}] Detected NPM packages: {sorted(detected_packages)}")
             
             for package in detected_packages:
                 # Add with 'latest' version (npm will resolve to latest stable)
                 package_json["dependencies"][package] = "latest"
         
-        (workspace / "package.json").write_text(json.dumps(package_json, indent=2))
-        
-        # Create Tailwind config
-        tailwind_config = """/** @type {import('tailwindcss').Config} */
-export default {
-  content: [
-    "./index.html",
-    "./src/**/*.{js,ts,jsx,tsx}",
-  ],
-  theme: {
-    extend: {},
-  },
-  plugins: [],
-}
-"""
-        (workspace / "tailwind.config.js").write_text(tailwind_config)
-
-        # Create PostCSS config
-        postcss_config = """export default {
-  plugins: {
-    tailwindcss: {},
-    autoprefixer: {},
-  },
-}
-"""
-        (workspace / "postcss.config.js").write_text(postcss_config)
-
-        # Create index.css with Tailwind directives IF NOT EXISTS
-        index_css_path = src_dir / "index.css"
-        if not index_css_path.exists():
-            index_css = """@tailwind base;
-@tailwind components;
-@tailwind utilities;
-"""
-            index_css_path.write_text(index_css)
-            build_logs.append("[AUTO-GEN] Created src/index.css")
-        
-        # Create minimal index.html
-        index_html = f"""<!DOCTYPE html>
-<html lang="en">
-  <head>
-    <meta charset="UTF-8" />
-    <meta name="viewport" content="width=device-width, initial-scale=1.0" />
-    <title>Preview App</title>
-    <script>
-      // Global error handler for runtime errors
-      window.addEventListener('error', function(event) {{
-        const errorData = {{
-          project_id: '{project_id}',
-          error_type: 'runtime',
-          message: event.message || 'Unknown error',
-          stack_trace: event.error?.stack || '',
-          file_path: event.filename || '',
-          line_number: event.lineno || null,
-          column_number: event.colno || null,
-        }};
-        
-        // Report to error API
-        fetch('/routes/errors/report', {{
-          method: 'POST',
-          headers: {{ 'Content-Type': 'application/json' }},
-          body: JSON.stringify(errorData),
-        }}).catch(console.error);
-      }});
-      
-      // Promise rejection handler
-      window.addEventListener('unhandledrejection', function(event) {{
-        const errorData = {{
-          project_id: '{project_id}',
-          error_type: 'runtime',
-          message: 'Unhandled Promise Rejection: ' + (event.reason?.message || event.reason),
-          stack_trace: event.reason?.stack || '',
-          file_path: '',
-          line_number: null,
-        }};
+        materialize(workspace / "package.json", json.dumps(package_json, indent=2))
         
-        fetch('/routes/errors/report', {{
-          method: 'POST',
-          headers: {{ 'Content-Type': 'application/json' }},
-          body: JSON.stringify(errorData),
-        }}).catch(console.error);
-      }});
-    </script>
-  </head>
-  <body>
-    <div id="root"></div>
-    <script type="module" src="/src/main.tsx"></script>
-  </body>
-</html>
-"""
-        (workspace / "index.html").write_text(index_html)
-        
-        # Create minimal main.tsx if not exists
-        main_tsx_path = src_dir / "main.tsx"
-        if not main_tsx_path.exists():
-            main_tsx = """import React from 'react'
-import ReactDOM from 'react-dom/client'
-import './index.css'
-import App from './App'
-
-ReactDOM.createRoot(document.getElementById('root')!).render(
-  <React.StrictMode>
-    <App />
-  </React.StrictMode>,
-)
-"""
-            main_tsx_path.write_text(main_tsx)
-            build_logs.append("[AUTO-GEN] Created src/main.tsx")
-        
-        # Create app framework stub (Riff framework mock)
-        app_stub_path = src_dir / "app.ts"
-        if not app_stub_path.exists():
-            app_stub = """// Stub for Riff 'app' framework module
-export const API_URL = 'http://localhost:8000';
-export const WS_API_URL = 'ws://localhost:8000';
-export const APP_BASE_PATH = '/';
-
-// Mock apiClient
-export const apiClient = {
-  get: async (url: string) => ({ data: { message: 'Mock API Response' } }),
-  post: async (url: string, data?: any) => ({ data: { message: 'Mock API Response' } }),
-  put: async (url: string, data?: any) => ({ data: { message: 'Mock API Response' } }),
-  delete: async (url: string) => ({ data: { message: 'Mock API Response' } }),
-};
-
-export enum Mode {
-  DEV = 'dev',
-  PROD = 'prod'
-}
-export const mode = Mode.DEV;
-"""                
-            app_stub_path.write_text(app_stub)
-        
-        # Create shadcn UI component stubs
-        ui_dir = src_dir / "components" / "ui"
-        ui_dir.mkdir(parents=True, exist_ok=True)
-        
-        # Button stub
-        if not (ui_dir / "button.tsx").exists():
-            (ui_dir / "button.tsx").write_text("""import React from 'react';
-export const Button = ({ children, onClick, className = '' }: any) => (
-  <button onClick={onClick} className={`px-4 py-2 bg-blue-500 text-white rounded hover:bg-blue-600 ${className}`}>
-    {children}
-  </button>
-);
-""")
-        
-        # Spinner stub
-        if not (ui_dir / "spinner.tsx").exists():
-            (ui_dir / "spinner.tsx").write_text("""import React from 'react';
-export const Spinner = ({ size = 'medium' }: any) => (
-  <div className="animate-spin rounded-full border-4 border-gray-300 border-t-blue-500" 
-       style={{ width: size === 'large' ? '48px' : '24px', height: size === 'large' ? '48px' : '24px' }} />
-);
-""")
-        
-        # Alert stub
-        if not (ui_dir / "alert.tsx").exists():
-            (ui_dir / "alert.tsx").write_text("""import React from 'react';
-export const Alert = ({ type = 'info', message }: any) => (
-  <div className={`p-4 rounded ${type === 'error' ? 'bg-red-100 text-red-700' : 'bg-blue-100 text-blue-700'}`}>
-    {message}
-  </div>
-);
-""")
-        
-        # Index file to export all UI components
-        if not (ui_dir / "index.tsx").exists():
-            (ui_dir / "index.tsx").write_text("""export { Button } from './button';
-export { Spinner } from './spinner';
-export { Alert } from './alert';
-""")
-        
-        # Write vite.config.ts
-        vite_config = f"""import {{ defineConfig }} from 'vite'
-import react from '@vitejs/plugin-react-swc'
-import path from 'path'
-
-export default defineConfig({{
-  plugins: [react()],
-  base: './',  // Use relative paths to avoid Riff routing conflicts
-  resolve: {{
-    alias: {{
-      '@': path.resolve(__dirname, './src'),
-      'app': path.resolve(__dirname, './src/app.ts'),
-    }},
-  }},
-  define: {{
-    '__API_URL__': JSON.stringify('http://localhost:8000'),
-    '__APP_BASE_PATH__': JSON.stringify('/'),
-  }},
-  build: {{
-    outDir: 'dist',
-    emptyOutDir: true,
-  }},
-}})
-"""
-        (workspace / "vite.config.ts").write_text(vite_config)
+        # Config, index.html and fallback stubs come from the on-disk template
+        seeded = await asyncio.to_thread(seed_workspace, workspace)
+        if seeded:
+            build.log(f"[SCAFFOLD] Seeded {len(seeded)} files from template {scaffold_version()}")
+        written.extend(seeded)
         
-        # Create tsconfig.json
-        tsconfig = {
-            "compilerOptions": {
-                "target": "ES2020",
-                "useDefineForClassFields": True,
-                "lib": ["ES2020", "DOM", "DOM.Iterable"],
-                "module": "ESNext",
-                "skipLibCheck": True,
-                "moduleResolution": "bundler",
-                "allowImportingTsExtensions": True,
-                "resolveJsonModule": True,
-                "isolatedModules": True,
-                "noEmit": True,
-                "jsx": "react-jsx",
-                "strict": True,
-                "noUnusedLocals": True,
-                "noUnusedParameters": True,
-                "noFallthroughCasesInSwitch": True
-            },
-            "include": ["src"]
-        }
-        (workspace / "tsconfig.json").write_text(json.dumps(tsconfig, indent=2))
-        
-        # Install dependencies
-        build_logs.append("Installing dependencies...")
-        install_result = subprocess.run(
-            ["npm", "install", "--legacy-peer-deps", "--no-audit", "--no-fund"],
-            cwd=workspace,
-            capture_output=True,
-            text=True,
-            timeout=120
+        build.end_span(
+            span,
+            files=len(active_workspace_paths),
+            files_written=len(written),
+            files_deleted=len(sync.deleted),
+            files_unchanged=sync.unchanged,
+            bytes_written=sync.bytes_written,
         )
-        if install_result.returncode != 0:
-            error_detail = f"npm install failed:\n{install_result.stderr}"
-            build_logs.append(f"❌ {error_detail}")
-            raise Exception(error_detail)
-        build_logs.append("✅ Dependencies installed")
-        print("Dependencies installed successfully")
         
-        # Build with Vite
-        print("Building with Vite...")
-        build_logs.append("🔨 Building with Vite...")
-        build_result = subprocess.run(
-            ["npm", "run", "build"],
-            cwd=workspace,
-            capture_output=True,
-            text=True,
+        # Identical sources were built before (no-op edit, template fork), reuse that dist
+        span = build.start_span("build_key")
+        build_key = await asyncio.to_thread(
+            compute_build_key,
+            workspace,
+            node_modules_store.resolution(package_json) or dependency_hash(package_json),
         )
+        dist_dir = artifact_store.lookup(build_key)
+        build.end_span(span, artifact_cache="hit" if dist_dir is not None else "miss")
+        if dist_dir is not None:
+            build.log(f"♻️ Reusing build artifact {build_key[:12]}, skipping install and build")
+            deps_outcome = "skipped"
+            build_mode = "reused"
+            typecheck_outcome = None
+        else:
+            build.log(f"[ARTIFACTS] No artifact for {build_key[:12]}, building")
+            # Install dependencies, skipped when the dependency set is unchanged
+            build.log("Installing dependencies...")
+            span = build.start_span("npm_install")
+            try:
+                deps_outcome = await node_modules_store.ensure(build, workspace, package_json)
+            except BuildError as e:
+                build.log(f"❌ {e}")
+                raise
+            build.end_span(span, outcome=deps_outcome)
+            build.log(f"✅ Dependencies ready ({deps_outcome})")
         
-        if build_result.stdout:
-            print(f"Vite build stdout: {build_result.stdout}")
-            build_logs.append(f"Build output:\n{build_result.stdout}")
-        if build_result.stderr:
-            print(f"Vite build stderr: {build_result.stderr}")
-            build_logs.append(f"Build errors:\n{build_result.stderr}")
+            if watcher is not None and (
+                deps_outcome != "skipped" or WATCH_RESTART_FILES.intersection(written)
+            ):
+                # node_modules or build configuration changed under the watcher
+                build.log("[WATCH] Build configuration changed, restarting Vite watcher")
+                await preview_watchers.stop(project_id)
+                watcher = None
         
-        if build_result.returncode != 0:
-            error_detail = f"Vite build failed: {build_result.stderr}"
-            build_logs.append(f"❌ {error_detail}")
+            # Vite does not type check, run the checker alongside the build
+            typecheck = asyncio.create_task(_typecheck(build, workspace, written))
             
-            # Parse and report errors to database
-            await parse_and_report_build_errors(project_id, build_result.stderr, build_logs)
+            span = build.start_span("vite_build")
+            try:
+                if watcher is not None and await _build_with_watcher(build, watcher, watch_generation, bool(written)):
+                    build_mode = "watch"
+                else:
+                    await _build_with_vite(build, workspace)
+                    build_mode = "cold"
+                    if PREVIEW_WATCH_AUTOSTART:
+                        # Keep a watcher running so the next edit rebuilds incrementally
+                        try:
+                            await preview_watchers.start(project_id, workspace)
+                        except Exception as e:
+                            build.log(f"⚠️ Could not start Vite watcher: {e}")
+            except BuildError:
+                # Type errors usually explain a failed build, report them too
+                await typecheck
+                raise
+            except BaseException:
+                typecheck.cancel()
+                raise
+            build.end_span(span, mode=build_mode)
+            typecheck_outcome = await typecheck
             
-            raise Exception(error_detail)
-        
-        build_logs.append("✅ Build completed successfully")
-        
-        # Store the build output path (in production, this would go to DB or cache)
-        # For now, we'll keep it in memory/temp and serve from there
-        dist_dir = workspace / "dist"
+            # Rewrite index.html, precompress and fingerprint assets once, not per request
+            span = build.start_span("finalize")
+            asset_manifest = await _finalize_dist(build, workspace / "dist")
+            build.end_span(span, assets=len(asset_manifest["files"]))
+            
+            span = build.start_span("store_artifact")
+            dist_dir = await asyncio.to_thread(artifact_store.store, build_key, workspace / "dist")
+            build.end_span(span)
         
-        # After successful build, store in cache
-        BUILD_CACHE[project_id] = dist_dir
+        # Register the build so every replica serves it, also after restarts
+        span = build.start_span("register")
+        artifact = await preview_registry.record(
+            project_id, build.build_id, dist_dir, workspace, content_hash=build_key
+        )
+        if build_mode != "reused":
+            in_use = await preview_registry.referenced_dists()
+            await asyncio.to_thread(artifact_store.evict, in_use)
+        build.end_span(span, dist_bytes=artifact.size_bytes)
         
         return {
             "success": True,
             "message": "Preview built successfully",
-            "temp_dir": workspace,
+            "temp_dir": str(workspace),
             "dist_dir": str(dist_dir),
-            "files_processed": len(rows)
+            "files_processed": len(active_workspace_paths),
+            "files_written": len(sync.written),
+            "files_deleted": len(sync.deleted),
+            "dependencies": deps_outcome,
+            "build_mode": build_mode,
+            "build_key": build_key,
+            "artifact_cache": "hit" if build_mode == "reused" else "miss",
+            "content_hash": artifact.content_hash,
+            "typecheck": typecheck_outcome,
         }
         
     except asyncpg.PostgresError as e:
         print(f"Database error: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
-    except subprocess.TimeoutExpired:
-        raise HTTPException(status_code=500, detail="Build timeout (120s limit exceeded)")
-    except Exception as e:
+        raise BuildError(f"Database error: {str(e)}")
+    except BuildError as e:
         print(f"Build error: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Build error: {str(e)}")
+        raise
+
+
+async def _record_build(build: Build):
+    """Emit build metrics and store the build with its phase spans."""
+    info = build.to_dict()
+    result = build.result or {}
+    phases = {span["name"]: span["duration_ms"] for span in build.spans}
+    metric = {
+        "metric": "preview_build",
+        "build_id": build.build_id,
+        "project_id": build.project_id,
+        "status": build.status,
+        "build_mode": result.get("build_mode"),
+        "artifact_cache": result.get("artifact_cache"),
+        "build_config_version": BUILD_CONFIG_VERSION,
+        "queue_ms": info["queue_ms"],
+        "duration_ms": info["duration_ms"],
+        "phases": phases,
+    }
+    print(f"[METRIC] {json.dumps(metric)}")
+    
+    def timestamp(value):
+        return datetime.fromtimestamp(value, timezone.utc) if value else None
+    
+    async with db_connection() as conn:
+        await conn.execute(
+            """
+            INSERT INTO preview_builds (
+                build_id, project_id, status, build_mode, artifact_cache,
+                build_config_version, queue_ms, duration_ms, spans, error,
+                created_at, started_at, finished_at
+            )
+            VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9::jsonb, $10, $11, $12, $13)
+            ON CONFLICT (build_id) DO NOTHING
+            """,
+            build.build_id,
+            build.project_id,
+            build.status,
+            metric["build_mode"],
+            metric["artifact_cache"],
+            BUILD_CONFIG_VERSION,
+            info["queue_ms"],
+            info["duration_ms"],
+            json.dumps(build.spans),
+            build.error,
+            timestamp(build.created_at),
+            timestamp(build.started_at),
+            timestamp(build.finished_at),
+        )
+
+
+# Bounds builds that run in this process, workers bound their own
+_local_build_slots: Optional[asyncio.Semaphore] = None
+
+
+async def _run_build(build: Build) -> dict:
+    """Run the build on a build worker if the pool is up, in process otherwise.
+    
+    Projects with a Vite watcher stay in process, the watcher lives here.
+    Workers do not start watchers, a cold build on a worker starts one here.
+    """
+    global _local_build_slots
+    if build_worker_pool.enabled and preview_watchers.get(build.project_id) is None:
+        result = await build_worker_pool.dispatch(build)
+        # The worker registered the new dist, drop our cached entry
+        preview_registry.invalidate(build.project_id)
+        if PREVIEW_WATCH_AUTOSTART and result.get("build_mode") == "cold":
+            try:
+                await preview_watchers.start(build.project_id, Path(result["temp_dir"]))
+            except Exception as e:
+                build.log(f"⚠️ Could not start Vite watcher: {e}")
+        return result
+    
+    if _local_build_slots is None:
+        _local_build_slots = asyncio.Semaphore(BUILD_MAX_CONCURRENCY)
+    async with _local_build_slots:
+        # Keeps build workers and other replicas off the workspace
+        async with workspace_lock(build.project_id):
+            return await _run_preview_build(build)
+
+
+preview_builds = BuildManager(
+    _run_build,
+    max_concurrency=max(BUILD_MAX_CONCURRENCY, BUILD_WORKERS),
+    on_finish=_record_build,
+)
+
+
+def _preview_busy(project_id: str) -> bool:
+    """A build or watcher is using the project's workspace."""
+    latest = preview_builds.latest(project_id)
+    return (latest is not None and not latest.done) or preview_watchers.get(project_id) is not None
+
+
+preview_registry.set_busy_check(_preview_busy)
+
+
+@router.post("/preview/build/{project_id}")
+async def build_preview(project_id: str, wait: bool = False) -> JSONResponse:
+    """
+    Queue a preview build and return its build ID immediately.
+    Concurrent requests for the same project share one build.
+    
+    With wait=true the request waits for the build and returns its result.
+    Progress: GET /preview/build/{build_id} and /preview/build/{build_id}/events
+    """
+    build, coalesced = preview_builds.request(project_id)
+    
+    if not wait:
+        return JSONResponse(
+            status_code=202,
+            content={
+                "success": True,
+                "build_id": build.build_id,
+                "status": build.status,
+                "coalesced": coalesced,
+            },
+        )
+    
+    await build.wait()
+    if build.status == "failed":
+        return JSONResponse(
+            status_code=build.status_code or 500,
+            content={
+                "success": False,
+                "build_id": build.build_id,
+                "error": build.error,
+                "logs": build.logs,
+            },
+        )
+    return JSONResponse(content={**build.result, "build_id": build.build_id, "logs": build.logs})
+
+
+@router.get("/preview/builds/{project_id}")
+async def get_build_history(project_id: str, limit: int = 50) -> JSONResponse:
+    """
+    Recent builds of a project with their phase timings, plus p50/p90/p99
+    of the total and per-phase durations over those builds.
+    """
+    limit = max(1, min(limit, 500))
+    async with db_connection() as conn:
+        rows = await conn.fetch(
+            """
+            SELECT build_id, status, build_mode, artifact_cache, build_config_version,
+                   queue_ms, duration_ms, spans, error, created_at, finished_at
+            FROM preview_builds
+            WHERE project_id = $1
+            ORDER BY created_at DESC
+            LIMIT $2
+            """,
+            project_id,
+            limit,
+        )
+        totals = await conn.fetchrow(
+            """
+            WITH recent AS (
+                SELECT * FROM preview_builds
+                WHERE project_id = $1
+                ORDER BY created_at DESC
+                LIMIT $2
+            )
+            SELECT COUNT(*) AS builds,
+                   COUNT(*) FILTER (WHERE status = 'succeeded') AS succeeded,
+                   COUNT(*) FILTER (WHERE artifact_cache = 'hit') AS artifact_hits,
+                   percentile_cont(ARRAY[0.5, 0.9, 0.99]) WITHIN GROUP (ORDER BY duration_ms)
+                       FILTER (WHERE status = 'succeeded') AS duration
+            FROM recent
+            """,
+            project_id,
+            limit,
+        )
+        phases = await conn.fetch(
+            """
+            WITH recent AS (
+                SELECT spans FROM preview_builds
+                WHERE project_id = $1
+                ORDER BY created_at DESC
+                LIMIT $2
+            )
+            SELECT span->>'name' AS phase,
+                   COUNT(*) AS count,
+                   percentile_cont(ARRAY[0.5, 0.9, 0.99])
+                       WITHIN GROUP (ORDER BY (span->>'duration_ms')::float) AS duration
+            FROM recent, jsonb_array_elements(recent.spans) AS span
+            WHERE span->>'duration_ms' IS NOT NULL
+            GROUP BY span->>'name'
+            """,
+            project_id,
+            limit,
+        )
+    
+    def percentiles(values):
+        if not values:
+            return None
+        return {name: round(value, 1) for name, value in zip(("p50", "p90", "p99"), values)}
+    
+    return JSONResponse(content={
+        "project_id": project_id,
+        "builds": [
+            {
+                "build_id": row["build_id"],
+                "status": row["status"],
+                "build_mode": row["build_mode"],
+                "artifact_cache": row["artifact_cache"],
+                "build_config_version": row["build_config_version"],
+                "queue_ms": row["queue_ms"],
+                "duration_ms": row["duration_ms"],
+                "spans": json.loads(row["spans"]),
+                "error": row["error"],
+                "created_at": row["created_at"].isoformat(),
+                "finished_at": row["finished_at"].isoformat() if row["finished_at"] else None,
+            }
+            for row in rows
+        ],
+        "summary": {
+            "builds": totals["builds"],
+            "succeeded": totals["succeeded"],
+            "artifact_hit_rate": round(totals["artifact_hits"] / totals["builds"], 3)
+            if totals["builds"]
+            else None,
+            "duration_ms": percentiles(totals["duration"]),
+            "phases": {
+                row["phase"]: {"count": row["count"], **(percentiles(row["duration"]) or {})}
+                for row in phases
+            },
+        },
+    })
+
+
+@router.get("/preview/build/{build_id}")
+async def get_build_status(build_id: str) -> JSONResponse:
+    """
+    Get status, log and result of a preview build.
+    """
+    build = preview_builds.get(build_id)
+    if build is None:
+        raise HTTPException(status_code=404, detail="Build not found")
+    return JSONResponse(content=build.to_dict())
+
+
+@router.get("/preview/build/{build_id}/events")
+async def stream_build_events(
+    build_id: str,
+    request: Request,
+    after: int = 0,
+    types: Optional[str] = None,
+) -> StreamingResponse:
+    """
+    Server-sent events with status changes, log lines, phase spans and the
+    stdout/stderr of npm and Vite, line by line as they are produced. The
+    stream ends when the build is done.
+    
+    Buffered events are replayed first, so late subscribers see the output
+    so far. Reconnecting clients resume after Last-Event-ID (or after=seq).
+    types filters events, e.g. types=output,done to only tail command output.
+    """
+    build = preview_builds.get(build_id)
+    if build is None:
+        raise HTTPException(status_code=404, detail="Build not found")
+    
+    last_event_id = request.headers.get("last-event-id")
+    if last_event_id and last_event_id.isdigit():
+        after = max(after, int(last_event_id))
+    wanted = {t.strip() for t in types.split(",")} if types else None
+    
+    async def events():
+        queue = build.subscribe(after=after)
+        try:
+            if after == 0:
+                yield f"data: {json.dumps({'type': 'status', 'build_id': build.build_id, 'status': build.status})}\n\n"
+            while not build.done or not queue.empty():
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    # Keep proxies from closing an idle stream
+                    yield ": keep-alive\n\n"
+                    continue
+                if wanted is None or event["type"] in wanted or event["type"] == "done":
+                    yield f"id: {event['seq']}\ndata: {json.dumps(event)}\n\n"
+                if event["type"] == "done":
+                    break
+        finally:
+            build.unsubscribe(queue)
+    
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@router.get("/preview/stats")
+async def get_preview_stats() -> JSONResponse:
+    """
+    Build queue, build workers, shared node_modules store and preview disk
+    usage statistics.
+    """
+    return JSONResponse(content={
+        "builds": preview_builds.stats(),
+        "workers": build_worker_pool.stats(),
+        "typecheck": typecheck_servers.stats(),
+        "venv_pool": venv_pool.stats(),
+        "node_modules_store": node_modules_store.stats(),
+        "artifacts": await preview_registry.stats(),
+        "asset_cache": asset_cache.stats(),
+        "artifact_store": artifact_store.stats(),
+    })
+
+
+
+async def _asset_manifest(artifact) -> dict:
+    manifest = cached_asset_manifest(artifact.dist_path, artifact.content_hash)
+    if manifest is None:
+        manifest = await asyncio.to_thread(
+            load_asset_manifest, artifact.dist_path, artifact.content_hash
+        )
+    return manifest
 
 
 @router.get("/preview/{project_id}")
-async def serve_preview(project_id: str):
+async def serve_preview(project_id: str, request: Request):
     """
-    Serve the built preview HTML from cache.
+    Serve the built preview HTML.
+    
+    The asset URLs were rewritten at build time, only the project ID is
+    substituted here. Revalidated with the ETag on every load.
     """
-    print(f"[SERVE] Preview request for project_id: {project_id}")
-    print(f"[SERVE] BUILD_CACHE keys: {list(BUILD_CACHE.keys())}")
+    artifact = await preview_registry.get(project_id)
     
-    # Check if build exists in cache
-    if project_id not in BUILD_CACHE:
-        print(f"[SERVE ERROR] Project not in cache, showing build required page")
+    # Viewing the preview keeps the project's Vite watcher alive
+    watcher = preview_watchers.get(project_id)
+    if watcher is not None:
+        watcher.touch()
+    
+    # Check if the project has been built
+    if artifact is None:
         return HTMLResponse(
             content="""
             <!DOCTYPE html>
@@ -1347,111 +1623,49 @@ async def serve_preview(project_id: str):
             """
         )
     
-    # Serve the built index.html
-    dist_dir = Path(BUILD_CACHE[project_id])
-    print(f"[SERVE] dist_dir from cache: {dist_dir}")
-    
-    index_html = dist_dir / "index.html"
-    print(f"[SERVE] index.html path: {index_html}")
-    print(f"[SERVE] index.html exists: {index_html.exists()}")
-    
-    if not index_html.exists():
+    preview_registry.touch(project_id)
+    manifest = await _asset_manifest(artifact)
+    entry = manifest["files"].get(PREVIEW_HTML_NAME)
+    if entry is None:
         raise HTTPException(
             status_code=500, detail="Built index.html not found"
         )
     
-    html_content = index_html.read_text()
-    
-    # Rewrite asset paths to be relative to current directory
-    # This ensures they work correctly with Riff's routing proxy
-    import re
-    
-    # Replace paths that start with ./ or without ./ to use project_id
-    # Change ./assets/file.js -> 96c089f1-14bb-4a5d-b18f-1a1e1066453a/assets/file.js
-    
-    # Fix script src paths
-    html_content = re.sub(
-        r'src="\./assets/([^"]+)"',
-        f'src="{project_id}/assets/\\1"',
-        html_content
-    )
-    html_content = re.sub(
-        r'src="assets/([^"]+)"',
-        f'src="{project_id}/assets/\\1"',
-        html_content
+    # Relative to /preview/{project_id}, so assets resolve to /preview/{project_id}/assets/...
+    return html_response(
+        artifact.dist_path,
+        entry,
+        project_id,
+        base=project_id,
+        if_none_match=request.headers.get("if-none-match"),
     )
-    
-    # Fix link href paths
-    html_content = re.sub(
-        r'href="\./assets/([^"]+)"',
-        f'href="{project_id}/assets/\\1"',
-        html_content
-    )
-    html_content = re.sub(
-        r'href="assets/([^"]+)"',
-        f'href="{project_id}/assets/\\1"',
-        html_content
-    )
-    
-    # DEBUG: Log the actual HTML content (first 1000 chars)
-    print(f"[SERVE] HTML preview (first 1000 chars):")
-    print(html_content[:1000])
-    print(f"[SERVE] Full HTML length: {len(html_content)} chars")
-    
-    # Check for asset references
-    if '<script' in html_content:
-        print(f"[SERVE] Found <script> tags in HTML")
-        import re
-        scripts = re.findall(r'<script[^>]*src=["\']([^"\'>]+)["\']', html_content)
-        print(f"[SERVE] Script sources: {scripts}")
-    
-    if '<link' in html_content:
-        print(f"[SERVE] Found <link> tags in HTML")
-        import re
-        links = re.findall(r'<link[^>]*href=["\']([^"\'>]+)["\']', html_content)
-        print(f"[SERVE] Link hrefs: {links}")
-    
-    return HTMLResponse(content=html_content)
 
 
 @router.get("/preview/{project_id}/assets/{filepath:path}")
-async def serve_preview_assets(project_id: str, filepath: str):
+async def serve_preview_assets(project_id: str, filepath: str, request: Request):
     """
     Serve static assets (CSS, JS) for preview builds.
-    """
-    print(f"[ASSET REQUEST] project_id={project_id}, filepath={filepath}")
-    print(f"[BUILD_CACHE] Keys in cache: {list(BUILD_CACHE.keys())}")
     
-    if project_id not in BUILD_CACHE:
-        print(f"[ASSET ERROR] Project {project_id} not found in BUILD_CACHE")
+    Vite puts a content hash in asset file names, so they are immutable.
+    Precompressed variants are chosen by Accept-Encoding.
+    """
+    artifact = await preview_registry.get(project_id)
+    if artifact is None:
         raise HTTPException(status_code=404, detail="Preview not built")
     
-    dist_dir = Path(BUILD_CACHE[project_id])
-    print(f"[ASSET] dist_dir from cache: {dist_dir}")
-    
-    asset_path = dist_dir / "assets" / filepath
-    print(f"[ASSET] Resolved asset_path: {asset_path}")
-    print(f"[ASSET] File exists: {asset_path.exists()}")
-    
-    if not asset_path.exists() or not asset_path.is_file():
-        print(f"[ASSET ERROR] Asset not found: {asset_path}")
+    preview_registry.touch(project_id)
+    manifest = await _asset_manifest(artifact)
+    # Only files listed in the manifest are served, which also rules out path traversal
+    relpath = f"assets/{filepath}"
+    entry = manifest["files"].get(relpath)
+    if entry is None:
         raise HTTPException(status_code=404, detail="Asset not found")
     
-    # Security check: ensure path is within dist/assets
-    if not str(asset_path.resolve()).startswith(str((dist_dir / "assets").resolve())):
-        print(f"[ASSET ERROR] Path traversal attempt detected")
-        raise HTTPException(status_code=403, detail="Invalid asset path")
-    
-    # Determine media type
-    media_type = "application/octet-stream"
-    if filepath.endswith(".js"):
-        media_type = "application/javascript"
-    elif filepath.endswith(".css"):
-        media_type = "text/css"
-    elif filepath.endswith(".json"):
-        media_type = "application/json"
-    elif filepath.endswith(".svg"):
-        media_type = "image/svg+xml"
-    
-    print(f"[ASSET] Serving with media_type: {media_type}")
-    return FileResponse(asset_path, media_type=media_type)
+    return file_response(
+        artifact.dist_path,
+        relpath,
+        entry,
+        request.headers.get("accept-encoding"),
+        request.headers.get("if-none-match"),
+        IMMUTABLE_CACHE_CONTROL,
+    )
@@ -0,0 +1,109 @@
+"""Preview Watch Manager
+
+Manages long-lived Vite watchers for actively edited projects:
+- Start/stop a `vite build --watch` process per project workspace
+- Report readiness and build errors over server-sent events
+- Watchers idle out after PREVIEW_WATCH_IDLE_TIMEOUT seconds
+
+Preview builds use a running watcher automatically, see app.apis.preview.
+"""
+
+import asyncio
+import json
+from pathlib import Path
+
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
+
+from app.libs.preview_watch import preview_watchers
+
+router = APIRouter(prefix="/preview-watch", tags=["preview-watch"])
+
+WORKSPACE_BASE = Path("/disk/backend/.preview-builds")
+
+
+@router.post("/start/{project_id}")
+async def start_watcher(project_id: str) -> dict:
+    """Start a Vite watcher for a project.
+
+    The workspace must have been built once, see POST /preview/build.
+    """
+    workspace = WORKSPACE_BASE / project_id / "frontend"
+    if not (workspace / "node_modules").exists():
+        raise HTTPException(
+            status_code=404,
+            detail=f"Workspace not built for project {project_id}. Run POST /preview/build first."
+        )
+
+    try:
+        watcher = await preview_watchers.start(project_id, workspace)
+    except Exception as e:
+        print(f"[{project_id}] ❌ Failed to start Vite watcher: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to start watcher: {str(e)}")
+
+    return {"success": True, "watcher": watcher.to_dict()}
+
+
+@router.post("/stop/{project_id}")
+async def stop_watcher(project_id: str) -> dict:
+    """Stop the Vite watcher for a project."""
+    if not await preview_watchers.stop(project_id):
+        raise HTTPException(
+            status_code=404,
+            detail=f"No running watcher found for project {project_id}"
+        )
+    return {"success": True, "project_id": project_id}
+
+
+@router.get("/status/{project_id}")
+async def get_watcher_status(project_id: str) -> dict:
+    """Get state, last build time and errors of a project's watcher."""
+    watcher = preview_watchers.get(project_id)
+    if watcher is None:
+        return {"project_id": project_id, "state": "stopped"}
+    return watcher.to_dict()
+
+
+@router.get("/events/{project_id}")
+async def stream_watcher_events(project_id: str) -> StreamingResponse:
+    """
+    Server-sent events with readiness, errors and output of a project's
+    watcher. The stream ends when the watcher stops.
+    """
+    watcher = preview_watchers.get(project_id)
+    if watcher is None:
+        raise HTTPException(status_code=404, detail="No running watcher for project")
+
+    async def events():
+        queue = watcher.subscribe()
+        try:
+            snapshot = {"type": "status", **watcher.to_dict()}
+            yield f"data: {json.dumps(snapshot)}\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    if watcher.state == "stopped":
+                        break
+                    # Keep proxies from closing an idle stream
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"data: {json.dumps(event)}\n\n"
+                if event["type"] == "done":
+                    break
+        finally:
+            watcher.unsubscribe(queue)
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@router.get("/list")
+async def list_watchers() -> dict:
+    """List all running watchers."""
+    watchers = preview_watchers.list()
+    return {
+        "success": True,
+        "total": len(watchers),
+        "watchers": watchers,
+        "stats": preview_watchers.stats(),
+    }
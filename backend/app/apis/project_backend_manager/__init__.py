@@ -5,20 +5,35 @@ Manages lifecycle of isolated project backend processes:
 - Track running processes (pid, port, status)
 - Port allocation and health checks
 - Auto-restart on code changes
+- Scale to zero: backends idle for PROJECT_BACKEND_IDLE_TIMEOUT seconds are
+  stopped by a reaper, ``ensure_backend()`` cold-starts a stopped backend and
+  waits until /health passes. When PROJECT_BACKEND_MAX_RUNNING backends run,
+  the least recently used one is stopped to make room.
+- Every run is recorded in project_backend_sessions (started, ready and
+  stopped timestamps, stop reason) for capacity planning
+- stdout/stderr are drained into a bounded ring buffer per project, see
+  app.libs.backend_logs and GET /project-backend/logs/{project_id}
 """
 
 import asyncio
+import json
 import os
 import signal
 import subprocess
 import time
 from pathlib import Path
-from typing import Dict, Optional
-from fastapi import APIRouter, HTTPException, BackgroundTasks
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+from fastapi import APIRouter, HTTPException, BackgroundTasks, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 import psutil
 import asyncpg
 
+from app.libs.backend_logs import backend_logs
+from app.libs.backend_proxy import backend_proxy
+from app.libs.database import db_connection
+
 router = APIRouter(prefix="/project-backend", tags=["project-backend"])
 
 # ============================================================================
@@ -32,6 +47,9 @@ running_backends: Dict[str, dict] = {}
 #       "port": 8001,
 #       "status": "running",  # running, stopped, error
 #       "started_at": 1234567890.0,
+#       "ready_at": 1234567892.5,  # first passing /health
+#       "last_request_at": 1234567899.0,
+#       "session_id": 42,  # row in project_backend_sessions
 #       "workspace_path": "/path/to/workspace",
 #       "process": subprocess.Popen object
 #   }
@@ -41,6 +59,18 @@ running_backends: Dict[str, dict] = {}
 BASE_PORT = 8001
 MAX_BACKENDS = 100  # Max 100 concurrent project backends
 
+# Stop backends without traffic for this long, 0 disables the reaper
+PROJECT_BACKEND_IDLE_TIMEOUT = float(os.environ.get("PROJECT_BACKEND_IDLE_TIMEOUT", 900))
+PROJECT_BACKEND_REAP_INTERVAL = float(os.environ.get("PROJECT_BACKEND_REAP_INTERVAL", 30))
+# Least recently used backends are stopped to stay under this
+PROJECT_BACKEND_MAX_RUNNING = int(os.environ.get("PROJECT_BACKEND_MAX_RUNNING", MAX_BACKENDS))
+# How long a cold start may take until /health passes
+PROJECT_BACKEND_START_TIMEOUT = float(os.environ.get("PROJECT_BACKEND_START_TIMEOUT", 60))
+HEALTH_POLL_INTERVAL = 0.25
+
+_start_locks: Dict[str, asyncio.Lock] = {}
+_reaper: Optional[asyncio.Task] = None
+
 # ============================================================================
 # MODELS
 # ============================================================================
@@ -57,6 +87,19 @@ class BackendStatus(BaseModel):
     uptime_seconds: Optional[float] = None
     workspace_path: Optional[str] = None
     health: Optional[str] = None  # healthy, unhealthy
+    last_request_at: Optional[float] = None
+    idle_seconds: Optional[float] = None
+
+class BackendSession(BaseModel):
+    project_id: str
+    port: Optional[int] = None
+    pid: Optional[int] = None
+    started_at: datetime
+    ready_at: Optional[datetime] = None
+    stopped_at: Optional[datetime] = None
+    stop_reason: Optional[str] = None
+    cold_start_ms: Optional[int] = None
+    uptime_seconds: Optional[float] = None
 
 # ============================================================================
 # PORT ALLOCATION
@@ -115,30 +158,27 @@ def start_backend_process(project_id: str, workspace_path: Path, port: int) -> s
     print(f"[{project_id}] Command: {' '.join(cmd)}")
     print(f"[{project_id}] Working dir: {workspace_path}")
     
-    # Start process
+    # Start process, the pipes are drained by backend_logs.attach()
     process = subprocess.Popen(
         cmd,
         cwd=workspace_path,
         stdout=subprocess.PIPE,
         stderr=subprocess.PIPE,
-        text=True,
-        bufsize=1,  # Line buffered
-        env=os.environ.copy()
+        env={**os.environ, "PYTHONUNBUFFERED": "1"}
     )
     
     print(f"[{project_id}] ✅ Process started with PID {process.pid}")
     return process
 
-def stop_backend_process(project_id: str) -> bool:
-    """Stop backend process for project.
+def stop_backend_process(project_id: str, backend_info: dict) -> bool:
+    """Terminate a backend process, blocks up to a few seconds.
+    
+    Runs in a thread, so it does not touch running_backends: the caller has
+    already removed the entry on the event loop.
     
     Returns:
-        True if stopped, False if not running
+        True if stopped, False if stopping failed
     """
-    if project_id not in running_backends:
-        return False
-    
-    backend_info = running_backends[project_id]
     pid = backend_info["pid"]
     
     print(f"[{project_id}] Stopping backend (PID {pid})...")
@@ -167,15 +207,10 @@ def stop_backend_process(project_id: str) -> bool:
                 print(f"[{project_id}] ⚠️ Process killed forcefully")
             except ProcessLookupError:
                 print(f"[{project_id}] ✅ Process terminated")
-        
-        # Remove from tracking
-        del running_backends[project_id]
         return True
         
     except Exception as e:
         print(f"[{project_id}] ❌ Error stopping process: {e}")
-        # Remove anyway
-        del running_backends[project_id]
         return False
 
 async def check_backend_health(project_id: str, port: int) -> str:
@@ -184,46 +219,120 @@ async def check_backend_health(project_id: str, port: int) -> str:
     Returns:
         "healthy" or "unhealthy"
     """
-    try:
-        # Try to connect to health endpoint
-        import httpx
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                f"http://localhost:{port}/health",
-                timeout=2.0
-            )
-            if response.status_code == 200:
-                return "healthy"
-            return "unhealthy"
-    except Exception:
-        return "unhealthy"
+    # Shared keep-alive client, see app.libs.backend_proxy
+    if await backend_proxy.health(port):
+        return "healthy"
+    return "unhealthy"
 
 # ============================================================================
-# API ENDPOINTS
+# SCALE TO ZERO
 # ============================================================================
 
-@router.post("/start/{project_id}")
-async def start_backend(
-    project_id: str,
-    background_tasks: BackgroundTasks
-) -> dict:
-    """Start FastAPI backend for a project.
+def _timestamp(value: Optional[float]) -> Optional[datetime]:
+    return datetime.fromtimestamp(value, timezone.utc) if value else None
+
+def _is_alive(backend_info: dict) -> bool:
+    process = backend_info.get("process")
+    if process is not None:
+        return process.poll() is None
+    return psutil.pid_exists(backend_info["pid"])
+
+async def _record_session_start(project_id: str, backend_info: dict):
+    try:
+        async with db_connection() as conn:
+            backend_info["session_id"] = await conn.fetchval(
+                """
+                INSERT INTO project_backend_sessions (project_id, port, pid, started_at)
+                VALUES ($1, $2, $3, $4)
+                RETURNING id
+                """,
+                project_id,
+                backend_info["port"],
+                backend_info["pid"],
+                _timestamp(backend_info["started_at"]),
+            )
+    except Exception as e:
+        print(f"[{project_id}] ⚠️ Failed to record backend start: {e}")
+
+async def _record_session_update(project_id: str, backend_info: dict, **fields):
+    session_id = backend_info.get("session_id")
+    if session_id is None:
+        return
+    assignments = ", ".join(f"{name} = ${i + 2}" for i, name in enumerate(fields))
+    try:
+        async with db_connection() as conn:
+            await conn.execute(
+                f"UPDATE project_backend_sessions SET {assignments} WHERE id = $1",
+                session_id,
+                *fields.values(),
+            )
+    except Exception as e:
+        print(f"[{project_id}] ⚠️ Failed to record backend session: {e}")
+
+def touch_backend(project_id: str):
+    """Record traffic, keeps the backend from being reaped."""
+    backend_info = running_backends.get(project_id)
+    if backend_info is not None:
+        backend_info["last_request_at"] = time.time()
+
+def _start_lock(project_id: str) -> asyncio.Lock:
+    """Serializes starting and stopping one project's backend."""
+    return _start_locks.setdefault(project_id, asyncio.Lock())
+
+def _is_busy(project_id: str) -> bool:
+    """Starting, stopping or serving a proxied request right now."""
+    lock = _start_locks.get(project_id)
+    if lock is not None and lock.locked():
+        return True
+    return backend_proxy.metrics(project_id).in_flight > 0
+
+async def _stop_locked(project_id: str, reason: str, backend_info: Optional[dict] = None) -> bool:
+    """shutdown_backend() for callers already holding the start lock.
     
-    Creates isolated backend process running in project workspace.
+    With backend_info, only that backend is stopped, not one started since.
     """
-    # Check if already running
-    if project_id in running_backends:
-        backend_info = running_backends[project_id]
-        return {
-            "success": True,
-            "message": "Backend already running",
-            "project_id": project_id,
-            "port": backend_info["port"],
-            "pid": backend_info["pid"],
-            "status": backend_info["status"]
-        }
+    current = running_backends.get(project_id)
+    if current is None or (backend_info is not None and current is not backend_info):
+        return False
+    # Untracked on the loop, so nothing routes to it while it terminates
+    del running_backends[project_id]
+    stopped = await asyncio.to_thread(stop_backend_process, project_id, current)
+    await _record_session_update(
+        project_id,
+        current,
+        stopped_at=datetime.now(timezone.utc),
+        stop_reason=reason,
+    )
+    return stopped
+
+async def shutdown_backend(project_id: str, reason: str, backend_info: Optional[dict] = None) -> bool:
+    """Stop a backend without blocking the event loop and record why."""
+    async with _start_lock(project_id):
+        return await _stop_locked(project_id, reason, backend_info)
+
+async def _make_room():
+    """Stop least recently used idle backends while at PROJECT_BACKEND_MAX_RUNNING.
     
-    # Check if workspace exists
+    Backends that are starting or serving requests are never picked, if all
+    of them are busy the start fails with 503.
+    """
+    while len(running_backends) >= min(PROJECT_BACKEND_MAX_RUNNING, MAX_BACKENDS):
+        candidates = [pid for pid in running_backends if not _is_busy(pid)]
+        if not candidates:
+            raise HTTPException(
+                status_code=503,
+                detail="Too many project backends running, try again later"
+            )
+        project_id = min(
+            candidates,
+            key=lambda pid: running_backends[pid].get("last_request_at") or running_backends[pid]["started_at"],
+        )
+        print(f"[{project_id}] Stopping least recently used backend to make room")
+        # Not locked (checked above, no await since), so this does not wait
+        await shutdown_backend(project_id, "evicted", running_backends[project_id])
+
+async def launch_backend(project_id: str) -> dict:
+    """Start the project's backend process and track it, returns its info."""
     workspace_path = Path(f"/disk/backend/.preview-builds/{project_id}/backend")
     if not workspace_path.exists():
         raise HTTPException(
@@ -231,7 +340,6 @@ async def start_backend(
             detail=f"Backend workspace not found for project {project_id}. Run POST /preview/backend/create first."
         )
     
-    # Check if main.py exists
     main_py = workspace_path / "main.py"
     if not main_py.exists():
         raise HTTPException(
@@ -239,33 +347,138 @@ async def start_backend(
             detail=f"main.py not found in workspace. Run POST /preview/backend/create first."
         )
     
-    try:
-        # Allocate port
-        port = allocate_port()
-        
-        # Start process
-        process = start_backend_process(project_id, workspace_path, port)
+    await _make_room()
+    port = allocate_port()
+    process = start_backend_process(project_id, workspace_path, port)
+    backend_logs.attach(project_id, process)
+    now = time.time()
+    backend_info = {
+        "pid": process.pid,
+        "port": port,
+        "status": "running",
+        "started_at": now,
+        "ready_at": None,
+        "last_request_at": now,
+        "session_id": None,
+        "workspace_path": str(workspace_path),
+        "process": process
+    }
+    running_backends[project_id] = backend_info
+    await _record_session_start(project_id, backend_info)
+    _ensure_reaper()
+    return backend_info
+
+async def wait_until_healthy(project_id: str, backend_info: dict, timeout: float = PROJECT_BACKEND_START_TIMEOUT) -> bool:
+    """Poll /health until it passes, False if the process died or timed out."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if not _is_alive(backend_info):
+            return False
+        if await check_backend_health(project_id, backend_info["port"]) == "healthy":
+            if backend_info["ready_at"] is None:
+                backend_info["ready_at"] = time.time()
+                cold_start_ms = round((backend_info["ready_at"] - backend_info["started_at"]) * 1000)
+                print(f"[{project_id}] ✅ Backend healthy after {cold_start_ms}ms")
+                await _record_session_update(
+                    project_id,
+                    backend_info,
+                    ready_at=_timestamp(backend_info["ready_at"]),
+                    cold_start_ms=cold_start_ms,
+                )
+            return True
+        await asyncio.sleep(HEALTH_POLL_INTERVAL)
+    return False
+
+async def ensure_backend(project_id: str) -> dict:
+    """The project's running, healthy backend, cold-starting it if needed.
+    
+    Concurrent callers for a stopped backend share one start and all wait
+    until /health passes.
+    """
+    backend_info = running_backends.get(project_id)
+    if backend_info is not None and backend_info["ready_at"] is not None and _is_alive(backend_info):
+        touch_backend(project_id)
+        return backend_info
+    
+    async with _start_lock(project_id):
+        backend_info = running_backends.get(project_id)
+        if backend_info is not None and not _is_alive(backend_info):
+            print(f"[{project_id}] ⚠️ Backend process exited, restarting")
+            await _stop_locked(project_id, "crashed", backend_info)
+            backend_info = None
+        if backend_info is None:
+            print(f"[{project_id}] 🥶 Cold-starting backend")
+            backend_info = await launch_backend(project_id)
         
-        # Track in global state
-        running_backends[project_id] = {
-            "pid": process.pid,
-            "port": port,
-            "status": "running",
-            "started_at": time.time(),
-            "workspace_path": str(workspace_path),
-            "process": process
+        if not await wait_until_healthy(project_id, backend_info):
+            await _stop_locked(project_id, "unhealthy", backend_info)
+            raise HTTPException(
+                status_code=503,
+                detail=f"Backend for project {project_id} did not become healthy"
+            )
+        touch_backend(project_id)
+        return backend_info
+
+def _ensure_reaper():
+    global _reaper
+    if PROJECT_BACKEND_IDLE_TIMEOUT <= 0:
+        return
+    if _reaper is None or _reaper.done():
+        _reaper = asyncio.create_task(_reap_idle_backends())
+
+async def _reap_idle_backends():
+    """Stop backends without traffic, runs while any backend runs."""
+    while running_backends:
+        await asyncio.sleep(PROJECT_BACKEND_REAP_INTERVAL)
+        now = time.time()
+        for project_id, backend_info in list(running_backends.items()):
+            if running_backends.get(project_id) is not backend_info:
+                continue  # Stopped or replaced meanwhile
+            if _is_busy(project_id):
+                continue  # Starting, or a long request or stream is open
+            if not _is_alive(backend_info):
+                print(f"[{project_id}] ⚠️ Backend process exited")
+                await shutdown_backend(project_id, "crashed", backend_info)
+                continue
+            last_request_at = backend_info.get("last_request_at") or backend_info["started_at"]
+            if now - last_request_at > PROJECT_BACKEND_IDLE_TIMEOUT:
+                print(f"[{project_id}] 💤 Backend idle for {now - last_request_at:.0f}s, stopping")
+                await shutdown_backend(project_id, "idle", backend_info)
+
+# ============================================================================
+# API ENDPOINTS
+# ============================================================================
+
+async def _start_locked(project_id: str) -> dict:
+    """start_backend() for callers already holding the start lock."""
+    # Check if already running
+    if project_id in running_backends:
+        backend_info = running_backends[project_id]
+        touch_backend(project_id)
+        return {
+            "success": True,
+            "message": "Backend already running",
+            "project_id": project_id,
+            "port": backend_info["port"],
+            "pid": backend_info["pid"],
+            "status": backend_info["status"]
         }
+    
+    try:
+        backend_info = await launch_backend(project_id)
         
         return {
             "success": True,
             "message": "Backend started successfully",
             "project_id": project_id,
-            "port": port,
-            "pid": process.pid,
-            "url": f"http://localhost:{port}",
-            "workspace": str(workspace_path)
+            "port": backend_info["port"],
+            "pid": backend_info["pid"],
+            "url": f"http://localhost:{backend_info['port']}",
+            "workspace": backend_info["workspace_path"]
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"[{project_id}] ❌ Failed to start backend: {e}")
         import traceback
@@ -275,6 +488,105 @@ async def start_backend(
             detail=f"Failed to start backend: {str(e)}"
         )
 
+@router.post("/start/{project_id}")
+async def start_backend(
+    project_id: str,
+    background_tasks: BackgroundTasks
+) -> dict:
+    """Start FastAPI backend for a project.
+    
+    Creates isolated backend process running in project workspace.
+    """
+    # Same lock as ensure_backend(), so a proxied cold start and this
+    # never launch two processes for one project
+    async with _start_lock(project_id):
+        return await _start_locked(project_id)
+
+@router.post("/wake/{project_id}")
+async def wake_backend(project_id: str) -> dict:
+    """Make sure the backend runs and is healthy, cold-starting it if stopped."""
+    started = time.time()
+    backend_info = await ensure_backend(project_id)
+    return {
+        "success": True,
+        "project_id": project_id,
+        "port": backend_info["port"],
+        "pid": backend_info["pid"],
+        "cold_start": backend_info["started_at"] >= started,
+        "waited_ms": round((time.time() - started) * 1000),
+    }
+
+@router.get("/sessions/{project_id}")
+async def list_backend_sessions(project_id: str, limit: int = 50) -> List[BackendSession]:
+    """Recent runs of the project's backend, newest first."""
+    async with db_connection() as conn:
+        rows = await conn.fetch(
+            """
+            SELECT project_id, port, pid, started_at, ready_at, stopped_at, stop_reason, cold_start_ms,
+                   EXTRACT(EPOCH FROM (COALESCE(stopped_at, NOW()) - started_at)) AS uptime_seconds
+            FROM project_backend_sessions
+            WHERE project_id = $1
+            ORDER BY started_at DESC
+            LIMIT $2
+            """,
+            project_id,
+            min(limit, 500),
+        )
+    return [BackendSession(**{**dict(row), "uptime_seconds": float(row["uptime_seconds"])}) for row in rows]
+
+@router.get("/logs/{project_id}")
+async def get_backend_logs(
+    project_id: str,
+    request: Request,
+    lines: int = 100,
+    after: int = 0,
+    follow: bool = False,
+):
+    """Last lines of the backend's stdout/stderr.
+    
+    With follow=true, server-sent events: the last lines, then new lines as
+    they are written. Reconnecting clients resume after Last-Event-ID.
+    """
+    log = backend_logs.get(project_id)
+    if log is None:
+        raise HTTPException(
+            status_code=404,
+            detail=f"No backend output for project {project_id}"
+        )
+    lines = max(0, min(lines, log.lines.maxlen))
+    
+    if not follow:
+        return {
+            "success": True,
+            "project_id": project_id,
+            "running": project_id in running_backends,
+            "lines": log.tail(lines, after),
+            **log.stats(),
+        }
+    
+    last_event_id = request.headers.get("last-event-id")
+    if last_event_id and last_event_id.isdigit():
+        after = max(after, int(last_event_id))
+    
+    async def events():
+        backlog = log.tail(lines, after)
+        queue = log.subscribe()
+        try:
+            for line in backlog:
+                yield f"id: {line['seq']}\ndata: {json.dumps(line)}\n\n"
+            while True:
+                try:
+                    line = await asyncio.wait_for(queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    # Keep proxies from closing an idle stream
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"id: {line['seq']}\ndata: {json.dumps(line)}\n\n"
+        finally:
+            log.unsubscribe(queue)
+    
+    return StreamingResponse(events(), media_type="text/event-stream")
+
 @router.post("/stop/{project_id}")
 async def stop_backend(project_id: str) -> dict:
     """Stop backend process for project."""
@@ -284,7 +596,7 @@ async def stop_backend(project_id: str) -> dict:
             detail=f"No running backend found for project {project_id}"
         )
     
-    success = stop_backend_process(project_id)
+    success = await shutdown_backend(project_id, "manual")
     
     return {
         "success": success,
@@ -298,14 +610,14 @@ async def restart_backend(
     background_tasks: BackgroundTasks
 ) -> dict:
     """Restart backend (useful after code changes)."""
-    # Stop if running
-    if project_id in running_backends:
-        stop_backend_process(project_id)
-        await asyncio.sleep(1)  # Wait for port to be released
-    
-    # Start again
-    result = await start_backend(project_id, background_tasks)
-    return result
+    async with _start_lock(project_id):
+        # Stop if running
+        if project_id in running_backends:
+            await _stop_locked(project_id, "restart")
+            await asyncio.sleep(1)  # Wait for port to be released
+        
+        # Start again
+        return await _start_locked(project_id)
 
 @router.get("/status/{project_id}")
 async def get_backend_status(project_id: str) -> BackendStatus:
@@ -337,7 +649,7 @@ async def get_backend_status(project_id: str) -> BackendStatus:
         uptime = None
         health = None
         # Clean up tracking
-        del running_backends[project_id]
+        await shutdown_backend(project_id, "crashed", backend_info)
     
     return BackendStatus(
         project_id=project_id,
@@ -347,7 +659,10 @@ async def get_backend_status(project_id: str) -> BackendStatus:
         started_at=started_at,
         uptime_seconds=uptime,
         workspace_path=backend_info["workspace_path"],
-        health=health
+        health=health,
+        last_request_at=backend_info.get("last_request_at"),
+        idle_seconds=round(time.time() - backend_info["last_request_at"], 1)
+        if backend_info.get("last_request_at") else None
     )
 
 @router.get("/list")
@@ -372,7 +687,7 @@ async def stop_all_backends() -> dict:
     
     for project_id in list(running_backends.keys()):
         try:
-            stop_backend_process(project_id)
+            await shutdown_backend(project_id, "manual")
             stopped.append(project_id)
         except Exception as e:
             print(f"Failed to stop {project_id}: {e}")
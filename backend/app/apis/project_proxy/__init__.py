@@ -0,0 +1,96 @@
+"""Project Backend Proxy
+
+Serves every project backend through the main app at /p/{project_id}/{path},
+so clients no longer need to know a backend's port:
+- A stopped backend is cold-started and the request waits until /health
+  passes, see ensure_backend() in app.apis.project_backend_manager
+- Requests go through the shared keep-alive client of app.libs.backend_proxy,
+  bodies are streamed in both directions
+- Latency and bytes are recorded per project, see GET /proxy/stats
+"""
+
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+
+from app.apis.project_backend_manager import ensure_backend, touch_backend
+from app.libs.backend_proxy import ProxyError, backend_proxy
+
+router = APIRouter(tags=["project-proxy"])
+
+PROXY_METHODS = ["GET", "POST", "PUT", "PATCH", "DELETE", "HEAD", "OPTIONS"]
+
+
+def _forwarded_headers(request: Request, prefix: str) -> list:
+    """Client headers plus X-Forwarded-*, the backend's own Host is used."""
+    headers = [
+        (name, value)
+        for name, value in request.headers.items()
+        if name != "host" and not name.startswith("x-forwarded-")
+    ]
+    client_host = request.client.host if request.client else None
+    forwarded_for = request.headers.get("x-forwarded-for")
+    if client_host:
+        forwarded_for = f"{forwarded_for}, {client_host}" if forwarded_for else client_host
+    if forwarded_for:
+        headers.append(("x-forwarded-for", forwarded_for))
+    headers.append(("x-forwarded-proto", request.headers.get("x-forwarded-proto", request.url.scheme)))
+    headers.append(("x-forwarded-host", request.headers.get("x-forwarded-host", request.headers.get("host", ""))))
+    headers.append(("x-forwarded-prefix", prefix))
+    return headers
+
+
+def _has_body(request: Request) -> bool:
+    return "content-length" in request.headers or "transfer-encoding" in request.headers
+
+
+@router.api_route("/p/{project_id}", methods=PROXY_METHODS, include_in_schema=False)
+@router.api_route("/p/{project_id}/{path:path}", methods=PROXY_METHODS, include_in_schema=False)
+async def proxy_to_backend(project_id: str, request: Request, path: str = "") -> StreamingResponse:
+    """Forward a request to the project's backend and stream its response."""
+    backend_info = await ensure_backend(project_id)
+    prefix = request.url.path[: len(request.url.path) - len(path)].rstrip("/")
+
+    try:
+        proxied = await backend_proxy.open(
+            project_id,
+            backend_info["port"],
+            request.method,
+            f"/{path}",
+            request.url.query,
+            _forwarded_headers(request, prefix),
+            # Read from the client as the backend accepts it
+            request.stream() if _has_body(request) else None,
+        )
+    except ProxyError as e:
+        print(f"[{project_id}] ⚠️ Proxy error: {e}")
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+
+    async def body():
+        try:
+            async for chunk in proxied.body():
+                yield chunk
+        finally:
+            # Long downloads and streams count as traffic until they end
+            touch_backend(project_id)
+
+    response = StreamingResponse(
+        body(),
+        status_code=proxied.status_code,
+        # Releases the backend slot if the client went away before the body
+        background=BackgroundTask(proxied.aclose),
+    )
+    # Raw headers, so repeated ones such as Set-Cookie are kept
+    response.raw_headers = [
+        (name.encode("latin-1"), value.encode("latin-1"))
+        for name, value in proxied.headers
+    ]
+    return response
+
+
+@router.get("/proxy/stats")
+async def get_proxy_stats(project_id: Optional[str] = None) -> dict:
+    """Proxied requests, errors, bytes and latency percentiles per project."""
+    return backend_proxy.stats(project_id)
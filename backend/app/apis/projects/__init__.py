@@ -1,13 +1,17 @@
 """Projects API - Complete CRUD operations for project management."""
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query
 from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple
+from uuid import UUID
 import asyncpg
+import base64
+import json
 import os
 from datetime import datetime
 from app.auth import AuthorizedUser
-from app.libs.database import get_db_connection
+from app.libs.database import db_connection
+from app.libs.project_access import project_access_tracker
 
 router = APIRouter()
 
@@ -78,7 +82,10 @@ class ProjectResponse(BaseModel):
     design: Optional[DesignResponse]
 
 class ProjectListItem(BaseModel):
-    """Summary project info for list view."""
+    """Summary project info for list view.
+
+    title and description are cut to 200 and 300 characters.
+    """
     id: str
     title: str
     description: Optional[str]
@@ -88,6 +95,11 @@ class ProjectListItem(BaseModel):
     feature_count: int
     integration_count: int
 
+class ProjectListPage(BaseModel):
+    """One page of the project list."""
+    projects: List[ProjectListItem]
+    next_cursor: Optional[str] = None
+
 class ProjectUpdate(BaseModel):
     """Request model for updating a project."""
     title: Optional[str] = None
@@ -98,6 +110,119 @@ class ProjectUpdate(BaseModel):
 
 # Helper Functions
 
+# Loads a project with its features, integrations and design in one statement
+PROJECT_DETAIL_QUERY = """
+SELECT
+    p.id, p.user_id, p.title, p.description, p.status,
+    p.created_at, p.updated_at, p.last_accessed_at,
+    COALESCE(f.features, '[]'::json) AS features,
+    COALESCE(i.integrations, '[]'::json) AS integrations,
+    d.design
+FROM projects p
+LEFT JOIN LATERAL (
+    SELECT json_agg(
+        json_build_object(
+            'id', pf.id::text,
+            'text', pf.feature_text,
+            'order_index', pf.order_index,
+            'status', pf.status,
+            'created_at', pf.created_at
+        )
+        ORDER BY pf.order_index
+    ) AS features
+    FROM project_features pf
+    WHERE pf.project_id = p.id
+) f ON true
+LEFT JOIN LATERAL (
+    SELECT json_agg(
+        json_build_object(
+            'id', pi.id::text,
+            'name', pi.integration_name,
+            'enabled', pi.enabled,
+            'config', pi.config,
+            'enabled_at', pi.enabled_at,
+            'created_at', pi.created_at
+        )
+        ORDER BY pi.integration_name
+    ) AS integrations
+    FROM project_integrations pi
+    WHERE pi.project_id = p.id
+) i ON true
+LEFT JOIN LATERAL (
+    SELECT json_build_object(
+        'id', pd.id::text,
+        'theme', pd.theme,
+        'color_scheme', pd.color_scheme,
+        'design_preferences', pd.design_preferences,
+        'created_at', pd.created_at
+    ) AS design
+    FROM project_design pd
+    WHERE pd.project_id = p.id
+    LIMIT 1
+) d ON true
+WHERE p.id = $1 AND p.user_id = $2
+"""
+
+def _encode_cursor(updated_at: datetime, project_id: Any) -> str:
+    """Opaque keyset cursor for (updated_at, id)."""
+    raw = json.dumps({"u": updated_at.isoformat(), "i": str(project_id)})
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def _decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.fromisoformat(data["u"]), str(UUID(data["i"]))
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+_PROJECT_LIST_QUERY = """
+    SELECT id, listing_title AS title, listing_description AS description,
+           status, created_at, updated_at, feature_count, integration_count
+    FROM projects
+    WHERE user_id = $1 AND status != 'deleted'
+      {seek}
+    ORDER BY updated_at DESC, id DESC
+    LIMIT $2
+"""
+
+async def _fetch_project_list(
+    conn: asyncpg.Connection,
+    user_id: str,
+    limit: Optional[int] = None,
+    after: Optional[Tuple[datetime, str]] = None,
+):
+    """
+    Fetch list rows newest first. Counts come from the counters on projects
+    (maintained by triggers) and title/description from their bounded
+    listing_* copies, so every selected column is in idx_projects_user_listing
+    and this is an index-only scan.
+    """
+    # Separate statements for the first and later pages, a generic plan for
+    # an optional cursor could not seek the index to the cursor
+    if after is None:
+        return await conn.fetch(_PROJECT_LIST_QUERY.format(seek=""), user_id, limit)
+    after_updated_at, after_id = after
+    return await conn.fetch(
+        _PROJECT_LIST_QUERY.format(seek="AND (updated_at, id) < ($3::timestamptz, $4::uuid)"),
+        user_id,
+        limit,
+        after_updated_at,
+        after_id,
+    )
+
+def _to_list_item(p) -> ProjectListItem:
+    return ProjectListItem(
+        id=str(p["id"]),
+        title=p["title"],
+        description=p["description"],
+        status=p["status"],
+        created_at=p["created_at"],
+        updated_at=p["updated_at"],
+        feature_count=p["feature_count"],
+        integration_count=p["integration_count"]
+    )
+
 # API Endpoints
 
 @router.post("/projects", response_model=ProjectResponse)
@@ -113,8 +238,7 @@ async def create_project(project: ProjectCreate, user: AuthorizedUser):
     
     All operations are wrapped in a transaction for data consistency.
     """
-    conn = await get_db_connection()
-    try:
+    async with db_connection() as conn:
         # Start transaction
         async with conn.transaction():
             # Create main project
@@ -226,8 +350,6 @@ async def create_project(project: ProjectCreate, user: AuthorizedUser):
                 integrations=integrations,
                 design=design_response
             )
-    finally:
-        await conn.close()
 
 
 @router.get("/projects", response_model=List[ProjectListItem])
@@ -238,39 +360,41 @@ async def list_projects(user: AuthorizedUser):
     Returns a summary view with counts of features and integrations.
     Only active projects are returned (soft-deleted projects are excluded).
     """
-    conn = await get_db_connection()
-    try:
-        projects = await conn.fetch(
-            """
-            SELECT 
-                p.*,
-                COUNT(DISTINCT pf.id) as feature_count,
-                COUNT(DISTINCT pi.id) as integration_count
-            FROM projects p
-            LEFT JOIN project_features pf ON p.id = pf.project_id
-            LEFT JOIN project_integrations pi ON p.id = pi.project_id
-            WHERE p.user_id = $1 AND p.status != 'deleted'
-            GROUP BY p.id
-            ORDER BY p.updated_at DESC
-            """,
-            user.sub
-        )
-        
-        return [
-            ProjectListItem(
-                id=str(p["id"]),
-                title=p["title"],
-                description=p["description"],
-                status=p["status"],
-                created_at=p["created_at"],
-                updated_at=p["updated_at"],
-                feature_count=p["feature_count"],
-                integration_count=p["integration_count"]
-            )
-            for p in projects
-        ]
-    finally:
-        await conn.close()
+    async with db_connection() as conn:
+        projects = await _fetch_project_list(conn, user.sub)
+    
+    return [_to_list_item(p) for p in projects]
+
+
+@router.get("/projects/page", response_model=ProjectListPage)
+async def list_projects_page(
+    user: AuthorizedUser,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+):
+    """
+    List projects for the authenticated user one page at a time.
+    
+    Pages are ordered by most recently updated first. Pass the returned
+    next_cursor back as cursor to get the following page; next_cursor is
+    null on the last page.
+    """
+    after = _decode_cursor(cursor) if cursor else None
+    
+    async with db_connection() as conn:
+        projects = await _fetch_project_list(conn, user.sub, limit=limit + 1, after=after)
+    
+    has_more = len(projects) > limit
+    projects = projects[:limit]
+    next_cursor = None
+    if has_more:
+        last = projects[-1]
+        next_cursor = _encode_cursor(last["updated_at"], last["id"])
+    
+    return ProjectListPage(
+        projects=[_to_list_item(p) for p in projects],
+        next_cursor=next_cursor,
+    )
 
 
 @router.get("/projects/{project_id}", response_model=ProjectResponse)
@@ -284,89 +408,51 @@ async def get_project(project_id: str, user: AuthorizedUser):
     - All integrations
     - Design preferences
     
-    Also updates the last_accessed_at timestamp.
+    The whole aggregate is loaded in a single round trip. The
+    last_accessed_at timestamp is updated write-behind in batches.
     """
-    conn = await get_db_connection()
-    try:
-        # Get project and verify ownership
-        project = await conn.fetchrow(
-            "SELECT * FROM projects WHERE id = $1 AND user_id = $2",
-            project_id,
-            user.sub
-        )
-        
-        if not project:
-            raise HTTPException(status_code=404, detail="Project not found")
-        
-        # Update last accessed
-        await conn.execute(
-            "UPDATE projects SET last_accessed_at = NOW() WHERE id = $1",
-            project_id
-        )
-        
-        # Get features
-        feature_rows = await conn.fetch(
-            "SELECT * FROM project_features WHERE project_id = $1 ORDER BY order_index",
-            project_id
-        )
-        features = [
-            FeatureResponse(
-                id=str(f["id"]),
-                text=f["feature_text"],
-                order_index=f["order_index"],
-                status=f["status"],
-                created_at=f["created_at"]
-            )
-            for f in feature_rows
-        ]
-        
-        # Get integrations
-        integration_rows = await conn.fetch(
-            "SELECT * FROM project_integrations WHERE project_id = $1 ORDER BY integration_name",
-            project_id
-        )
-        integrations = [
-            IntegrationResponse(
-                id=str(i["id"]),
-                name=i["integration_name"],
-                enabled=i["enabled"],
-                config=i["config"],
-                enabled_at=i["enabled_at"],
-                created_at=i["created_at"]
-            )
-            for i in integration_rows
-        ]
-        
-        # Get design
-        design_row = await conn.fetchrow(
-            "SELECT * FROM project_design WHERE project_id = $1",
-            project_id
-        )
-        design = None
-        if design_row:
-            design = DesignResponse(
-                id=str(design_row["id"]),
-                theme=design_row["theme"],
-                color_scheme=design_row["color_scheme"],
-                design_preferences=design_row["design_preferences"],
-                created_at=design_row["created_at"]
-            )
-        
-        return ProjectResponse(
-            id=str(project["id"]),
-            user_id=project["user_id"],
-            title=project["title"],
-            description=project["description"],
-            status=project["status"],
-            created_at=project["created_at"],
-            updated_at=project["updated_at"],
-            last_accessed_at=project["last_accessed_at"],
-            features=features,
-            integrations=integrations,
-            design=design
-        )
-    finally:
-        await conn.close()
+    async with db_connection() as conn:
+        project = await conn.fetchrow(PROJECT_DETAIL_QUERY, project_id, user.sub)
+    
+    if not project:
+        raise HTTPException(status_code=404, detail="Project not found")
+    
+    # Update last accessed (flushed in the background), and report it as if
+    # it had been written already
+    project_access_tracker.touch(project_id)
+    last_accessed_at = project["last_accessed_at"]
+    pending = project_access_tracker.pending_access(project_id)
+    if pending is not None and last_accessed_at is not None and last_accessed_at.tzinfo is None:
+        # timestamp without time zone column, stored in UTC
+        pending = pending.replace(tzinfo=None)
+    if pending is not None and (last_accessed_at is None or pending > last_accessed_at):
+        last_accessed_at = pending
+    
+    features = [
+        FeatureResponse(**f)
+        for f in json.loads(project["features"])
+    ]
+    integrations = [
+        IntegrationResponse(**i)
+        for i in json.loads(project["integrations"])
+    ]
+    design = None
+    if project["design"]:
+        design = DesignResponse(**json.loads(project["design"]))
+    
+    return ProjectResponse(
+        id=str(project["id"]),
+        user_id=project["user_id"],
+        title=project["title"],
+        description=project["description"],
+        status=project["status"],
+        created_at=project["created_at"],
+        updated_at=project["updated_at"],
+        last_accessed_at=last_accessed_at,
+        features=features,
+        integrations=integrations,
+        design=design
+    )
 
 
 @router.put("/projects/{project_id}", response_model=ProjectResponse)
@@ -382,8 +468,7 @@ async def update_project(project_id: str, update: ProjectUpdate, user: Authorize
     
     All operations are wrapped in a transaction.
     """
-    conn = await get_db_connection()
-    try:
+    async with db_connection() as conn:
         async with conn.transaction():
             # Verify project exists and user owns it
             project = await conn.fetchrow(
@@ -497,11 +582,10 @@ async def update_project(project_id: str, update: ProjectUpdate, user: Authorize
                         update.design.color_scheme,
                         update.design.design_preferences
                     )
-        
-        # Return updated project (reuse get_project logic)
-        return await get_project(project_id, user)
-    finally:
-        await conn.close()
+
+    # Return updated project (reuse get_project logic) once the connection
+    # is released, get_project checks out its own
+    return await get_project(project_id, user)
 
 
 @router.delete("/projects/{project_id}")
@@ -512,8 +596,7 @@ async def delete_project(project_id: str, user: AuthorizedUser):
     Sets the project status to 'deleted' instead of actually deleting the record.
     This allows for potential recovery and maintains referential integrity.
     """
-    conn = await get_db_connection()
-    try:
+    async with db_connection() as conn:
         result = await conn.fetchval(
             """
             UPDATE projects 
@@ -529,5 +612,3 @@ async def delete_project(project_id: str, user: AuthorizedUser):
             raise HTTPException(status_code=404, detail="Project not found")
         
         return {"success": True, "message": "Project deleted successfully"}
-    finally:
-        await conn.close()
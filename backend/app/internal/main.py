@@ -10,6 +10,20 @@ from fastapi import Depends, FastAPI, HTTPException, params
 from fastapi.routing import APIRoute, APIWebSocketRoute
 from pydantic import BaseModel
 
+from app.libs.backend_logs import backend_logs
+from app.libs.backend_proxy import backend_proxy
+from app.libs.build_worker import build_worker_pool, limit_local_commands
+from app.libs.database import MigrationError, close_db_pool, init_db_pool
+from app.libs.preview_registry import preview_registry
+from app.libs.preview_watch import preview_watchers
+from app.libs.project_access import project_access_tracker
+from app.libs.typecheck import typecheck_servers
+from app.libs.venv_pool import venv_pool
+from app.libs.schema_introspection import (
+    start_schema_change_listener,
+    stop_schema_change_listener,
+)
+
 from .apirouters import make_user_endpoints_router
 from .config import Config, checked_config
 from .exceptionmodel import ExceptionModel
@@ -135,6 +149,25 @@ async def lifespan(app: FastAPI):
                 # TODO: Publish other error type
                 await devx.notify_import_error_async("<openapi-publish>", ex)
 
+    # Open the shared database pool before reporting healthy, which applies
+    # schema migrations. A failed migration fails startup; an unreachable
+    # database is not fatal, the first query creates the pool again
+    try:
+        if await init_db_pool() is not None:
+            await start_schema_change_listener()
+            preview_registry.start_janitor()
+            await build_worker_pool.start()
+    except MigrationError:
+        raise
+    except Exception as ex:
+        print(f"Failed to prepare database: {ex}")
+
+    # Builds in this process must not slow down API traffic
+    limit_local_commands()
+
+    # Build the golden venv and fill the venv pool for project backends
+    venv_pool.replenish()
+
     # Set flag for health endpoint to start returning OK
     app_state.started_event.set()
 
@@ -154,7 +187,25 @@ async def lifespan(app: FastAPI):
     # Yield for the active lifespan of the app
     yield
 
-    # App is shutting down
+    # App is shutting down, flush write-behind updates before closing the pool
+    await project_access_tracker.stop()
+    # Cancel in-flight builds (and their commands) before the services they use
+    try:
+        from app.apis.preview import preview_builds
+
+        await preview_builds.stop()
+    except ImportError as ex:
+        print(f"Preview builds not stopped, module not loaded: {ex}")
+    await preview_watchers.stop_all()
+    await typecheck_servers.stop_all()
+    await venv_pool.stop()
+    await backend_proxy.close()
+    await backend_logs.stop()
+    await build_worker_pool.stop()
+    await preview_registry.stop()
+    await stop_schema_change_listener()
+    await close_db_pool()
+
     if enable_publishing:
         await devx.notify_devx_async(
             Topics.backend_shutdown,
@@ -8,6 +8,7 @@
 
 
 
+import asyncio
 import os
 import json
 from typing import Dict, List, Any, Optional, AsyncGenerator
@@ -18,6 +19,18 @@ from app.libs.ai_system_prompt import get_system_prompt, get_planning_prompt, ge
 from app.libs.ai_context_loader import AIContextLoader
 from app.libs.package_detector import detect_packages_from_files
 
+# How long trigger_build waits for the preview build to finish
+BUILD_WAIT_TIMEOUT = float(os.environ.get("BUILD_WAIT_TIMEOUT", 600))
+
+
+def _language_for_path(file_path: str) -> Optional[str]:
+    """Language the file tools validate a file as, from its extension."""
+    if file_path.endswith(".py"):
+        return "python"
+    if file_path.endswith((".ts", ".tsx")):
+        return "typescript"
+    return None
+
 
 class AIOrchestrator:
     """Orchestrates AI conversations with tool calling capabilities and context awareness."""
@@ -144,6 +157,9 @@ Respond with ONLY the category name, nothing else."""
             except Exception as e:
                 yield "❌ Migration error: {0}\n".format(str(e))
         
+        # Generated files are collected and written in one batch at the end
+        pending_files: List[Dict[str, Any]] = []
+        
         # 2. Generate backend API files
         apis = plan.get('apis', [])
         if apis:
@@ -197,18 +213,14 @@ Generate ONLY the Python code, no explanations."""
                     
                     print(f"DEBUG: Extracted code for {api_name}: {generated_code[:200] if generated_code else 'NONE'}...")
                     
-                    # Create the file
-                    result = await self.execute_tool('create_file', {
+                    # Queue the file, all generated files are written in one batch
+                    pending_files.append({
                         'file_path': f'backend/app/apis/{api_name}/__init__.py',
                         'file_content': generated_code,
                         'language': 'python',
                         'file_type': 'api'
                     })
-                    
-                    if result.get('success'):
-                        yield "✅ Created {0} API\n".format(api_name)
-                    else:
-                        yield "⚠️ Failed to create {0}: {1}\n".format(api_name, result.get('error'))
+                    yield "✅ Generated {0} API\n".format(api_name)
                         
                 except Exception as e:
                     yield "❌ Error generating {0}: {1}\n".format(api_name, str(e))
@@ -264,22 +276,32 @@ Generate ONLY the TypeScript/React code, no explanations."""
                     elif '```' in generated_code:
                         generated_code = generated_code.split('```')[1].split('```')[0].strip()
                     
-                    # Create the file
-                    result = await self.execute_tool('create_file', {
+                    # Queue the file, all generated files are written in one batch
+                    pending_files.append({
                         'file_path': f'frontend/src/pages/{page_name}.tsx',
                         'file_content': generated_code,
                         'language': 'typescript',
                         'file_type': 'page'
                     })
-                    
-                    if result.get('success'):
-                        yield f"✅ Created {page_name} page\n"
-                    else:
-                        yield "⚠️ Failed to create {0}: {1}\n".format(page_name, result.get('error'))
+                    yield f"✅ Generated {page_name} page\n"
                         
                 except Exception as e:
                     yield f"❌ Error generating {page_name}: {str(e)}\n"
         
+        # 4. Write all generated files in one transaction
+        if pending_files:
+            yield f"\n💾 Saving {len(pending_files)} files...\n"
+            try:
+                result = await self.execute_tool('batch_write_files', {'files': pending_files})
+                if result.get('success'):
+                    yield f"✅ {result.get('message')}\n"
+                    for item in result.get('data', {}).get('invalid', []):
+                        yield f"⚠️ Not saved, syntax errors in {item['file_path']}: {'; '.join(item['errors'][:3])}\n"
+                else:
+                    yield "⚠️ Failed to save files: {0}\n".format(result.get('error'))
+            except Exception as e:
+                yield "❌ Error saving files: {0}\n".format(str(e))
+        
         yield "\n✨ **Code Generation Complete!**\n"
         yield "Files are now available in the code editor.\n"
         
@@ -354,18 +376,17 @@ Generate ONLY the TypeScript/React code, no explanations."""
             yield "🔨 Building project...\n"
             try:
                 build_result = await self.execute_tool('trigger_build', {})
-                if not build_result.get('success'):
+                if build_result.get('build_status') is None:
                     yield f"⚠️ Build trigger failed: {build_result.get('error')}\n"
                     break
-                yield "✅ Build triggered\n"
+                if build_result.get('success'):
+                    yield "✅ Build succeeded\n"
+                else:
+                    yield f"⚠️ Build failed: {build_result.get('error')}\n"
             except Exception as e:
                 yield f"❌ Build error: {str(e)}\n"
                 break
             
-            # Wait a bit for build to complete
-            import asyncio
-            await asyncio.sleep(2)
-            
             # Check for errors
             yield "🔍 Checking for errors...\n"
             try:
@@ -378,7 +399,8 @@ Generate ONLY the TypeScript/React code, no explanations."""
                 
                 yield f"⚠️ Found {len(errors)} error(s)\n"
                 
-                # Analyze and fix errors
+                # Analyze and fix errors, fixes are written together after the loop
+                pending_fixes: Dict[str, Dict[str, Any]] = {}
                 for idx, error in enumerate(errors[:3], 1):  # Fix max 3 errors per attempt
                     file_path = error.get('file_path', 'unknown')
                     line_number = error.get('line_number', 0)
@@ -388,17 +410,20 @@ Generate ONLY the TypeScript/React code, no explanations."""
                     yield f"\n{idx}. Fixing {file_path}:{line_number}\n"
                     yield f"   Error: {message}\n"
                     
-                    # Read the full file
-                    file_result = await self.execute_tool('read_files', {
-                        'file_paths': [file_path]
-                    })
-                    
-                    files = file_result.get('files', [])
-                    if not files:
-                        yield f"   ⚠️ Could not read file\n"
-                        continue
-                    
-                    file_content = files[0].get('content', '')
+                    # Read the full file, or the pending fix if this file was already fixed
+                    if file_path in pending_fixes:
+                        file_content = pending_fixes[file_path]['file_content']
+                    else:
+                        file_result = await self.execute_tool('read_files', {
+                            'file_paths': [file_path]
+                        })
+                        
+                        files = file_result.get('files', [])
+                        if not files:
+                            yield f"   ⚠️ Could not read file\n"
+                            continue
+                        
+                        file_content = files[0].get('content', '')
                     
                     # Ask AI to fix the error
                     fix_prompt = f"""Fix this error in the code:
@@ -438,27 +463,43 @@ Provide ONLY the complete fixed file content, no explanations."""
                                 fixed_code = '\n'.join(fixed_code.split('\n')[1:])
                             fixed_code = fixed_code.strip()
                         
-                        # Update the file
-                        update_result = await self.execute_tool('update_file', {
-                            'file_path': file_path,
-                            'file_content': fixed_code
-                        })
+                        fix = pending_fixes.setdefault(file_path, {'error_ids': []})
+                        fix['file_content'] = fixed_code
+                        if error.get('id'):
+                            fix['error_ids'].append(error['id'])
+                        yield f"   ✅ Prepared fix for {file_path}\n"
+                    
+                    except Exception as e:
+                        yield f"   ❌ Error fixing: {str(e)}\n"
+                
+                if pending_fixes:
+                    write_result = await self.execute_tool('batch_write_files', {
+                        'files': [
+                            {
+                                'file_path': path,
+                                'file_content': fix['file_content'],
+                                'language': _language_for_path(path),
+                            }
+                            for path, fix in pending_fixes.items()
+                        ]
+                    })
+                    
+                    if write_result.get('success'):
+                        # Fixes that still had syntax errors were not written
+                        for item in write_result.get('data', {}).get('invalid', []):
+                            pending_fixes.pop(item['file_path'], None)
+                            yield f"   ⚠️ Fix for {item['file_path']} has syntax errors, not saved\n"
+                        yield f"   ✅ Saved fixes for {len(pending_fixes)} file(s)\n"
                         
-                        if update_result.get('success'):
-                            yield f"   ✅ Fixed {file_path}\n"
-                            
-                            # Mark error as resolved
-                            error_id = error.get('id')
-                            if error_id:
+                        # Mark errors as resolved
+                        for fix in pending_fixes.values():
+                            for error_id in fix['error_ids']:
                                 await self.execute_tool('resolve_error', {
                                     'error_id': error_id,
                                     'resolution_notes': f'Auto-fixed in attempt {attempt}'
                                 })
-                        else:
-                            yield f"   ⚠️ Failed to update file: {update_result.get('error')}\n"
-                    
-                    except Exception as e:
-                        yield f"   ❌ Error fixing: {str(e)}\n"
+                    else:
+                        yield f"   ⚠️ Failed to save fixes: {write_result.get('error')}\n"
             
             except Exception as e:
                 yield f"❌ Error checking errors: {str(e)}\n"
@@ -1027,10 +1068,22 @@ Error Message: {error_message}
                     project_id=self.project_id,
                     file_path=parameters.get("file_path"),
                     file_content=parameters.get("file_content"),
+                    patch=parameters.get("patch"),
+                    edits=parameters.get("edits"),
+                    expected_hash=parameters.get("expected_hash"),
                     language=parameters.get("language")
                 )
                 result = await update_file(request)
-                return {"success": True, "message": result.message}
+                return {"success": True, "message": result.message, "data": result.data}
+            
+            elif tool_name == "batch_write_files":
+                from app.apis.ai_agent_tools import BatchWriteFile, BatchWriteRequest, batch_write_files
+                request = BatchWriteRequest(
+                    project_id=self.project_id,
+                    files=[BatchWriteFile(**f) for f in parameters.get("files", [])]
+                )
+                result = await batch_write_files(request)
+                return {"success": True, "message": result.message, "data": result.data}
             
             elif tool_name == "read_files":
                 from app.apis.ai_agent_tools import read_files
@@ -1044,10 +1097,19 @@ Error Message: {error_message}
                 from app.apis.ai_agent_tools import SearchCodeRequest, search_code
                 request = SearchCodeRequest(
                     project_id=self.project_id,
-                    query=parameters.get("query")
+                    keywords=[parameters.get("query")],
+                    max_results=parameters.get("max_results", 20)
+                )
+                return await search_code(request)
+            
+            elif tool_name == "find_symbol":
+                from app.apis.ai_agent_tools import FindSymbolRequest, find_symbol
+                request = FindSymbolRequest(
+                    project_id=self.project_id,
+                    name=parameters.get("name"),
+                    exact=parameters.get("exact", True)
                 )
-                results = await search_code(request)
-                return {"success": True, "results": [r.dict() for r in results]}
+                return await find_symbol(request)
             
             elif tool_name == "delete_file":
                 from app.apis.ai_agent_tools import DeleteFileRequest, delete_file
@@ -1081,11 +1143,8 @@ Error Message: {error_message}
             
             elif tool_name == "get_sql_schema":
                 from app.apis.ai_agent_tools import get_sql_schema
-                schema = await get_sql_schema(
-                    project_id=self.project_id,
-                    env=parameters.get("env", "dev")
-                )
-                return {"success": True, "schema": schema.schema if hasattr(schema, 'schema') else schema}
+                result = await get_sql_schema(project_id=self.project_id)
+                return {"success": True, "schema": result["schema"]}
             
             # Execution Tools
             elif tool_name == "run_python_script":
@@ -1180,9 +1239,29 @@ Error Message: {error_message}
             
             # Error Feedback Loop Tools
             elif tool_name == "trigger_build":
-                from app.apis.preview import build_preview
-                result = await build_preview(self.project_id)
-                return {"success": True, "message": "Build triggered"}
+                from app.apis.preview import preview_builds
+                build, _ = preview_builds.request(self.project_id)
+                if not parameters.get("wait", True):
+                    return {"success": True, "message": "Build triggered", "build_id": build.build_id, "build_status": build.status}
+                
+                # Completion is signalled by the build itself, no polling
+                try:
+                    await build.wait(BUILD_WAIT_TIMEOUT)
+                except asyncio.TimeoutError:
+                    return {
+                        "success": False,
+                        "error": f"Build did not finish within {BUILD_WAIT_TIMEOUT:.0f}s",
+                        "build_id": build.build_id,
+                        "build_status": build.status,
+                    }
+                return {
+                    "success": build.status == "succeeded",
+                    "message": f"Build {build.status}",
+                    "build_id": build.build_id,
+                    "build_status": build.status,
+                    "error": build.error,
+                    "result": build.result,
+                }
             
             elif tool_name == "get_open_errors":
                 from app.apis.ai_agent_tools import get_open_errors
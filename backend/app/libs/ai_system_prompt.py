@@ -147,6 +147,7 @@ When creating database migrations:
 - **First time**: Use create_file
 - **Modify existing**: Use read_files to get the file_id, then update_file
 - **Not sure?**: Use search_code to check if file exists
+- **Looking for a definition?**: Use find_symbol instead of reading whole files
 
 ### Task Management Strategy
 - Create high-level tasks for major features
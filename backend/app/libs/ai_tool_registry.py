@@ -169,24 +169,84 @@ def get_all_tools() -> List[Dict[str, Any]]:
             "type": "function",
             "function": {
                 "name": "update_file",
-                "description": "Update an existing file with new content. Creates a new version while preserving history.",
+                "description": "Update an existing file. Creates a new version while preserving history. For small changes send a patch or edits instead of the complete file content.",
                 "parameters": {
                     "type": "object",
                     "properties": {
-                        "file_id": {
+                        "file_path": {
                             "type": "string",
-                            "description": "UUID of the file to update"
+                            "description": "Path of the file to update"
                         },
                         "file_content": {
                             "type": "string",
-                            "description": "New complete file content"
+                            "description": "New complete file content (use only for large rewrites)"
+                        },
+                        "patch": {
+                            "type": "string",
+                            "description": "Unified diff to apply to the current content"
+                        },
+                        "edits": {
+                            "type": "array",
+                            "description": "Search/replace edits applied in order, each search text must match the file once",
+                            "items": {
+                                "type": "object",
+                                "properties": {
+                                    "search": {"type": "string"},
+                                    "replace": {"type": "string"}
+                                },
+                                "required": ["search", "replace"]
+                            }
+                        },
+                        "expected_hash": {
+                            "type": "string",
+                            "description": "content_hash from read_files, the update is rejected if the file changed since"
                         },
                         "description": {
                             "type": "string",
                             "description": "Description of what changed in this update"
                         }
                     },
-                    "required": ["file_id", "file_content"]
+                    "required": ["file_path"]
+                }
+            }
+        },
+        {
+            "type": "function",
+            "function": {
+                "name": "batch_write_files",
+                "description": "Create or update several files in one step. Prefer this over repeated create_file/update_file calls when writing more than one file. Files with syntax errors are auto-fixed when possible, otherwise they are not written and are listed under data.invalid.",
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "files": {
+                            "type": "array",
+                            "description": "Files to write",
+                            "items": {
+                                "type": "object",
+                                "properties": {
+                                    "file_path": {
+                                        "type": "string",
+                                        "description": "Path relative to project root"
+                                    },
+                                    "file_content": {
+                                        "type": "string",
+                                        "description": "Complete file content"
+                                    },
+                                    "language": {
+                                        "type": "string",
+                                        "enum": ["python", "typescript", "javascript", "sql", "json", "css", "html"],
+                                        "description": "Programming language"
+                                    },
+                                    "file_type": {
+                                        "type": "string",
+                                        "description": "Type of file, e.g. api, page, component"
+                                    }
+                                },
+                                "required": ["file_path", "file_content"]
+                            }
+                        }
+                    },
+                    "required": ["files"]
                 }
             }
         },
@@ -206,19 +266,44 @@ def get_all_tools() -> List[Dict[str, Any]]:
             "type": "function",
             "function": {
                 "name": "search_code",
-                "description": "Search for specific code patterns or keywords across all project files.",
+                "description": "Search for specific code patterns or keywords across all project files. Returns matching line snippets with context, best matching files first.",
                 "parameters": {
                     "type": "object",
                     "properties": {
                         "query": {
                             "type": "string",
                             "description": "Search query (code snippet, function name, keyword, etc.)"
+                        },
+                        "max_results": {
+                            "type": "integer",
+                            "description": "Maximum number of files to return (default 20)"
                         }
                     },
                     "required": ["query"]
                 }
             }
         },
+        {
+            "type": "function",
+            "function": {
+                "name": "find_symbol",
+                "description": "Find where a function, class, component, interface, type or variable is defined. Returns file path and line number.",
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "name": {
+                            "type": "string",
+                            "description": "Symbol name, e.g. 'UserCard' or 'get_user'"
+                        },
+                        "exact": {
+                            "type": "boolean",
+                            "description": "Match the whole name (default true). Set false to match names containing it."
+                        }
+                    },
+                    "required": ["name"]
+                }
+            }
+        },
         {
             "type": "function",
             "function": {
@@ -0,0 +1,266 @@
+"""Output of project backend processes.
+
+Project backends used to be started with stdout and stderr piped but never
+read: once a pipe buffer (64 KiB) filled up, the backend blocked on its next
+log line and hung. ``backend_logs.attach(project_id, process)`` now drains
+both pipes continuously on the event loop into a per-project ring buffer:
+
+- the buffer keeps the last BACKEND_LOG_LINES lines, lines longer than
+  BACKEND_LOG_MAX_LINE bytes are truncated, so memory per backend is bounded
+  no matter how chatty it is
+- once the backend exits the buffer shrinks to its last
+  BACKEND_LOG_STOPPED_LINES lines, and only the BACKEND_LOG_MAX_STOPPED most
+  recently stopped backends keep a log at all, so memory follows the number
+  of running backends rather than every project ever started
+- followers get new lines through bounded queues, slow followers lose their
+  oldest lines instead of growing the queue
+- with BACKEND_LOG_PERSIST=1 lines are also written to project_logs, in one
+  batched INSERT every BACKEND_LOG_FLUSH_INTERVAL seconds; at most
+  BACKEND_LOG_MAX_PENDING lines wait for a flush, older ones are dropped
+
+Lines are leveled by uvicorn's ``LEVEL:`` prefix, unprefixed lines (such as
+tracebacks) take the level of the previous line on the same stream.
+"""
+
+import asyncio
+import json
+import os
+import re
+import subprocess
+import time
+from collections import OrderedDict, deque
+from datetime import datetime, timezone
+from typing import IO, Any, Deque, Dict, List, Optional, Set, Tuple
+from uuid import UUID
+
+from app.libs.database import db_connection
+
+BACKEND_LOG_LINES = int(os.environ.get("BACKEND_LOG_LINES", 2000))
+BACKEND_LOG_MAX_LINE = int(os.environ.get("BACKEND_LOG_MAX_LINE", 4096))
+BACKEND_LOG_STOPPED_LINES = int(os.environ.get("BACKEND_LOG_STOPPED_LINES", 200))
+BACKEND_LOG_MAX_STOPPED = int(os.environ.get("BACKEND_LOG_MAX_STOPPED", 50))
+BACKEND_LOG_PERSIST = os.environ.get("BACKEND_LOG_PERSIST", "0").lower() in ("1", "true", "yes")
+BACKEND_LOG_FLUSH_INTERVAL = float(os.environ.get("BACKEND_LOG_FLUSH_INTERVAL", 2))
+BACKEND_LOG_MAX_PENDING = int(os.environ.get("BACKEND_LOG_MAX_PENDING", 10000))
+
+READ_CHUNK = 64 * 1024
+LEVEL_PREFIX = re.compile(r"^(DEBUG|INFO|WARNING|ERROR|CRITICAL):")
+
+
+class BackendLog:
+    """Ring buffer of one project's backend output."""
+
+    def __init__(self, project_id: str, max_lines: int = BACKEND_LOG_LINES):
+        self.project_id = project_id
+        self.lines: Deque[Dict[str, Any]] = deque(maxlen=max_lines)
+        self.total = 0
+        self.truncated = 0
+        self._seq = 0
+        self._levels: Dict[str, str] = {}
+        self._subscribers: Set[asyncio.Queue] = set()
+
+    def append(self, stream: str, text: str, truncated: bool = False) -> Dict[str, Any]:
+        match = LEVEL_PREFIX.match(text)
+        if match:
+            self._levels[stream] = match.group(1)
+        self._seq += 1
+        self.total += 1
+        if truncated:
+            self.truncated += 1
+        line = {
+            "seq": self._seq,
+            "time": time.time(),
+            "stream": stream,
+            "level": self._levels.get(stream, "INFO"),
+            "message": text,
+        }
+        self.lines.append(line)
+        for queue in self._subscribers:
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(line)
+        return line
+
+    def resize(self, max_lines: int):
+        """Keep at most max_lines lines from now on, dropping the oldest."""
+        if self.lines.maxlen != max_lines:
+            self.lines = deque(self.lines, maxlen=max_lines)
+
+    def tail(self, lines: int = 100, after: int = 0) -> List[Dict[str, Any]]:
+        """The last lines with seq > after."""
+        newer = [line for line in self.lines if line["seq"] > after]
+        return newer[-lines:] if lines > 0 else []
+
+    def subscribe(self, after: Optional[int] = None) -> asyncio.Queue:
+        """Queue of new lines, starting with buffered lines with seq > after."""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.lines.maxlen)
+        if after is not None:
+            for line in self.lines:
+                if line["seq"] > after:
+                    queue.put_nowait(line)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers.discard(queue)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "buffered": len(self.lines),
+            "total": self.total,
+            "truncated": self.truncated,
+            "followers": len(self._subscribers),
+        }
+
+
+class BackendLogManager:
+    """Drains backend pipes into BackendLogs, optionally persists them."""
+
+    def __init__(self, persist: bool = BACKEND_LOG_PERSIST):
+        self.persist = persist
+        self.dropped = 0
+        # Stopped backends move to the end, the oldest stopped are evicted first
+        self._logs: "OrderedDict[str, BackendLog]" = OrderedDict()
+        self._readers: Dict[str, List[asyncio.Task]] = {}
+        self._pending: Deque[Tuple[UUID, str, str, str, datetime]] = deque(maxlen=BACKEND_LOG_MAX_PENDING)
+        self._flusher: Optional[asyncio.Task] = None
+
+    def get(self, project_id: str) -> Optional[BackendLog]:
+        return self._logs.get(project_id)
+
+    def attach(self, project_id: str, process: subprocess.Popen):
+        """Start draining the process's stdout and stderr (binary pipes)."""
+        log = self._logs.get(project_id)
+        if log is None:
+            log = self._logs[project_id] = BackendLog(project_id)
+        log.resize(BACKEND_LOG_LINES)
+        for task in self._readers.pop(project_id, []):
+            task.cancel()
+        tasks = [
+            asyncio.create_task(self._drain(log, name, pipe))
+            for name, pipe in (("stdout", process.stdout), ("stderr", process.stderr))
+            if pipe is not None
+        ]
+        self._readers[project_id] = tasks
+        for task in tasks:
+            task.add_done_callback(lambda _: self._on_drained(project_id, tasks))
+
+    def _on_drained(self, project_id: str, tasks: List[asyncio.Task]):
+        """Shrink the log once both pipes of the backend are closed."""
+        if self._readers.get(project_id) is not tasks or not all(t.done() for t in tasks):
+            # Replaced by a newer attach(), or the other pipe is still open
+            return
+        del self._readers[project_id]
+        log = self._logs.get(project_id)
+        if log is None:
+            return
+        log.resize(BACKEND_LOG_STOPPED_LINES)
+        self._logs.move_to_end(project_id)
+        stopped = [pid for pid in self._logs if pid not in self._readers]
+        for pid in stopped[:max(0, len(stopped) - BACKEND_LOG_MAX_STOPPED)]:
+            del self._logs[pid]
+
+    async def _drain(self, log: BackendLog, stream: str, pipe: IO[bytes]):
+        loop = asyncio.get_running_loop()
+        reader = asyncio.StreamReader(limit=READ_CHUNK)
+        transport, _ = await loop.connect_read_pipe(
+            lambda: asyncio.StreamReaderProtocol(reader), pipe
+        )
+        partial = b""
+        dropping = False  # Rest of an overlong line
+        try:
+            while True:
+                # Chunks instead of readline(), which buffers a whole line
+                chunk = await reader.read(READ_CHUNK)
+                if not chunk:
+                    break
+                *complete, partial = (partial + chunk).split(b"\n")
+                for raw in complete:
+                    if dropping:
+                        dropping = False
+                        continue
+                    self._add(log, stream, raw)
+                if len(partial) > BACKEND_LOG_MAX_LINE:
+                    if not dropping:
+                        self._add(log, stream, partial, truncated=True)
+                    dropping = True
+                    partial = b""
+            if partial and not dropping:
+                self._add(log, stream, partial)
+        finally:
+            transport.close()
+
+    def _add(self, log: BackendLog, stream: str, raw: bytes, truncated: bool = False):
+        truncated = truncated or len(raw) > BACKEND_LOG_MAX_LINE
+        text = raw[:BACKEND_LOG_MAX_LINE].decode("utf-8", errors="replace").rstrip("\r")
+        if not text:
+            return
+        line = log.append(stream, text, truncated)
+        if self.persist:
+            self._queue(log.project_id, line)
+
+    def _queue(self, project_id: str, line: Dict[str, Any]):
+        try:
+            project_uuid = UUID(project_id)
+        except ValueError:
+            return
+        if len(self._pending) == self._pending.maxlen:
+            self.dropped += 1
+        self._pending.append((
+            project_uuid,
+            line["level"],
+            line["message"],
+            json.dumps({"source": "backend", "stream": line["stream"]}),
+            datetime.fromtimestamp(line["time"], timezone.utc),
+        ))
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(BACKEND_LOG_FLUSH_INTERVAL)
+            await self.flush()
+
+    async def flush(self):
+        """Write all pending lines in one INSERT."""
+        if not self._pending:
+            return
+        batch = list(self._pending)
+        self._pending.clear()
+        try:
+            async with db_connection() as conn:
+                await conn.execute(
+                    """
+                    INSERT INTO project_logs (project_id, level, message, metadata, created_at)
+                    SELECT * FROM unnest($1::uuid[], $2::text[], $3::text[], $4::jsonb[], $5::timestamptz[])
+                    """,
+                    *(list(column) for column in zip(*batch)),
+                )
+        except Exception as e:
+            print(f"[BACKEND-LOGS] ⚠️ Failed to write {len(batch)} log lines: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "persist": self.persist,
+            "pending": len(self._pending),
+            "dropped": self.dropped,
+            "projects": {project_id: log.stats() for project_id, log in self._logs.items()},
+        }
+
+    async def stop(self):
+        """Stop the flusher and write what is left, called on shutdown."""
+        for tasks in self._readers.values():
+            for task in tasks:
+                task.cancel()
+        self._readers = {}
+        if self._flusher is not None:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
+        await self.flush()
+
+
+backend_logs = BackendLogManager()
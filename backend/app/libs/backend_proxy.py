@@ -0,0 +1,243 @@
+"""Pooled HTTP client for talking to project backends.
+
+Every request to a project backend, proxied traffic and health probes alike,
+goes through one shared keep-alive ``httpx.AsyncClient``, so connections to
+a backend are reused instead of opened per request. Request and response
+bodies are streamed chunk by chunk: a slow client slows down the read from
+the backend instead of the response being buffered in memory.
+
+Each backend gets at most PROXY_MAX_CONNECTIONS_PER_BACKEND requests in
+flight (a slot is held until the response body is fully sent), further
+requests wait up to PROXY_POOL_TIMEOUT seconds for a slot.
+
+Latency until the response headers arrive and bytes in both directions are
+recorded per project, see ``stats()``.
+"""
+
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Deque, Dict, Iterable, Optional, Tuple
+
+import httpx
+
+PROXY_CONNECT_TIMEOUT = float(os.environ.get("PROXY_CONNECT_TIMEOUT", 5))
+# Between two chunks, long polling and streaming endpoints need a high value
+PROXY_READ_TIMEOUT = float(os.environ.get("PROXY_READ_TIMEOUT", 300))
+PROXY_POOL_TIMEOUT = float(os.environ.get("PROXY_POOL_TIMEOUT", 30))
+PROXY_MAX_CONNECTIONS_PER_BACKEND = int(os.environ.get("PROXY_MAX_CONNECTIONS_PER_BACKEND", 20))
+PROXY_MAX_KEEPALIVE = int(os.environ.get("PROXY_MAX_KEEPALIVE", 200))
+PROXY_KEEPALIVE_EXPIRY = float(os.environ.get("PROXY_KEEPALIVE_EXPIRY", 30))
+
+# Latencies kept per project for percentiles
+LATENCY_SAMPLES = 500
+
+# Connection specific headers, never forwarded (RFC 9110 section 7.6.1)
+HOP_BY_HOP_HEADERS = {
+    "connection",
+    "keep-alive",
+    "proxy-authenticate",
+    "proxy-authorization",
+    "te",
+    "trailer",
+    "transfer-encoding",
+    "upgrade",
+}
+
+
+class ProxyError(Exception):
+    def __init__(self, message: str, status_code: int = 502):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def _percentile(samples: Iterable[float], fraction: float) -> Optional[float]:
+    ordered = sorted(samples)
+    if not ordered:
+        return None
+    return round(ordered[min(len(ordered) - 1, int(len(ordered) * fraction))], 1)
+
+
+class ProjectProxyMetrics:
+    """Counters of one project's proxied traffic."""
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.bytes_in = 0  # Request bodies, client to backend
+        self.bytes_out = 0  # Response bodies, backend to client
+        self.latencies_ms: Deque[float] = deque(maxlen=LATENCY_SAMPLES)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "in_flight": self.in_flight,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "latency_p50_ms": _percentile(self.latencies_ms, 0.5),
+            "latency_p95_ms": _percentile(self.latencies_ms, 0.95),
+            "latency_max_ms": round(max(self.latencies_ms), 1) if self.latencies_ms else None,
+        }
+
+
+class ProxiedResponse:
+    """A backend response whose body has not been read yet.
+
+    Iterate ``body()`` to stream it, ``aclose()`` releases the connection
+    and the backend slot and is safe to call more than once.
+    """
+
+    def __init__(self, response: httpx.Response, metrics: ProjectProxyMetrics, slot: asyncio.Semaphore):
+        self.status_code = response.status_code
+        self.headers = [
+            (name, value)
+            for name, value in response.headers.multi_items()
+            if name.lower() not in HOP_BY_HOP_HEADERS
+        ]
+        self._response = response
+        self._metrics = metrics
+        self._slot = slot
+        self._closed = False
+
+    async def body(self) -> AsyncIterator[bytes]:
+        try:
+            # Raw, so compressed bodies are passed through as they are
+            async for chunk in self._response.aiter_raw():
+                self._metrics.bytes_out += len(chunk)
+                yield chunk
+        except httpx.HTTPError:
+            self._metrics.errors += 1
+            raise
+        finally:
+            await self.aclose()
+
+    async def aclose(self):
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            await self._response.aclose()
+        finally:
+            self._metrics.in_flight -= 1
+            self._slot.release()
+
+
+class BackendProxy:
+    """Shared client, per-backend slots and per-project metrics."""
+
+    def __init__(self, max_connections_per_backend: int = PROXY_MAX_CONNECTIONS_PER_BACKEND):
+        self.max_connections_per_backend = max_connections_per_backend
+        self._client: Optional[httpx.AsyncClient] = None
+        # By port, ports are reused, so this stays bounded
+        self._slots: Dict[int, asyncio.Semaphore] = {}
+        self._metrics: Dict[str, ProjectProxyMetrics] = {}
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(
+                    connect=PROXY_CONNECT_TIMEOUT,
+                    read=PROXY_READ_TIMEOUT,
+                    write=PROXY_READ_TIMEOUT,
+                    pool=PROXY_POOL_TIMEOUT,
+                ),
+                limits=httpx.Limits(
+                    max_connections=None,  # Bounded per backend by the slots
+                    max_keepalive_connections=PROXY_MAX_KEEPALIVE,
+                    keepalive_expiry=PROXY_KEEPALIVE_EXPIRY,
+                ),
+                follow_redirects=False,
+                trust_env=False,
+            )
+        return self._client
+
+    def metrics(self, project_id: str) -> ProjectProxyMetrics:
+        metrics = self._metrics.get(project_id)
+        if metrics is None:
+            metrics = self._metrics[project_id] = ProjectProxyMetrics()
+        return metrics
+
+    async def health(self, port: int, timeout: float = 2.0) -> bool:
+        """True if the backend on port answers /health with 200."""
+        try:
+            response = await self.client.get(f"http://127.0.0.1:{port}/health", timeout=timeout)
+        except httpx.HTTPError:
+            return False
+        return response.status_code == 200
+
+    async def open(
+        self,
+        project_id: str,
+        port: int,
+        method: str,
+        path: str,
+        query: str,
+        headers: Iterable[Tuple[str, str]],
+        body: Optional[AsyncIterator[bytes]] = None,
+    ) -> ProxiedResponse:
+        """Send a request to the backend on port, returns once headers arrived.
+
+        The caller must stream or ``aclose()`` the returned response.
+        """
+        metrics = self.metrics(project_id)
+        slot = self._slots.setdefault(port, asyncio.Semaphore(self.max_connections_per_backend))
+        try:
+            await asyncio.wait_for(slot.acquire(), PROXY_POOL_TIMEOUT)
+        except asyncio.TimeoutError:
+            metrics.errors += 1
+            raise ProxyError(f"Backend for project {project_id} is busy", status_code=503)
+
+        metrics.requests += 1
+        metrics.in_flight += 1
+
+        async def counted(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+            async for chunk in chunks:
+                metrics.bytes_in += len(chunk)
+                yield chunk
+
+        request = self.client.build_request(
+            method,
+            httpx.URL(f"http://127.0.0.1:{port}{path}", query=query.encode("latin-1")),
+            headers=[(name, value) for name, value in headers if name.lower() not in HOP_BY_HOP_HEADERS],
+            content=counted(body) if body is not None else None,
+        )
+        started = time.perf_counter()
+        try:
+            response = await self.client.send(request, stream=True)
+        except httpx.TimeoutException as e:
+            metrics.errors += 1
+            metrics.in_flight -= 1
+            slot.release()
+            raise ProxyError(f"Backend for project {project_id} timed out: {e}", status_code=504)
+        except httpx.HTTPError as e:
+            metrics.errors += 1
+            metrics.in_flight -= 1
+            slot.release()
+            raise ProxyError(f"Backend for project {project_id} unreachable: {e}")
+        except BaseException:
+            metrics.in_flight -= 1
+            slot.release()
+            raise
+        metrics.latencies_ms.append((time.perf_counter() - started) * 1000)
+        return ProxiedResponse(response, metrics, slot)
+
+    def stats(self, project_id: Optional[str] = None) -> Dict[str, Any]:
+        if project_id is not None:
+            return self.metrics(project_id).to_dict()
+        return {
+            "max_connections_per_backend": self.max_connections_per_backend,
+            "projects": {pid: m.to_dict() for pid, m in self._metrics.items()},
+        }
+
+    async def close(self):
+        """Close the shared client, called on shutdown."""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+backend_proxy = BackendProxy()
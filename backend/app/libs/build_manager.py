@@ -0,0 +1,413 @@
+"""Non-blocking preview build orchestration.
+
+Builds run as background tasks so requests return a build ID immediately.
+``BuildManager`` bounds how many builds run at once (BUILD_MAX_CONCURRENCY)
+and coalesces requests per project: while a build for a project is queued,
+further requests join it instead of starting another one. A request that
+arrives while a build is running queues exactly one follow-up build, since
+files may have changed after the running build read them.
+
+Every published event (log lines, command output, status, spans) gets a
+sequence number and is kept in a ring buffer of BUILD_EVENT_BUFFER events,
+so subscribers that arrive late or reconnect replay what they missed.
+
+Runners record timing spans per phase with ``start_span()``/``end_span()``,
+``on_finish`` is awaited after each build (history, metrics).
+
+External commands run through ``run_command()`` which uses
+``asyncio.create_subprocess_exec`` and streams stdout/stderr line by line
+to the build's subscribers instead of blocking the event loop. Output is
+read in chunks by ``read_lines()``, lines longer than COMMAND_MAX_LINE are
+truncated instead of failing the read, and only the last
+COMMAND_OUTPUT_LINES lines per stream are kept in the result. Commands run
+in their own process group which is killed as a whole on timeout or
+cancellation, so Vite/esbuild children do not outlive them.
+``set_command_limits()`` caps the CPU time, memory and priority of those
+commands; other long-lived children (Vite watchers, type checkers) apply
+the same limits through ``command_preexec()``.
+"""
+
+import asyncio
+import os
+import resource
+import signal
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Sequence, Set, Tuple
+from uuid import uuid4
+
+BUILD_MAX_CONCURRENCY = int(os.environ.get("BUILD_MAX_CONCURRENCY", 2))
+BUILD_HISTORY_SIZE = int(os.environ.get("BUILD_HISTORY_SIZE", 200))
+BUILD_EVENT_BUFFER = int(os.environ.get("BUILD_EVENT_BUFFER", 2000))
+COMMAND_MAX_LINE = int(os.environ.get("COMMAND_MAX_LINE", 8192))
+COMMAND_OUTPUT_LINES = int(os.environ.get("COMMAND_OUTPUT_LINES", 2000))
+_READ_CHUNK = 64 * 1024
+
+
+class BuildError(Exception):
+    """A build failed, status_code is used when the result is awaited over HTTP."""
+
+    def __init__(self, message: str, status_code: int = 500):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class BuildTimeout(BuildError):
+    pass
+
+
+@dataclass
+class CommandResult:
+    returncode: int
+    stdout: str
+    stderr: str
+
+
+class Build:
+    """State of a single build, shared by everyone waiting on it."""
+
+    def __init__(self, project_id: str, build_id: Optional[str] = None):
+        self.build_id = build_id or str(uuid4())
+        self.project_id = project_id
+        self.status = "queued"
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.logs: List[str] = []
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self.status_code: Optional[int] = None
+        self.spans: List[Dict[str, Any]] = []
+        self.events: deque = deque(maxlen=BUILD_EVENT_BUFFER)
+        self._seq = 0
+        self._clock = time.perf_counter()
+        self._done = asyncio.Event()
+        self._subscribers: Set[asyncio.Queue] = set()
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def log(self, message: str):
+        """Add a line to the build log and publish it."""
+        self.logs.append(message)
+        self.publish({"type": "log", "message": message})
+
+    def publish(self, event: Dict[str, Any]):
+        self._seq += 1
+        event = {"build_id": self.build_id, "seq": self._seq, **event}
+        self.events.append(event)
+        for queue in list(self._subscribers):
+            if queue.full():
+                # Slow subscriber, drop its oldest event instead of growing without bound
+                queue.get_nowait()
+            queue.put_nowait(event)
+
+    def subscribe(self, after: Optional[int] = 0) -> asyncio.Queue:
+        """Queue of events, starting with buffered events with seq > after.
+
+        Pass after=None to only receive new events.
+        """
+        queue: asyncio.Queue = asyncio.Queue(maxsize=BUILD_EVENT_BUFFER)
+        if after is not None:
+            for event in self.events:
+                if event["seq"] > after:
+                    queue.put_nowait(event)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers.discard(queue)
+
+    def _elapsed_ms(self) -> float:
+        return (time.perf_counter() - self._clock) * 1000
+
+    def start_span(self, name: str, **attrs) -> Dict[str, Any]:
+        """Start timing a phase, attrs are stored with it (counts, cache hits)."""
+        span = {"name": name, "start_ms": round(self._elapsed_ms(), 1), "duration_ms": None, **attrs}
+        self.spans.append(span)
+        return span
+
+    def end_span(self, span: Dict[str, Any], **attrs):
+        span.update(attrs)
+        span["duration_ms"] = round(self._elapsed_ms() - span["start_ms"], 1)
+        self.publish({"type": "span", "span": span})
+
+    def mark_running(self):
+        self.started_at = time.time()
+        # Span offsets are relative to the start of the run, not the queueing
+        self._clock = time.perf_counter()
+        self.set_status("running")
+
+    def set_status(self, status: str):
+        self.status = status
+        self.publish({"type": "status", "status": status})
+
+    def finish(self, result: Optional[Dict[str, Any]] = None, error: Optional[BuildError] = None):
+        self.finished_at = time.time()
+        for span in self.spans:
+            if span["duration_ms"] is None:
+                self.end_span(span, aborted=True)
+        if error is None:
+            self.result = result
+            self.set_status("succeeded")
+        else:
+            self.error = str(error)
+            self.status_code = error.status_code
+            self.set_status("failed")
+        self._done.set()
+        self.publish({"type": "done", "status": self.status})
+
+    async def wait(self, timeout: Optional[float] = None) -> "Build":
+        await asyncio.wait_for(self._done.wait(), timeout)
+        return self
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "build_id": self.build_id,
+            "project_id": self.project_id,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "duration_ms": round((self.finished_at - self.started_at) * 1000)
+            if self.finished_at and self.started_at
+            else None,
+            "queue_ms": round((self.started_at - self.created_at) * 1000)
+            if self.started_at
+            else None,
+            "spans": self.spans,
+            "error": self.error,
+            "result": self.result,
+            "logs": self.logs,
+        }
+
+
+BuildRunner = Callable[[Build], Awaitable[Dict[str, Any]]]
+BuildHook = Callable[[Build], Awaitable[None]]
+
+
+class BuildManager:
+    """Queues, coalesces and runs builds with bounded concurrency."""
+
+    def __init__(
+        self,
+        runner: BuildRunner,
+        max_concurrency: int = BUILD_MAX_CONCURRENCY,
+        history_size: int = BUILD_HISTORY_SIZE,
+        on_finish: Optional[BuildHook] = None,
+    ):
+        self.runner = runner
+        self.on_finish = on_finish
+        self.max_concurrency = max_concurrency
+        self.history_size = history_size
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._builds: "OrderedDict[str, Build]" = OrderedDict()
+        self._queued: Dict[str, Build] = {}
+        self._latest: Dict[str, Build] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+    def request(self, project_id: str) -> Tuple[Build, bool]:
+        """Request a build, returns (build, coalesced)."""
+        project_id = str(project_id)
+        queued = self._queued.get(project_id)
+        if queued is not None:
+            return queued, True
+
+        previous = self._latest.get(project_id)
+        build = Build(project_id)
+        self._queued[project_id] = build
+        self._latest[project_id] = build
+        self._builds[build.build_id] = build
+        while len(self._builds) > self.history_size:
+            _, old = self._builds.popitem(last=False)
+            if old.done and self._latest.get(old.project_id) is old:
+                del self._latest[old.project_id]
+
+        task = asyncio.create_task(self._run(build, previous))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return build, False
+
+    def get(self, build_id: str) -> Optional[Build]:
+        return self._builds.get(build_id)
+
+    def latest(self, project_id: str) -> Optional[Build]:
+        return self._latest.get(str(project_id))
+
+    async def _run(self, build: Build, previous: Optional[Build]):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        try:
+            # Never build the same workspace twice at the same time
+            if previous is not None and not previous.done:
+                await previous._done.wait()
+
+            async with self._semaphore:
+                self._queued.pop(build.project_id, None)
+                await execute_build(build, self.runner)
+            await self._finished(build)
+        except asyncio.CancelledError:
+            if not build.done:
+                build.finish(error=BuildError("Build cancelled", status_code=503))
+            raise
+        finally:
+            if self._queued.get(build.project_id) is build:
+                self._queued.pop(build.project_id, None)
+
+    async def _finished(self, build: Build):
+        if self.on_finish is None:
+            return
+        try:
+            await self.on_finish(build)
+        except Exception as e:
+            print(f"[BUILD] ⚠️ on_finish failed for build {build.build_id}: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        running = [b for b in self._builds.values() if b.status == "running"]
+        return {
+            "max_concurrency": self.max_concurrency,
+            "running": len(running),
+            "queued": len(self._queued),
+        }
+
+    async def stop(self):
+        """Cancel outstanding builds, called on shutdown."""
+        for task in list(self._tasks):
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+async def execute_build(build: Build, runner: BuildRunner):
+    """Run a build to completion, failures are recorded on the build."""
+    build.mark_running()
+    try:
+        result = await runner(build)
+    except BuildError as e:
+        build.finish(error=e)
+    except Exception as e:
+        build.finish(error=BuildError(f"Build error: {e}"))
+    else:
+        build.finish(result=result)
+
+
+# (cpu_seconds, memory_mb, nice) applied to every command, 0 means unlimited
+_command_limits: Tuple[int, int, int] = (0, 0, 0)
+
+
+def set_command_limits(cpu_seconds: int = 0, memory_mb: int = 0, nice: int = 0):
+    """Limit CPU time, memory and priority of commands started by run_command()."""
+    global _command_limits
+    _command_limits = (cpu_seconds, memory_mb, nice)
+
+
+def command_preexec() -> Optional[Callable[[], None]]:
+    """preexec_fn applying the command limits, None without limits."""
+    return _apply_command_limits if any(_command_limits) else None
+
+
+def _apply_command_limits():
+    # Runs in the forked child before exec
+    cpu_seconds, memory_mb, nice = _command_limits
+    if nice:
+        os.nice(nice)
+    if cpu_seconds:
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds + 5))
+    if memory_mb:
+        # RLIMIT_DATA rather than RLIMIT_AS, V8 reserves far more address
+        # space than it ever uses
+        limit = memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_DATA, (limit, limit))
+
+
+async def run_command(
+    build: Build,
+    args: Sequence[str],
+    cwd,
+    timeout: Optional[float] = None,
+    env: Optional[Dict[str, str]] = None,
+) -> CommandResult:
+    """Run a command without blocking the loop, streaming its output."""
+    process = await asyncio.create_subprocess_exec(
+        *args,
+        cwd=cwd,
+        env=env,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        preexec_fn=command_preexec(),
+        # Own process group so children are killed with it
+        start_new_session=True,
+    )
+
+    stdout: deque = deque(maxlen=COMMAND_OUTPUT_LINES)
+    stderr: deque = deque(maxlen=COMMAND_OUTPUT_LINES)
+
+    async def pump(stream: asyncio.StreamReader, lines: deque, name: str):
+        async for line in read_lines(stream):
+            lines.append(line)
+            build.publish({"type": "output", "stream": name, "line": line})
+
+    readers = asyncio.gather(
+        pump(process.stdout, stdout, "stdout"),
+        pump(process.stderr, stderr, "stderr"),
+    )
+    try:
+        await asyncio.wait_for(asyncio.shield(readers), timeout)
+        await process.wait()
+    except asyncio.TimeoutError:
+        await _kill(process, readers)
+        raise BuildTimeout(f"{args[0]} timed out after {timeout:.0f}s")
+    except BaseException:
+        await _kill(process, readers)
+        raise
+
+    return CommandResult(process.returncode, "\n".join(stdout), "\n".join(stderr))
+
+
+async def _kill(process: asyncio.subprocess.Process, readers: asyncio.Future):
+    if process.returncode is None:
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+    readers.cancel()
+    # Retrieve the readers' exception so it is not logged as never retrieved
+    readers.add_done_callback(lambda f: f.cancelled() or f.exception())
+    await process.wait()
+
+
+async def read_lines(
+    stream: asyncio.StreamReader, max_line: int = COMMAND_MAX_LINE
+) -> AsyncIterator[str]:
+    """Decoded lines of stream, overlong lines are cut at max_line bytes.
+
+    Reads chunks instead of iterating the stream, which raises ValueError
+    on lines longer than the StreamReader limit (minified code frames).
+    """
+    partial = b""
+    dropping = False  # Rest of an overlong line
+    while True:
+        chunk = await stream.read(_READ_CHUNK)
+        if not chunk:
+            break
+        *complete, partial = (partial + chunk).split(b"\n")
+        for raw in complete:
+            if dropping:
+                dropping = False
+                continue
+            yield _decode_line(raw, max_line)
+        if len(partial) > max_line:
+            if not dropping:
+                yield _decode_line(partial, max_line)
+            dropping = True
+            partial = b""
+    if partial and not dropping:
+        yield _decode_line(partial, max_line)
+
+
+def _decode_line(raw: bytes, max_line: int) -> str:
+    line = raw[:max_line].decode("utf-8", errors="replace").rstrip("\r")
+    return line + " …[truncated]" if len(raw) > max_line else line
@@ -0,0 +1,470 @@
+"""Preview build worker processes.
+
+Cold preview builds (npm, Vite, hashing and compressing the dist) are CPU
+heavy and used to run inside the API process. With BUILD_WORKERS > 0 the
+API process only queues them:
+
+- ``BuildWorkerPool.dispatch()`` inserts a row into ``preview_build_jobs``
+  and NOTIFYs ``preview_build_jobs``
+- worker processes (``python -m app.libs.build_worker``) claim queued jobs
+  with ``FOR UPDATE SKIP LOCKED``, run ``_run_preview_build`` and write the
+  result back to the row
+- build events (logs, command output, spans) are relayed in batches over
+  NOTIFY ``preview_build_events`` to the API process, which republishes
+  them on its ``Build`` so streaming, history and metrics work unchanged
+
+Workers run with a lower CPU priority (BUILD_WORKER_NICE) and the commands
+they start are capped to BUILD_WORKER_CPU_SECONDS of CPU time and
+BUILD_WORKER_MEMORY_MB of memory per command. Builds of the same project are
+serialized with ``workspace_lock()``, the shared node_modules and artifact
+stores take cross-process file locks. The pool is started from the app
+lifespan, keeps the workers running and fails the jobs of a worker that
+died. Workers are off by default (BUILD_WORKERS=0), BUILD_WORKERS=auto
+starts one per core but the last. Everything runs on the local host,
+Postgres is only used as the queue.
+
+A job not finished within BUILD_JOB_TIMEOUT is given up by the API process,
+which NOTIFYs ``preview_build_cancel``; the worker then cancels the build,
+which kills its running command. Workers enforce the same timeout
+themselves in case the notification is missed.
+
+Each worker opens its own database pool, capped at BUILD_WORKER_DB_POOL_SIZE
+connections (plus one LISTEN connection), and runs at most
+BUILD_WORKER_TYPECHECK_SERVERS type checkers.
+
+Workers never start Vite watchers, a watcher has to live in the API process
+which routes a project's builds to it. Instead the API process starts the
+watcher after a cold build on a worker (PREVIEW_WATCH_AUTOSTART), from then
+on the project is built in the API process, its rebuilds already happen in
+the watcher and take milliseconds. So that those builds do not compete with
+API traffic either, ``limit_local_commands()`` gives every command the API
+process starts (npm, watchers, type checkers, dist compression) the
+workers' priority and limits.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from app.libs.build_manager import Build, BuildError, BuildTimeout, execute_build, set_command_limits
+from app.libs.database import close_db_pool, db_connection, get_db_connection, init_db_pool
+from app.libs.preview_registry import preview_registry, workspace_lock
+
+
+def _worker_count() -> int:
+    value = os.environ.get("BUILD_WORKERS", "0")
+    if value == "auto":
+        return max(1, (os.cpu_count() or 2) - 1)
+    try:
+        return max(0, int(value))
+    except ValueError:
+        return 0
+
+
+BUILD_WORKERS = _worker_count()
+BUILD_WORKER_NICE = int(os.environ.get("BUILD_WORKER_NICE", 10))
+BUILD_WORKER_CPU_SECONDS = int(os.environ.get("BUILD_WORKER_CPU_SECONDS", 600))
+BUILD_WORKER_MEMORY_MB = int(os.environ.get("BUILD_WORKER_MEMORY_MB", 4096))
+# Safety net for missed notifications, jobs are normally picked up immediately
+BUILD_WORKER_POLL_INTERVAL = float(os.environ.get("BUILD_WORKER_POLL_INTERVAL", 10))
+BUILD_JOB_TIMEOUT = float(os.environ.get("BUILD_JOB_TIMEOUT", 900))
+BUILD_WORKER_DB_POOL_SIZE = int(os.environ.get("BUILD_WORKER_DB_POOL_SIZE", 3))
+BUILD_WORKER_TYPECHECK_SERVERS = int(os.environ.get("BUILD_WORKER_TYPECHECK_SERVERS", 1))
+
+JOBS_CHANNEL = "preview_build_jobs"
+EVENTS_CHANNEL = "preview_build_events"
+CANCEL_CHANNEL = "preview_build_cancel"
+
+# Postgres rejects NOTIFY payloads of 8000 bytes or more
+_MAX_PAYLOAD = 7000
+_MAX_LINE = 2000
+_RELAYED_EVENTS = {"log", "output", "span"}
+_RESTART_DELAY = 2
+
+
+def _truncate(event: Dict[str, Any]) -> Dict[str, Any]:
+    for key in ("line", "message"):
+        value = event.get(key)
+        if isinstance(value, str) and len(value) > _MAX_LINE:
+            event = {**event, key: value[:_MAX_LINE] + " …"}
+    return event
+
+
+def _payloads(build_id: str, events: List[Dict[str, Any]]) -> List[str]:
+    """Events split into NOTIFY payloads under the size limit."""
+    payloads = []
+    batch: List[str] = []
+    size = 0
+    for event in events:
+        encoded = json.dumps(_truncate(event))
+        if batch and size + len(encoded) > _MAX_PAYLOAD:
+            payloads.append(f'{{"build_id": {json.dumps(build_id)}, "events": [{",".join(batch)}]}}')
+            batch, size = [], 0
+        batch.append(encoded)
+        size += len(encoded) + 1
+    if batch:
+        payloads.append(f'{{"build_id": {json.dumps(build_id)}, "events": [{",".join(batch)}]}}')
+    return payloads
+
+
+def limit_local_commands():
+    """Apply the worker priority and limits to commands of this process."""
+    set_command_limits(BUILD_WORKER_CPU_SECONDS, BUILD_WORKER_MEMORY_MB, nice=BUILD_WORKER_NICE)
+
+
+class BuildWorkerPool:
+    """API side of the worker pool, supervises workers and dispatches jobs."""
+
+    def __init__(self, workers: int = BUILD_WORKERS):
+        self.workers = workers
+        self.restarts = 0
+        self.dispatched = 0
+        self._processes: Dict[str, Optional[asyncio.subprocess.Process]] = {}
+        self._supervisors: List[asyncio.Task] = []
+        self._listener = None
+        self._waiting: Dict[str, Build] = {}
+        self._finished: Dict[str, asyncio.Event] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.workers > 0 and bool(self._supervisors)
+
+    async def start(self):
+        """Start the workers and the event listener, called from the lifespan."""
+        if self.workers <= 0 or self._supervisors or not os.environ.get("DATABASE_URL"):
+            return
+
+        async with db_connection() as conn:
+            # Jobs of API processes that are gone, nobody waits for them
+            await conn.execute(
+                "DELETE FROM preview_build_jobs WHERE created_at < NOW() - $1 * interval '1 second'",
+                2 * BUILD_JOB_TIMEOUT,
+            )
+        self._listener = await get_db_connection()
+        await self._listener.add_listener(EVENTS_CHANNEL, self._on_events)
+        host = socket.gethostname()
+        for index in range(self.workers):
+            worker_id = f"{host}:{os.getpid()}:{index}"
+            self._supervisors.append(asyncio.create_task(self._supervise(worker_id)))
+        print(f"[BUILD] 🏭 Started {self.workers} build workers")
+
+    async def _supervise(self, worker_id: str):
+        env = {
+            **os.environ,
+            # See module docstring, watchers live in the API process
+            "PREVIEW_WATCH_AUTOSTART": "0",
+            "DB_POOL_MIN_SIZE": "1",
+            "DB_POOL_MAX_SIZE": str(BUILD_WORKER_DB_POOL_SIZE),
+            "TYPECHECK_MAX_SERVERS": str(BUILD_WORKER_TYPECHECK_SERVERS),
+        }
+        while True:
+            process = await asyncio.create_subprocess_exec(
+                sys.executable, "-m", "app.libs.build_worker", "--worker-id", worker_id,
+                env=env,
+            )
+            self._processes[worker_id] = process
+            code = await process.wait()
+            self._processes[worker_id] = None
+            print(f"[BUILD] ⚠️ Build worker {worker_id} exited with code {code}, restarting")
+            self.restarts += 1
+            await self._fail_jobs(worker_id, f"Build worker exited with code {code}")
+            await asyncio.sleep(_RESTART_DELAY)
+
+    async def _fail_jobs(self, worker_id: str, error: str):
+        async with db_connection() as conn:
+            build_ids = await conn.fetch(
+                """
+                UPDATE preview_build_jobs
+                SET status = 'failed', error = $2, status_code = 500, finished_at = NOW()
+                WHERE worker_id = $1 AND status = 'running'
+                RETURNING build_id
+                """,
+                worker_id,
+                error,
+            )
+        for row in build_ids:
+            finished = self._finished.get(row["build_id"])
+            if finished is not None:
+                finished.set()
+
+    def _on_events(self, conn, pid, channel, payload):
+        try:
+            message = json.loads(payload)
+        except ValueError:
+            return
+        build = self._waiting.get(message.get("build_id"))
+        if build is None:
+            return
+        for event in message.get("events", []):
+            if event.get("type") == "finished":
+                self._finished[build.build_id].set()
+                continue
+            event.pop("build_id", None)
+            event.pop("seq", None)
+            if event.get("type") == "log":
+                build.logs.append(event.get("message", ""))
+            build.publish(event)
+
+    async def dispatch(self, build: Build) -> Dict[str, Any]:
+        """Run the build on a worker, a BuildRunner for BuildManager."""
+        finished = asyncio.Event()
+        self._waiting[build.build_id] = build
+        self._finished[build.build_id] = finished
+        self.dispatched += 1
+        job = None
+        try:
+            async with db_connection() as conn:
+                await conn.execute(
+                    "INSERT INTO preview_build_jobs (build_id, project_id) VALUES ($1, $2)",
+                    build.build_id,
+                    build.project_id,
+                )
+                await conn.execute("SELECT pg_notify($1, $2)", JOBS_CHANNEL, build.build_id)
+            build.log("[BUILD] Queued for a build worker")
+
+            deadline = time.monotonic() + BUILD_JOB_TIMEOUT
+            while True:
+                try:
+                    await asyncio.wait_for(finished.wait(), BUILD_WORKER_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                async with db_connection() as conn:
+                    job = await conn.fetchrow(
+                        "SELECT * FROM preview_build_jobs WHERE build_id = $1", build.build_id
+                    )
+                if job is None or job["status"] in ("succeeded", "failed"):
+                    break
+                if time.monotonic() > deadline:
+                    raise BuildError(f"Build worker did not finish within {BUILD_JOB_TIMEOUT:.0f}s")
+        finally:
+            self._waiting.pop(build.build_id, None)
+            self._finished.pop(build.build_id, None)
+            async with db_connection() as conn:
+                if job is not None and job["status"] not in ("succeeded", "failed"):
+                    # Given up (timeout, shutdown), stop the worker building it
+                    await conn.execute("SELECT pg_notify($1, $2)", CANCEL_CHANNEL, build.build_id)
+                await conn.execute("DELETE FROM preview_build_jobs WHERE build_id = $1", build.build_id)
+
+        if job is None:
+            raise BuildError("Build job disappeared")
+        if job["started_at"] is not None:
+            build.started_at = job["started_at"].timestamp()
+        if job["spans"]:
+            build.spans = json.loads(job["spans"])
+        if job["status"] == "failed":
+            raise BuildError(job["error"] or "Build failed", status_code=job["status_code"] or 500)
+        return json.loads(job["result"]) if job["result"] else {}
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "enabled": self.enabled,
+            "alive": sum(
+                1 for process in self._processes.values()
+                if process is not None and process.returncode is None
+            ),
+            "restarts": self.restarts,
+            "dispatched": self.dispatched,
+            "waiting": len(self._waiting),
+            "cpu_seconds": BUILD_WORKER_CPU_SECONDS,
+            "memory_mb": BUILD_WORKER_MEMORY_MB,
+        }
+
+    async def stop(self):
+        """Stop the workers, called on shutdown."""
+        for task in self._supervisors:
+            task.cancel()
+        await asyncio.gather(*self._supervisors, return_exceptions=True)
+        self._supervisors = []
+        for process in self._processes.values():
+            if process is not None and process.returncode is None:
+                process.terminate()
+        for process in self._processes.values():
+            if process is not None and process.returncode is None:
+                try:
+                    await asyncio.wait_for(process.wait(), 10)
+                except asyncio.TimeoutError:
+                    process.kill()
+        self._processes = {}
+        if self._listener is not None:
+            try:
+                await self._listener.remove_listener(EVENTS_CHANNEL, self._on_events)
+            finally:
+                await self._listener.close()
+            self._listener = None
+
+
+build_worker_pool = BuildWorkerPool()
+
+
+# ---------------------------------------------------------------------------
+# Worker process
+# ---------------------------------------------------------------------------
+
+
+async def _claim(worker_id: str):
+    async with db_connection() as conn:
+        return await conn.fetchrow(
+            """
+            UPDATE preview_build_jobs
+            SET status = 'running', worker_id = $1, started_at = NOW()
+            WHERE build_id = (
+                SELECT build_id FROM preview_build_jobs
+                WHERE status = 'queued'
+                ORDER BY created_at
+                FOR UPDATE SKIP LOCKED
+                LIMIT 1
+            )
+            RETURNING *
+            """,
+            worker_id,
+        )
+
+
+async def _relay_events(build: Build, queue: asyncio.Queue):
+    """Forward the build's events to the API process in batches.
+
+    Returns after forwarding everything queued before a None.
+    """
+    while True:
+        events = [await queue.get()]
+        # Collect what arrives in the next moment into one notification
+        await asyncio.sleep(0.05)
+        while not queue.empty():
+            events.append(queue.get_nowait())
+        relayed = [event for event in events if event is not None and event["type"] in _RELAYED_EVENTS]
+        if relayed:
+            async with db_connection() as conn:
+                for payload in _payloads(build.build_id, relayed):
+                    await conn.execute("SELECT pg_notify($1, $2)", EVENTS_CHANNEL, payload)
+        if None in events:
+            return
+
+
+async def _run_job(worker_id: str, job, runner, running: Dict[str, asyncio.Task]):
+    build = Build(job["project_id"], build_id=job["build_id"])
+    build.created_at = job["created_at"].timestamp()
+    queue = build.subscribe(after=None)
+    relay = asyncio.create_task(_relay_events(build, queue))
+    print(f"[BUILD] Worker {worker_id} building {build.project_id} ({build.build_id})")
+
+    async def run():
+        # Never build the same workspace twice at the same time
+        async with workspace_lock(build.project_id):
+            await execute_build(build, runner)
+
+    task = asyncio.create_task(run())
+    running[build.build_id] = task
+    try:
+        done, _ = await asyncio.wait({task}, timeout=BUILD_JOB_TIMEOUT)
+        if not done:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            if not build.done:
+                build.finish(error=BuildTimeout(f"Build did not finish within {BUILD_JOB_TIMEOUT:.0f}s"))
+        elif task.cancelled():
+            if not build.done:
+                # Given up by the API process, see CANCEL_CHANNEL
+                build.finish(error=BuildError("Build cancelled", status_code=503))
+        elif task.exception() is not None and not build.done:
+            # Failed outside the build, e.g. taking the workspace lock
+            build.finish(error=BuildError(f"Build error: {task.exception()}"))
+
+        # Deliver the remaining events before reporting completion
+        build.unsubscribe(queue)
+        await queue.put(None)
+        await relay
+    finally:
+        running.pop(build.build_id, None)
+        if not task.done():
+            task.cancel()
+        relay.cancel()
+        build.unsubscribe(queue)
+
+    async with db_connection() as conn:
+        await conn.execute(
+            """
+            UPDATE preview_build_jobs
+            SET status = $2, result = $3::jsonb, error = $4, status_code = $5,
+                spans = $6::jsonb, finished_at = $7
+            WHERE build_id = $1
+            """,
+            build.build_id,
+            build.status,
+            json.dumps(build.result) if build.result is not None else None,
+            build.error,
+            build.status_code,
+            json.dumps(build.spans),
+            datetime.now(timezone.utc),
+        )
+        await conn.execute(
+            "SELECT pg_notify($1, $2)",
+            EVENTS_CHANNEL,
+            json.dumps({"build_id": build.build_id, "events": [{"type": "finished"}]}),
+        )
+    print(f"[BUILD] Worker {worker_id} finished {build.build_id}: {build.status}")
+
+
+async def run_worker(worker_id: str):
+    """Claim and run build jobs until cancelled."""
+    # Commands inherit the worker's priority
+    os.nice(BUILD_WORKER_NICE)
+    set_command_limits(BUILD_WORKER_CPU_SECONDS, BUILD_WORKER_MEMORY_MB)
+    if await init_db_pool() is None:
+        raise SystemExit("DATABASE_URL is not configured")
+
+    from app.apis.preview import _run_preview_build
+    from app.libs.typecheck import typecheck_servers
+
+    # Eviction needs to know about every build, only the API process runs it
+    preview_registry.janitor_enabled = False
+
+    wake = asyncio.Event()
+    running: Dict[str, asyncio.Task] = {}
+
+    def on_cancel(conn, pid, channel, build_id):
+        task = running.get(build_id)
+        if task is not None:
+            print(f"[BUILD] Worker {worker_id} cancelling {build_id}")
+            task.cancel()
+
+    listener = await get_db_connection()
+    await listener.add_listener(JOBS_CHANNEL, lambda *args: wake.set())
+    await listener.add_listener(CANCEL_CHANNEL, on_cancel)
+    print(f"[BUILD] Worker {worker_id} ready (PID {os.getpid()})")
+    try:
+        while True:
+            wake.clear()
+            job = await _claim(worker_id)
+            if job is not None:
+                await _run_job(worker_id, job, _run_preview_build, running)
+                continue
+            try:
+                await asyncio.wait_for(wake.wait(), BUILD_WORKER_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        await listener.close()
+        await typecheck_servers.stop_all()
+        await preview_registry.stop()
+        await close_db_pool()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Preview build worker")
+    parser.add_argument("--worker-id", default=f"{socket.gethostname()}:{os.getpid()}")
+    args = parser.parse_args()
+    try:
+        asyncio.run(run_worker(args.worker_id))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,459 @@
+"""In-process inverted index of project source files.
+
+The AI tools search the same project files over and over. Each project gets
+an in-memory index mapping identifier tokens to (file, line) and symbol
+names to their definitions, so ``search_code`` and ``find_symbol`` can be
+answered without touching Postgres.
+
+- Built lazily from ``project_file_contents``, the files the file tools
+  write and the SQL fallback in ``code_search`` reads, on first use of a
+  project.
+- Kept up to date incrementally by the file tool endpoints through
+  ``code_index.upsert_file()``; writes that touch many rows or whose
+  result is not known in full (delete, rollback, batch write) call
+  ``code_index.invalidate()`` instead.
+- Writes by other processes are caught by comparing a fingerprint of the
+  files' blob hashes with the database before serving an index that was
+  last checked more than CODE_INDEX_REVALIDATE_SECONDS ago.
+- Projects are evicted least recently used first once more than
+  CODE_INDEX_MAX_PROJECTS are loaded or the estimated size exceeds
+  CODE_INDEX_MEMORY_BUDGET_MB. A project that does not fit the budget on
+  its own is remembered with its fingerprint and left to the SQL fallback
+  until its files change, its size is checked before any content is fetched.
+"""
+
+import asyncio
+import hashlib
+import os
+import re
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+from uuid import UUID
+
+from app.libs.code_search import (
+    DEFAULT_CONTEXT_LINES,
+    DEFAULT_MAX_BYTES,
+    DEFAULT_MAX_RESULTS,
+    build_results,
+)
+from app.libs.database import db_connection
+from app.libs.file_store import content_hash
+
+CODE_INDEX_MAX_PROJECTS = int(os.environ.get("CODE_INDEX_MAX_PROJECTS", 50))
+CODE_INDEX_MEMORY_BUDGET_MB = int(os.environ.get("CODE_INDEX_MEMORY_BUDGET_MB", 256))
+CODE_INDEX_REVALIDATE_SECONDS = float(os.environ.get("CODE_INDEX_REVALIDATE_SECONDS", 2))
+
+TOKEN_RE = re.compile(r"[A-Za-z_$][A-Za-z0-9_$]*")
+
+# (kind, pattern) - the first group is the symbol name
+SYMBOL_PATTERNS: List[Tuple[str, re.Pattern]] = [
+    ("function", re.compile(r"^\s*(?:async\s+)?def\s+([A-Za-z_]\w*)")),
+    ("class", re.compile(r"^\s*(?:export\s+)?(?:default\s+)?(?:abstract\s+)?class\s+([A-Za-z_$][\w$]*)")),
+    ("function", re.compile(r"^\s*(?:export\s+)?(?:default\s+)?(?:async\s+)?function\s*\*?\s*([A-Za-z_$][\w$]*)")),
+    ("interface", re.compile(r"^\s*(?:export\s+)?interface\s+([A-Za-z_$][\w$]*)")),
+    ("type", re.compile(r"^\s*(?:export\s+)?type\s+([A-Za-z_$][\w$]*)\s*(?:<[^=]*>)?\s*=")),
+    ("enum", re.compile(r"^\s*(?:export\s+)?(?:const\s+)?enum\s+([A-Za-z_$][\w$]*)")),
+    ("variable", re.compile(r"^\s*(?:export\s+)?(?:const|let|var)\s+([A-Za-z_$][\w$]*)\s*[:=]")),
+    ("variable", re.compile(r"^([A-Za-z_]\w*)\s*(?::[^=]+)?=(?!=)")),
+]
+
+# Rough per-entry overhead used for the memory estimate
+_POSTING_OVERHEAD = 48
+
+
+@dataclass
+class SymbolDefinition:
+    name: str
+    kind: str
+    filepath: str
+    line: int
+    text: str
+
+
+@dataclass
+class IndexedFile:
+    id: Optional[str]
+    filepath: str
+    language: Optional[str]
+    content: str
+    hash: str
+    lines: List[str]
+    tokens: Set[str]
+    symbols: List[SymbolDefinition]
+    postings_count: int
+
+    @property
+    def estimated_bytes(self) -> int:
+        return len(self.content) * 2 + self.postings_count * _POSTING_OVERHEAD
+
+
+def find_symbols(filepath: str, lines: Sequence[str]) -> List[SymbolDefinition]:
+    """Find top-level-ish definitions with line based patterns."""
+    symbols = []
+    for number, line in enumerate(lines, start=1):
+        for kind, pattern in SYMBOL_PATTERNS:
+            match = pattern.match(line)
+            if match:
+                symbols.append(
+                    SymbolDefinition(match.group(1), kind, filepath, number, line.strip())
+                )
+                break
+    return symbols
+
+
+@dataclass
+class ProjectIndex:
+    """Inverted index for the files of a single project."""
+
+    files: Dict[str, IndexedFile] = field(default_factory=dict)
+    # token -> filepath -> line numbers (1-based, ascending)
+    postings: Dict[str, Dict[str, List[int]]] = field(default_factory=dict)
+    # lowercased symbol name -> definitions
+    symbols: Dict[str, List[SymbolDefinition]] = field(default_factory=dict)
+    estimated_bytes: int = 0
+    checked_at: float = field(default_factory=time.monotonic)
+
+    def fingerprint(self) -> str:
+        """Same value as _FINGERPRINT_QUERY for the same set of files."""
+        listing = "\n".join(f"{path}:{self.files[path].hash}" for path in sorted(self.files))
+        return hashlib.md5(listing.encode("utf-8")).hexdigest()
+
+    def add_file(
+        self,
+        filepath: str,
+        content: str,
+        language: Optional[str] = None,
+        file_id: Optional[str] = None,
+        digest: Optional[str] = None,
+    ):
+        if filepath in self.files:
+            self.remove_file(filepath)
+
+        lines = content.splitlines()
+        tokens: Set[str] = set()
+        postings_count = 0
+        for number, line in enumerate(lines, start=1):
+            for token in {t.lower() for t in TOKEN_RE.findall(line)}:
+                self.postings.setdefault(token, {}).setdefault(filepath, []).append(number)
+                tokens.add(token)
+                postings_count += 1
+
+        symbols = find_symbols(filepath, lines)
+        for symbol in symbols:
+            self.symbols.setdefault(symbol.name.lower(), []).append(symbol)
+
+        indexed = IndexedFile(
+            id=file_id,
+            filepath=filepath,
+            language=language,
+            content=content,
+            hash=content_hash(content) if digest is None else digest,
+            lines=lines,
+            tokens=tokens,
+            symbols=symbols,
+            postings_count=postings_count,
+        )
+        self.files[filepath] = indexed
+        self.estimated_bytes += indexed.estimated_bytes
+
+    def remove_file(self, filepath: str):
+        indexed = self.files.pop(filepath, None)
+        if indexed is None:
+            return
+
+        for token in indexed.tokens:
+            by_file = self.postings.get(token)
+            if by_file is None:
+                continue
+            by_file.pop(filepath, None)
+            if not by_file:
+                del self.postings[token]
+
+        for symbol in indexed.symbols:
+            key = symbol.name.lower()
+            remaining = [s for s in self.symbols.get(key, []) if s.filepath != filepath]
+            if remaining:
+                self.symbols[key] = remaining
+            else:
+                self.symbols.pop(key, None)
+
+        self.estimated_bytes -= indexed.estimated_bytes
+
+    def _matching_lines(self, keyword: str) -> Dict[str, List[int]]:
+        """Lines containing keyword (case-insensitive substring), per file."""
+        needle = keyword.lower()
+        tokens = TOKEN_RE.findall(needle)
+
+        candidates: Dict[str, Set[int]] = {}
+        if tokens:
+            # Any line containing the keyword has an identifier containing
+            # its longest token, so only those postings need checking
+            longest = max(tokens, key=len)
+            for token, by_file in self.postings.items():
+                if longest in token:
+                    for filepath, numbers in by_file.items():
+                        candidates.setdefault(filepath, set()).update(numbers)
+        else:
+            candidates = {
+                path: set(range(1, len(f.lines) + 1)) for path, f in self.files.items()
+            }
+
+        matches: Dict[str, List[int]] = {}
+        for filepath, numbers in candidates.items():
+            lines = self.files[filepath].lines
+            found = sorted(n for n in numbers if needle in lines[n - 1].lower())
+            if found:
+                matches[filepath] = found
+        return matches
+
+    def search(
+        self,
+        keywords: Sequence[str],
+        max_results: int = DEFAULT_MAX_RESULTS,
+        context_lines: int = DEFAULT_CONTEXT_LINES,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+    ) -> Dict[str, Any]:
+        """Same result shape as the SQL backed search (see code_search)."""
+        keywords = [kw for kw in keywords if kw]
+        counts: Dict[str, int] = {}
+        for keyword in keywords:
+            needle = keyword.lower()
+            for filepath, numbers in self._matching_lines(keyword).items():
+                lines = self.files[filepath].lines
+                counts[filepath] = counts.get(filepath, 0) + sum(
+                    lines[n - 1].lower().count(needle) for n in numbers
+                )
+
+        ranked = sorted(counts.items(), key=lambda item: (-item[1], item[0]))[:max_results]
+        files = [
+            {
+                "id": self.files[filepath].id,
+                "filepath": filepath,
+                "file_content": self.files[filepath].content,
+                "language": self.files[filepath].language,
+                "match_count": count,
+            }
+            for filepath, count in ranked
+        ]
+        return build_results(files, keywords, context_lines, max_bytes)
+
+    def find_symbol(self, name: str, exact: bool = True, limit: int = 50) -> List[SymbolDefinition]:
+        key = name.lower()
+        if exact:
+            return list(self.symbols.get(key, []))[:limit]
+        found = []
+        for symbol_name in sorted(self.symbols):
+            if key in symbol_name:
+                found.extend(self.symbols[symbol_name])
+                if len(found) >= limit:
+                    break
+        return found[:limit]
+
+
+# Ordered by code point like Python's sorted(), hence the C collation
+_FINGERPRINT_SQL = """md5(COALESCE(
+        string_agg(filepath || ':' || COALESCE(blob_hash, ''), E'\\n' ORDER BY filepath COLLATE "C"),
+        ''
+    ))"""
+
+_FINGERPRINT_QUERY = f"""
+    SELECT {_FINGERPRINT_SQL}
+    FROM project_files
+    WHERE project_id = $1
+"""
+
+_SIZE_QUERY = f"""
+    SELECT {_FINGERPRINT_SQL} AS fingerprint, COALESCE(SUM(length(content)), 0) AS size
+    FROM project_file_contents
+    WHERE project_id = $1
+"""
+
+
+class CodeIndexRegistry:
+    """LRU of project indexes bounded by count and estimated memory."""
+
+    def __init__(
+        self,
+        max_projects: int = CODE_INDEX_MAX_PROJECTS,
+        memory_budget_bytes: int = CODE_INDEX_MEMORY_BUDGET_MB * 1024 * 1024,
+    ):
+        self.max_projects = max_projects
+        self.memory_budget_bytes = memory_budget_bytes
+        self._indexes: "OrderedDict[str, ProjectIndex]" = OrderedDict()
+        self._locks: Dict[str, asyncio.Lock] = {}
+        # Updates that arrive while a project is being built from the database
+        self._pending: Dict[str, List[Tuple[str, str, Optional[str], Optional[str]]]] = {}
+        # Invalidated while being built, the build result is not cached
+        self._stale: Set[str] = set()
+        # Projects over the memory budget: fingerprint and when it was checked
+        self._oversized: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self.builds = 0
+        self.evictions = 0
+        self.revalidations = 0
+
+    async def get(self, project_id: str) -> Optional[ProjectIndex]:
+        """Get the project index, building it on first use.
+
+        Returns None when the project alone does not fit the memory budget,
+        callers then fall back to searching in the database.
+        """
+        project_id = str(project_id)
+        index = self._indexes.get(project_id)
+        if index is not None and time.monotonic() - index.checked_at < CODE_INDEX_REVALIDATE_SECONDS:
+            self._indexes.move_to_end(project_id)
+            return index
+
+        if project_id in self._oversized and not await self._oversized_changed(project_id):
+            return None
+
+        lock = self._locks.setdefault(project_id, asyncio.Lock())
+        async with lock:
+            index = self._indexes.get(project_id)
+            if index is not None and not await self._is_current(project_id, index):
+                print(f"[INDEX] Project {project_id} changed elsewhere, rebuilding")
+                self._indexes.pop(project_id, None)
+                index = None
+            if index is None:
+                index = await self._build(project_id)
+                if index is None:
+                    return None
+                if project_id in self._stale:
+                    self._stale.discard(project_id)
+                    return index
+                self._indexes[project_id] = index
+                self._evict()
+            self._indexes.move_to_end(project_id)
+            return index
+
+    async def _is_current(self, project_id: str, index: ProjectIndex) -> bool:
+        if time.monotonic() - index.checked_at < CODE_INDEX_REVALIDATE_SECONDS:
+            return True
+        self.revalidations += 1
+        async with db_connection() as conn:
+            fingerprint = await conn.fetchval(_FINGERPRINT_QUERY, UUID(project_id))
+        if fingerprint != index.fingerprint():
+            return False
+        index.checked_at = time.monotonic()
+        return True
+
+    async def _oversized_changed(self, project_id: str) -> bool:
+        """Whether a project over the budget changed since it was measured."""
+        fingerprint, checked_at = self._oversized[project_id]
+        if time.monotonic() - checked_at < CODE_INDEX_REVALIDATE_SECONDS:
+            return False
+        self.revalidations += 1
+        async with db_connection() as conn:
+            current = await conn.fetchval(_FINGERPRINT_QUERY, UUID(project_id))
+        if current != fingerprint:
+            self._oversized.pop(project_id, None)
+            return True
+        self._oversized[project_id] = (fingerprint, time.monotonic())
+        return False
+
+    def _mark_oversized(self, project_id: str, fingerprint: str):
+        print(f"[INDEX] ⚠️ Project {project_id} exceeds the code index budget, not cached")
+        self._oversized[project_id] = (fingerprint, time.monotonic())
+        self._oversized.move_to_end(project_id)
+        while len(self._oversized) > self.max_projects:
+            self._oversized.popitem(last=False)
+
+    async def _build(self, project_id: str) -> Optional[ProjectIndex]:
+        self._pending[project_id] = []
+        try:
+            async with db_connection() as conn:
+                measured = await conn.fetchrow(_SIZE_QUERY, UUID(project_id))
+                # Content alone is counted twice in estimated_bytes
+                if measured["size"] * 2 > self.memory_budget_bytes:
+                    self._mark_oversized(project_id, measured["fingerprint"])
+                    return None
+                rows = await conn.fetch(
+                    """
+                    SELECT id, filepath, content, language, blob_hash
+                    FROM project_file_contents
+                    WHERE project_id = $1
+                    """,
+                    UUID(project_id),
+                )
+
+            index = ProjectIndex()
+            for row in rows:
+                index.add_file(
+                    row["filepath"],
+                    row["content"] or "",
+                    row["language"],
+                    str(row["id"]),
+                    digest=row["blob_hash"] or "",
+                )
+            for filepath, content, language, file_id in self._pending.get(project_id, []):
+                if content is None:
+                    index.remove_file(filepath)
+                else:
+                    index.add_file(filepath, content, language, file_id)
+        finally:
+            self._pending.pop(project_id, None)
+
+        self.builds += 1
+        if index.estimated_bytes > self.memory_budget_bytes:
+            self._mark_oversized(project_id, index.fingerprint())
+            return None
+        print(f"[INDEX] Indexed {len(index.files)} files for project {project_id}")
+        return index
+
+    def _evict(self):
+        while self._indexes and (
+            len(self._indexes) > self.max_projects
+            or self.estimated_bytes > self.memory_budget_bytes
+        ):
+            project_id, _ = self._indexes.popitem(last=False)
+            self._locks.pop(project_id, None)
+            self.evictions += 1
+
+    @property
+    def estimated_bytes(self) -> int:
+        return sum(index.estimated_bytes for index in self._indexes.values())
+
+    def upsert_file(self, project_id: str, filepath: str, content: str, language: Optional[str] = None, file_id: Optional[str] = None):
+        """Apply a created/updated file to the index if the project is loaded."""
+        project_id = str(project_id)
+        if project_id in self._pending:
+            self._pending[project_id].append((filepath, content, language, file_id))
+            return
+        index = self._indexes.get(project_id)
+        if index is not None:
+            index.add_file(filepath, content, language, file_id)
+            self._evict()
+
+    def remove_file(self, project_id: str, filepath: str):
+        """Apply a deleted file to the index if the project is loaded."""
+        project_id = str(project_id)
+        if project_id in self._pending:
+            self._pending[project_id].append((filepath, None, None, None))
+            return
+        index = self._indexes.get(project_id)
+        if index is not None:
+            index.remove_file(filepath)
+
+    def invalidate(self, project_id: str):
+        """Drop a project index, it is rebuilt on next use."""
+        project_id = str(project_id)
+        self._indexes.pop(project_id, None)
+        self._oversized.pop(project_id, None)
+        if project_id in self._pending:
+            self._stale.add(project_id)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "projects": len(self._indexes),
+            "oversized_projects": len(self._oversized),
+            "max_projects": self.max_projects,
+            "estimated_bytes": self.estimated_bytes,
+            "memory_budget_bytes": self.memory_budget_bytes,
+            "builds": self.builds,
+            "evictions": self.evictions,
+            "revalidations": self.revalidations,
+        }
+
+
+code_index = CodeIndexRegistry()
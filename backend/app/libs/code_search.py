@@ -0,0 +1,175 @@
+"""Bounded code search over project files.
+
+Candidate files are found in Postgres (``content ILIKE`` on the
+``project_file_contents`` view, served by the pg_trgm GIN index on
+``file_blobs`` from schema migration 0012_file_blobs_single_source), ranked
+by the number of keyword occurrences, and returned as line-level snippets
+with a few lines of context instead of whole file bodies. Lines longer
+than MAX_SNIPPET_LINE_CHARS (minified bundles) are cut around the match,
+and the total size of all snippets is capped by a byte budget so tool
+results stay small; the snippet that crosses the budget is clipped to it.
+"""
+
+from typing import Any, Dict, List, Sequence, Tuple
+
+import asyncpg
+
+DEFAULT_MAX_RESULTS = 20
+DEFAULT_CONTEXT_LINES = 2
+DEFAULT_MAX_BYTES = 20_000
+MAX_SNIPPETS_PER_FILE = 5
+MAX_SNIPPET_LINE_CHARS = 500
+
+
+def escape_like(keyword: str) -> str:
+    """Escape LIKE wildcards so keywords are matched literally."""
+    return keyword.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _ranked_search_query(keyword_count: int) -> str:
+    # $1 = project_id, $2 = max_results, then the raw keywords followed by
+    # their escaped LIKE patterns
+    keyword_params = [f"${i + 3}" for i in range(keyword_count)]
+    pattern_params = [f"${i + 3 + keyword_count}" for i in range(keyword_count)]
+    conditions = " OR ".join(f"content ILIKE {p}" for p in pattern_params)
+    # Occurrence count per keyword without pulling content into Python
+    match_count = " + ".join(
+        f"(length(lower(content)) - length(replace(lower(content), lower({p}), '')))"
+        f" / length({p})"
+        for p in keyword_params
+    )
+    return f"""
+        SELECT id, filepath, content AS file_content, language, ({match_count}) AS match_count
+        FROM project_file_contents
+        WHERE project_id = $1
+        AND ({conditions})
+        ORDER BY match_count DESC, filepath
+        LIMIT $2
+    """
+
+
+async def search_files(
+    conn: asyncpg.Connection,
+    project_id,
+    keywords: Sequence[str],
+    max_results: int = DEFAULT_MAX_RESULTS,
+) -> List[asyncpg.Record]:
+    """Fetch the best matching files for the keywords, most matches first."""
+    keywords = [kw for kw in keywords if kw]
+    if not keywords:
+        return []
+
+    patterns = [f"%{escape_like(kw)}%" for kw in keywords]
+    return await conn.fetch(
+        _ranked_search_query(len(keywords)),
+        project_id,
+        max_results,
+        *keywords,
+        *patterns,
+    )
+
+
+def _clip_line(line: str, lowered: Sequence[str], max_chars: int = MAX_SNIPPET_LINE_CHARS) -> str:
+    """Cut an overlong line to max_chars around the first keyword match."""
+    if len(line) <= max_chars:
+        return line
+    lower = line.lower()
+    positions = [lower.find(kw) for kw in lowered if kw in lower]
+    start = max(0, min(positions, default=0) - max_chars // 2)
+    start = min(start, len(line) - max_chars)
+    end = start + max_chars
+    return ("…" if start > 0 else "") + line[start:end] + ("…" if end < len(line) else "")
+
+
+def extract_snippets(
+    content: str,
+    keywords: Sequence[str],
+    context_lines: int = DEFAULT_CONTEXT_LINES,
+    max_snippets: int = MAX_SNIPPETS_PER_FILE,
+) -> Tuple[List[Dict[str, Any]], int]:
+    """Find matching lines and merge them with surrounding context.
+
+    Returns (snippets, matching_line_count). Line numbers are 1-based.
+    """
+    lowered = [kw.lower() for kw in keywords if kw]
+    lines = content.splitlines()
+    matches = [
+        i for i, line in enumerate(lines)
+        if any(kw in line.lower() for kw in lowered)
+    ]
+
+    # Merge overlapping context windows into ranges
+    ranges: List[List[Any]] = []
+    for i in matches:
+        start = max(0, i - context_lines)
+        end = min(len(lines) - 1, i + context_lines)
+        if ranges and start <= ranges[-1][1] + 1:
+            ranges[-1][1] = end
+            ranges[-1][2].append(i + 1)
+        else:
+            ranges.append([start, end, [i + 1]])
+
+    snippets = [
+        {
+            "start_line": start + 1,
+            "end_line": end + 1,
+            "match_lines": match_lines,
+            "text": "\n".join(_clip_line(line, lowered) for line in lines[start:end + 1]),
+        }
+        for start, end, match_lines in ranges[:max_snippets]
+    ]
+    return snippets, len(matches)
+
+
+def build_results(
+    files: Sequence[Dict[str, Any]],
+    keywords: Sequence[str],
+    context_lines: int = DEFAULT_CONTEXT_LINES,
+    max_bytes: int = DEFAULT_MAX_BYTES,
+) -> Dict[str, Any]:
+    """Turn ranked files into snippet results within the byte budget.
+
+    Each file dict needs id, filepath, file_content, language and
+    match_count keys.
+    """
+    results = []
+    used_bytes = 0
+    truncated = False
+
+    for f in files:
+        snippets, matching_lines = extract_snippets(
+            f["file_content"], keywords, context_lines
+        )
+        kept = []
+        for snippet in snippets:
+            encoded = snippet["text"].encode("utf-8")
+            if used_bytes + len(encoded) > max_bytes:
+                truncated = True
+                remaining = max_bytes - used_bytes
+                if remaining > 0:
+                    # Clip instead of dropping, the best match may be large
+                    text = encoded[:remaining].decode("utf-8", errors="ignore")
+                    used_bytes += len(text.encode("utf-8"))
+                    kept.append({**snippet, "text": text, "clipped": True})
+                break
+            used_bytes += len(encoded)
+            kept.append(snippet)
+
+        if not kept and truncated:
+            break
+
+        results.append(
+            {
+                "id": str(f["id"]) if f["id"] else None,
+                "filepath": f["filepath"],
+                "language": f["language"],
+                "match_count": f["match_count"],
+                "matching_lines": matching_lines,
+                "snippets": kept,
+                "snippets_omitted": len(snippets) - len(kept),
+            }
+        )
+        if truncated:
+            break
+
+    return {"results": results, "truncated": truncated, "bytes": used_bytes}
@@ -1,9 +1,257 @@
-"""Database connection helper."""
+"""Database connection helpers.
 
+All API modules share one process-wide asyncpg pool. The pool is created and
+drained by the app lifespan (see ``app/internal/main.py``), and is created
+lazily on first use when code runs outside of it (scripts, direct calls).
+Pending schema migrations (``app.libs.schema``) are applied before the pool is
+handed out, either way. A failed migration is reported once and then raised
+as MigrationError from every use, it is not retried per request.
+
+Usage:
+    from app.libs.database import db_connection
+
+    async with db_connection() as conn:
+        rows = await conn.fetch("SELECT ...")
+
+Or as a FastAPI dependency:
+
+    from app.libs.database import DbConnection
+
+    @router.get("/things")
+    async def list_things(conn: DbConnection):
+        ...
+
+Pool sizing is configured through environment variables:
+    DB_POOL_MIN_SIZE           (default 1)
+    DB_POOL_MAX_SIZE           (default 10)
+    DB_STATEMENT_CACHE_SIZE    (default 100, 0 disables, e.g. behind pgbouncer)
+    DB_POOL_ACQUIRE_TIMEOUT    (seconds, default 10)
+    DB_POOL_MAX_INACTIVE_LIFETIME (seconds, default 300)
+"""
+
+import asyncio
 import os
+import time
+from contextlib import asynccontextmanager
+from typing import Annotated, Any, AsyncIterator, Dict, Optional
+
 import asyncpg
+from fastapi import Depends, HTTPException
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+DB_POOL_MIN_SIZE = _env_int("DB_POOL_MIN_SIZE", 1)
+DB_POOL_MAX_SIZE = _env_int("DB_POOL_MAX_SIZE", 10)
+DB_STATEMENT_CACHE_SIZE = _env_int("DB_STATEMENT_CACHE_SIZE", 100)
+DB_POOL_ACQUIRE_TIMEOUT = _env_float("DB_POOL_ACQUIRE_TIMEOUT", 10.0)
+DB_POOL_MAX_INACTIVE_LIFETIME = _env_float("DB_POOL_MAX_INACTIVE_LIFETIME", 300.0)
+
+_pool: Optional[asyncpg.Pool] = None
+_pool_lock: Optional[asyncio.Lock] = None
+_migration_error: Optional["MigrationError"] = None
+
+
+class MigrationError(RuntimeError):
+    """Schema migrations failed, the database cannot be used."""
+
+
+class _AcquireStats:
+    """Counters for pool acquisition, exposed through get_pool_stats()."""
+
+    def __init__(self):
+        self.waiters = 0
+        self.acquired = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.last_wait = 0.0
+
+    def record(self, wait: float):
+        self.acquired += 1
+        self.total_wait += wait
+        self.last_wait = wait
+        if wait > self.max_wait:
+            self.max_wait = wait
+
+
+_stats = _AcquireStats()
+
 
+async def init_db_pool() -> Optional[asyncpg.Pool]:
+    """Create the shared pool and apply pending migrations, if not done yet.
 
-async def get_db_connection():
-    """Get database connection."""
+    Returns None when DATABASE_URL is not configured. Raises MigrationError
+    when the migrations failed, now or on an earlier call.
+    """
+    global _pool, _pool_lock, _migration_error
+
+    if _migration_error is not None:
+        raise _migration_error
+    if _pool is not None:
+        return _pool
+
+    database_url = os.environ.get("DATABASE_URL")
+    if not database_url:
+        return None
+
+    if _pool_lock is None:
+        _pool_lock = asyncio.Lock()
+
+    async with _pool_lock:
+        if _migration_error is not None:
+            raise _migration_error
+        if _pool is None:
+            pool = await asyncpg.create_pool(
+                database_url,
+                min_size=min(DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE),
+                max_size=DB_POOL_MAX_SIZE,
+                statement_cache_size=DB_STATEMENT_CACHE_SIZE,
+                max_inactive_connection_lifetime=DB_POOL_MAX_INACTIVE_LIFETIME,
+            )
+            # Migrate before anyone can use the pool, also when it is created
+            # lazily. A failing migration fails the same way every time, so
+            # it is remembered instead of recreating the pool per request
+            from app.libs.schema import apply_migrations
+
+            try:
+                async with pool.acquire() as conn:
+                    await apply_migrations(conn)
+            except (
+                OSError,
+                asyncio.TimeoutError,
+                asyncpg.InterfaceError,
+                asyncpg.PostgresConnectionError,
+                asyncpg.CannotConnectNowError,
+            ):
+                # Lost the connection, the next use connects again
+                pool.terminate()
+                raise
+            except Exception as e:
+                pool.terminate()
+                _migration_error = MigrationError(f"Schema migration failed: {e}")
+                print(f"[DB] ❌ {_migration_error}")
+                raise _migration_error from e
+            except BaseException:
+                pool.terminate()
+                raise
+            _pool = pool
+            print(
+                f"[DB] ✅ Connection pool ready "
+                f"(min={DB_POOL_MIN_SIZE}, max={DB_POOL_MAX_SIZE})"
+            )
+    return _pool
+
+
+async def close_db_pool():
+    """Gracefully drain and close the shared pool."""
+    global _pool
+
+    pool = _pool
+    _pool = None
+    if pool is None:
+        return
+
+    try:
+        await asyncio.wait_for(pool.close(), timeout=DB_POOL_ACQUIRE_TIMEOUT)
+        print("[DB] Connection pool closed")
+    except asyncio.TimeoutError:
+        print("[DB] ⚠️ Pool did not drain in time, terminating connections")
+        pool.terminate()
+
+
+async def get_db_pool() -> asyncpg.Pool:
+    """Get the shared pool, creating it on first use."""
+    pool = await init_db_pool()
+    if pool is None:
+        raise RuntimeError("DATABASE_URL is not configured")
+    return pool
+
+
+async def _acquire(pool: asyncpg.Pool) -> asyncpg.Connection:
+    _stats.waiters += 1
+    started = time.perf_counter()
+    try:
+        conn = await pool.acquire(timeout=DB_POOL_ACQUIRE_TIMEOUT)
+    except asyncio.TimeoutError:
+        _stats.timeouts += 1
+        raise
+    finally:
+        _stats.waiters -= 1
+    _stats.record(time.perf_counter() - started)
+    return conn
+
+
+@asynccontextmanager
+async def db_connection() -> AsyncIterator[asyncpg.Connection]:
+    """Borrow a connection from the shared pool for the duration of the block."""
+    pool = await get_db_pool()
+    conn = await _acquire(pool)
+    try:
+        yield conn
+    finally:
+        await pool.release(conn)
+
+
+async def get_db() -> AsyncIterator[asyncpg.Connection]:
+    """FastAPI dependency yielding a pooled connection."""
+    pool = await get_db_pool()
+    try:
+        conn = await _acquire(pool)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=503, detail="Database busy, try again")
+    try:
+        yield conn
+    finally:
+        await pool.release(conn)
+
+
+DbConnection = Annotated[asyncpg.Connection, Depends(get_db)]
+
+
+async def get_db_connection() -> asyncpg.Connection:
+    """Open a dedicated (unpooled) connection. Caller must close it.
+
+    Prefer db_connection(); this is only for long-lived listeners and
+    session-level state that must not leak back into the pool.
+    """
     return await asyncpg.connect(os.environ.get("DATABASE_URL"))
+
+
+def get_pool_stats() -> Dict[str, Any]:
+    """Snapshot of pool usage and acquire latency."""
+    stats: Dict[str, Any] = {
+        "initialized": _pool is not None,
+        "min_size": DB_POOL_MIN_SIZE,
+        "max_size": DB_POOL_MAX_SIZE,
+        "size": 0,
+        "in_use": 0,
+        "idle": 0,
+        "waiters": _stats.waiters,
+        "acquired_total": _stats.acquired,
+        "acquire_timeouts": _stats.timeouts,
+        "acquire_latency_ms": {
+            "avg": round(_stats.total_wait / _stats.acquired * 1000, 3) if _stats.acquired else 0.0,
+            "max": round(_stats.max_wait * 1000, 3),
+            "last": round(_stats.last_wait * 1000, 3),
+        },
+    }
+    if _pool is not None:
+        size = _pool.get_size()
+        idle = _pool.get_idle_size()
+        stats["size"] = size
+        stats["idle"] = idle
+        stats["in_use"] = size - idle
+    return stats
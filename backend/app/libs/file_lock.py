@@ -0,0 +1,75 @@
+"""Cross-process locks on the shared preview disk.
+
+The API process and the build workers (``app.libs.build_worker``) share the
+on-disk stores, so ``asyncio.Lock`` is not enough to keep two processes from
+installing, replacing or evicting the same entry at once. These are
+``fcntl.flock`` locks on ``{root}/.locks/{key}.lock``: released by the
+kernel when the holder dies, shared locks for readers (hydrating from an
+entry) and exclusive ones for writers (installing, evicting).
+
+Lock files are never deleted, removing one while another process waits on
+it would hand out two locks for the same key.
+"""
+
+import asyncio
+import fcntl
+import os
+from contextlib import asynccontextmanager, contextmanager
+from pathlib import Path
+from typing import AsyncIterator, Iterator
+
+LOCKS_DIR = ".locks"
+_POLL_INTERVAL = 0.1
+
+
+def lock_path(root: Path, key: str) -> Path:
+    return root / LOCKS_DIR / f"{key}.lock"
+
+
+def _open(path: Path) -> int:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    return os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+
+
+@asynccontextmanager
+async def file_lock(path: Path, shared: bool = False) -> AsyncIterator[None]:
+    """Hold a lock on path, waiting without blocking the event loop."""
+    fd = _open(path)
+    try:
+        mode = (fcntl.LOCK_SH if shared else fcntl.LOCK_EX) | fcntl.LOCK_NB
+        while True:
+            try:
+                fcntl.flock(fd, mode)
+                break
+            except BlockingIOError:
+                await asyncio.sleep(_POLL_INTERVAL)
+        yield
+    finally:
+        # Closing the descriptor releases the lock
+        os.close(fd)
+
+
+@contextmanager
+def blocking_file_lock(path: Path) -> Iterator[None]:
+    """Exclusive lock on path, blocks the thread, for code run in threads."""
+    fd = _open(path)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(fd)
+
+
+@contextmanager
+def try_file_lock(path: Path) -> Iterator[bool]:
+    """Exclusive lock if nobody holds one, yields whether it was taken."""
+    fd = _open(path)
+    try:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        yield True
+    finally:
+        os.close(fd)
@@ -0,0 +1,222 @@
+"""Apply unified diffs and search/replace edits to file contents.
+
+Used by ``update_file`` so the AI can send a small patch instead of the
+whole file. Generated patches are often slightly off (wrong line numbers,
+changed indentation, a stale context line), so hunks are located with
+progressively looser matching:
+
+1. exact match, nearest to the position the hunk claims
+2. match ignoring leading/trailing whitespace
+3. fuzzy match with difflib, at least PATCH_FUZZY_THRESHOLD similar
+
+Only context lines may be fuzzy. Removed lines and search/replace text must
+match exactly or up to whitespace, a patch written against a stale version
+of the file fails with PatchError instead of changing a similar line.
+
+The fuzzy stage is quadratic per candidate, so it only looks at positions
+within PATCH_FUZZY_WINDOW lines of the hint, skips candidates that
+``quick_ratio`` already rules out and gives up after PATCH_FUZZY_TIME_BUDGET
+seconds. Callers on the event loop should still run it in a thread.
+"""
+
+import difflib
+import re
+import time
+from dataclasses import dataclass
+from typing import List, Optional, Sequence, Tuple
+
+PATCH_FUZZY_THRESHOLD = 0.85
+PATCH_FUZZY_WINDOW = 200
+PATCH_FUZZY_TIME_BUDGET = 2.0
+
+_HUNK_HEADER = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+
+
+class PatchError(Exception):
+    """Raised when a patch cannot be applied."""
+
+
+@dataclass
+class Hunk:
+    old_start: int  # 1-based, as in the hunk header
+    # (tag, text) with tag " " for context, "-" for removed, "+" for added
+    lines: List[Tuple[str, str]]
+
+    @property
+    def old_lines(self) -> List[str]:
+        return [text for tag, text in self.lines if tag != "+"]
+
+    @property
+    def removed(self) -> List[int]:
+        """Indices into old_lines of the removed lines."""
+        return [i for i, tag in enumerate(tag for tag, _ in self.lines if tag != "+") if tag == "-"]
+
+    def apply_to(self, matched: Sequence[str]) -> List[str]:
+        """New lines for the matched region, context keeps the file's text."""
+        result = []
+        position = 0
+        for tag, text in self.lines:
+            if tag == "+":
+                result.append(text)
+                continue
+            if tag == " ":
+                result.append(matched[position])
+            position += 1
+        return result
+
+
+def _split(content: str) -> Tuple[List[str], bool]:
+    """Split into lines without newlines, remembering a trailing newline."""
+    return content.splitlines(), content.endswith("\n")
+
+
+def _join(lines: Sequence[str], trailing_newline: bool) -> str:
+    text = "\n".join(lines)
+    return text + "\n" if trailing_newline and lines else text
+
+
+def find_block(
+    lines: Sequence[str],
+    block: Sequence[str],
+    hint: int = 0,
+    window: Optional[int] = None,
+    pinned: Sequence[int] = (),
+) -> Optional[int]:
+    """Find where block starts in lines, returns None if it is not found.
+
+    When several positions match equally well the one closest to hint wins.
+    Fuzzy matching only considers starts within window lines of hint, or
+    the whole file when window is None. Block lines at the pinned indices
+    must match up to whitespace even then, pinning every line disables
+    fuzzy matching.
+    """
+    if not block:
+        return max(0, min(hint, len(lines)))
+
+    size = len(block)
+    starts = range(0, len(lines) - size + 1)
+    by_distance = sorted(starts, key=lambda i: abs(i - hint))
+
+    lines, block = list(lines), list(block)
+    for i in by_distance:
+        if lines[i:i + size] == block:
+            return i
+
+    stripped = [line.strip() for line in block]
+    stripped_lines = [line.strip() for line in lines]
+    for i in by_distance:
+        if stripped_lines[i:i + size] == stripped:
+            return i
+
+    pinned = sorted(set(pinned))
+    if len(pinned) == size:
+        return None
+    if window is not None:
+        by_distance = [i for i in by_distance if abs(i - hint) <= window]
+    deadline = time.monotonic() + PATCH_FUZZY_TIME_BUDGET
+    matcher = difflib.SequenceMatcher(None, autojunk=False)
+    # seq2 is the one SequenceMatcher indexes, set it once
+    matcher.set_seq2("\n".join(stripped))
+    best, best_ratio = None, PATCH_FUZZY_THRESHOLD
+    for i in by_distance:
+        if time.monotonic() > deadline:
+            break
+        if any(stripped_lines[i + j] != stripped[j] for j in pinned):
+            continue
+        matcher.set_seq1("\n".join(stripped_lines[i:i + size]))
+        if matcher.real_quick_ratio() <= best_ratio or matcher.quick_ratio() <= best_ratio:
+            continue
+        ratio = matcher.ratio()
+        if ratio > best_ratio:
+            best, best_ratio = i, ratio
+    return best
+
+
+def parse_unified_diff(diff: str) -> List[Hunk]:
+    """Parse the hunks of a unified diff.
+
+    A hunk ends when the line counts from its header are used up, anything
+    after that up to the next header (trailing blank lines, file headers)
+    is ignored.
+    """
+    hunks: List[Hunk] = []
+    current: Optional[Hunk] = None
+    old_left = new_left = 0
+    for line in diff.splitlines():
+        header = _HUNK_HEADER.match(line)
+        if header:
+            current = Hunk(old_start=int(header.group(1)), lines=[])
+            hunks.append(current)
+            old_left = int(header.group(2)) if header.group(2) is not None else 1
+            new_left = int(header.group(4)) if header.group(4) is not None else 1
+            continue
+        if current is None or (old_left <= 0 and new_left <= 0):
+            # File headers, anything before the first hunk or after its end
+            continue
+        if line.startswith("\\"):
+            # "\ No newline at end of file"
+            continue
+        if line.startswith("+"):
+            current.lines.append(("+", line[1:]))
+            new_left -= 1
+        elif line.startswith("-"):
+            current.lines.append(("-", line[1:]))
+            old_left -= 1
+        else:
+            # Context line, some generators drop the leading space of empty lines
+            current.lines.append((" ", line[1:] if line.startswith(" ") else line))
+            old_left -= 1
+            new_left -= 1
+
+    if not hunks:
+        raise PatchError("No hunks found in patch")
+    return hunks
+
+
+def apply_unified_diff(content: str, diff: str) -> str:
+    lines, trailing_newline = _split(content)
+    offset = 0
+    for number, hunk in enumerate(parse_unified_diff(diff), start=1):
+        old_lines = hunk.old_lines
+        hint = max(hunk.old_start - 1 + offset, 0)
+        start = find_block(
+            lines, old_lines, hint, window=PATCH_FUZZY_WINDOW, pinned=hunk.removed
+        )
+        if start is None:
+            preview = "\n".join(old_lines[:3])
+            raise PatchError(f"Hunk {number} does not match the file:\n{preview}")
+        new_lines = hunk.apply_to(lines[start:start + len(old_lines)])
+        lines[start:start + len(old_lines)] = new_lines
+        offset = start + len(new_lines) - (hunk.old_start - 1 + len(old_lines))
+    return _join(lines, trailing_newline)
+
+
+def apply_search_replace(content: str, edits: Sequence[Tuple[str, str]]) -> str:
+    """Apply (search, replace) pairs in order.
+
+    An exact search string must occur once. Otherwise the search text is
+    located line by line ignoring leading/trailing whitespace, never fuzzily
+    since all of it is replaced.
+    """
+    for number, (search, replace) in enumerate(edits, start=1):
+        if not search:
+            raise PatchError(f"Edit {number} has an empty search text")
+
+        count = content.count(search)
+        if count == 1:
+            content = content.replace(search, replace, 1)
+            continue
+        if count > 1:
+            raise PatchError(
+                f"Edit {number} search text occurs {count} times, include more context"
+            )
+
+        lines, trailing_newline = _split(content)
+        block = search.strip("\n").splitlines()
+        start = find_block(lines, block, pinned=range(len(block)))
+        if start is None:
+            preview = "\n".join(block[:3])
+            raise PatchError(f"Edit {number} search text not found:\n{preview}")
+        lines[start:start + len(block)] = replace.strip("\n").splitlines()
+        content = _join(lines, trailing_newline)
+    return content
@@ -0,0 +1,308 @@
+"""Content-addressed file storage with per-path version history.
+
+File contents are stored once in ``file_blobs``, keyed by their SHA-256.
+Every write appends a row to ``file_versions`` pointing at a blob, and the
+``project_files`` row points at its current version and blob. Identical
+content in the history (auto-heal rewrites, scaffold files shared by many
+projects) is therefore stored once, and the blob is the only copy of a
+file's content. Readers that need the content use the
+``project_file_contents`` view (migration 0012), a rollback only moves the
+version and blob pointers.
+
+Blobs are stored as text in ``file_blobs.content`` so the view and code
+search can read them in SQL, Postgres compresses large values itself.
+Older blobs may still be stored zstd compressed in ``data``, those are
+converted to text before they become the head of a file again.
+
+All writes to ``project_files`` go through ``record_versions()``.
+"""
+
+import hashlib
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from uuid import UUID, uuid4
+
+import asyncpg
+
+try:
+    import zstandard
+except ImportError:  # Only needed to read blobs written compressed
+    zstandard = None
+
+
+def content_hash(content: str) -> str:
+    """SHA-256 hex digest of the UTF-8 encoded content."""
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def decode_blob(data: bytes, compression: Optional[str]) -> str:
+    if compression == "zstd":
+        if zstandard is None:
+            raise RuntimeError("Blob is zstd compressed but zstandard is not installed")
+        data = zstandard.ZstdDecompressor().decompress(data)
+    return bytes(data).decode("utf-8")
+
+
+async def put_blobs(conn: asyncpg.Connection, contents: Sequence[str]) -> List[str]:
+    """Store contents that are not stored yet, returns their hashes in order.
+
+    Content that is only stored compressed is stored as text again, it is
+    about to become the head of a file.
+    """
+    digests = [content_hash(content) for content in contents]
+    existing = {
+        row["hash"]
+        for row in await conn.fetch(
+            """
+            SELECT hash FROM file_blobs
+            WHERE hash = ANY($1::text[]) AND content IS NOT NULL
+            """,
+            list(set(digests)),
+        )
+    }
+
+    new_blobs = {}
+    for digest, content in zip(digests, contents):
+        if digest not in existing and digest not in new_blobs:
+            new_blobs[digest] = (digest, len(content.encode("utf-8")), content)
+
+    if new_blobs:
+        await conn.executemany(
+            """
+            INSERT INTO file_blobs (hash, size, content)
+            VALUES ($1, $2, $3)
+            ON CONFLICT (hash) DO UPDATE SET
+                content = EXCLUDED.content, data = NULL, compression = NULL
+            WHERE file_blobs.content IS NULL
+            """,
+            list(new_blobs.values()),
+        )
+    return digests
+
+
+async def get_blob(conn: asyncpg.Connection, digest: str) -> Optional[str]:
+    row = await conn.fetchrow(
+        "SELECT content, data, compression FROM file_blobs WHERE hash = $1", digest
+    )
+    if not row:
+        return None
+    if row["content"] is not None:
+        return row["content"]
+    return decode_blob(row["data"], row["compression"])
+
+
+async def _materialize_blob(conn: asyncpg.Connection, digest: str) -> Optional[str]:
+    """Convert a compressed blob to text, returns its content."""
+    content = await get_blob(conn, digest)
+    if content is not None:
+        await conn.execute(
+            """
+            UPDATE file_blobs SET content = $2, data = NULL, compression = NULL
+            WHERE hash = $1 AND content IS NULL
+            """,
+            digest,
+            content,
+        )
+    return content
+
+
+async def record_versions(
+    conn: asyncpg.Connection,
+    project_id: UUID,
+    files: Sequence[Tuple[str, str, Optional[str]]],
+) -> Dict[str, Dict[str, Any]]:
+    """Write (filepath, content, language) tuples to project_files.
+
+    Missing rows are created, each file gets a new version unless its
+    content did not change. Returns version info per filepath, with the
+    row's file_id and whether it was created. Run it inside a transaction.
+    """
+    filepaths = [filepath for filepath, _, _ in files]
+    digests = await put_blobs(conn, [content for _, content, _ in files])
+
+    rows = await conn.fetch(
+        """
+        INSERT INTO project_files (id, project_id, filepath, language)
+        SELECT f.id, $1, f.filepath, f.language
+        FROM unnest($2::uuid[], $3::text[], $4::text[]) AS f(id, filepath, language)
+        ON CONFLICT (project_id, filepath) DO UPDATE SET
+            language = COALESCE(EXCLUDED.language, project_files.language),
+            updated_at = CURRENT_TIMESTAMP
+        RETURNING id, filepath, (xmax = 0) AS created
+        """,
+        project_id,
+        [uuid4() for _ in files],
+        filepaths,
+        [language for _, _, language in files],
+    )
+    written = {row["filepath"]: row for row in rows}
+
+    heads = {
+        row["filepath"]: row
+        for row in await conn.fetch(
+            """
+            SELECT pf.filepath, pf.current_version_id, pf.blob_hash, cv.version AS current_version
+            FROM project_files pf
+            LEFT JOIN file_versions cv ON cv.id = pf.current_version_id
+            WHERE pf.project_id = $1 AND pf.filepath = ANY($2::text[])
+            FOR UPDATE OF pf
+            """,
+            project_id,
+            filepaths,
+        )
+    }
+    versions = {
+        row["filepath"]: row
+        for row in await conn.fetch(
+            """
+            SELECT DISTINCT ON (filepath) filepath, id, version FROM file_versions
+            WHERE project_id = $1 AND filepath = ANY($2::text[])
+            ORDER BY filepath, version DESC
+            """,
+            project_id,
+            filepaths,
+        )
+    }
+
+    results: Dict[str, Dict[str, Any]] = {}
+    new_rows = []
+    for (filepath, _, language), digest in zip(files, digests):
+        head = heads.get(filepath)
+        if head and head["blob_hash"] == digest and head["current_version_id"]:
+            # Unchanged content, nothing to append
+            results[filepath] = {
+                "version_id": str(head["current_version_id"]),
+                "version": head["current_version"],
+                "hash": digest,
+            }
+        else:
+            latest = versions.get(filepath)
+            version_id = uuid4()
+            version = (latest["version"] if latest else 0) + 1
+            versions[filepath] = {"id": version_id, "version": version}
+            new_rows.append(
+                (
+                    version_id,
+                    project_id,
+                    filepath,
+                    version,
+                    digest,
+                    head["current_version_id"] if head else None,
+                    language,
+                )
+            )
+            results[filepath] = {"version_id": str(version_id), "version": version, "hash": digest}
+        results[filepath]["file_id"] = str(written[filepath]["id"])
+        results[filepath]["created"] = written[filepath]["created"]
+
+    if new_rows:
+        await conn.executemany(
+            """
+            INSERT INTO file_versions (id, project_id, filepath, version, blob_hash, parent_id, language)
+            VALUES ($1, $2, $3, $4, $5, $6, $7)
+            """,
+            new_rows,
+        )
+        await conn.execute(
+            """
+            UPDATE project_files AS pf
+            SET blob_hash = v.blob_hash, current_version_id = v.id
+            FROM unnest($2::text[], $3::text[], $4::uuid[]) AS v(filepath, blob_hash, id)
+            WHERE pf.project_id = $1 AND pf.filepath = v.filepath
+            """,
+            project_id,
+            [row[2] for row in new_rows],
+            [row[4] for row in new_rows],
+            [row[0] for row in new_rows],
+        )
+    return results
+
+
+async def record_version(
+    conn: asyncpg.Connection,
+    project_id: UUID,
+    filepath: str,
+    content: str,
+    language: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Single file variant of record_versions()."""
+    results = await record_versions(conn, project_id, [(filepath, content, language)])
+    return results[filepath]
+
+
+async def list_versions(
+    conn: asyncpg.Connection, project_id: UUID, filepath: str
+) -> List[Dict[str, Any]]:
+    rows = await conn.fetch(
+        """
+        SELECT v.id, v.version, v.blob_hash, v.parent_id, v.language, v.created_at,
+               b.size, (pf.current_version_id = v.id) AS is_current
+        FROM file_versions v
+        JOIN file_blobs b ON b.hash = v.blob_hash
+        LEFT JOIN project_files pf
+            ON pf.project_id = v.project_id AND pf.filepath = v.filepath
+        WHERE v.project_id = $1 AND v.filepath = $2
+        ORDER BY v.version DESC
+        """,
+        project_id,
+        filepath,
+    )
+    return [
+        {
+            "version_id": str(row["id"]),
+            "version": row["version"],
+            "hash": row["blob_hash"],
+            "parent_id": str(row["parent_id"]) if row["parent_id"] else None,
+            "language": row["language"],
+            "size": row["size"],
+            "is_current": bool(row["is_current"]),
+            "created_at": row["created_at"].isoformat(),
+        }
+        for row in rows
+    ]
+
+
+async def rollback_file(
+    conn: asyncpg.Connection, project_id: UUID, filepath: str, version: int
+) -> Optional[Dict[str, Any]]:
+    """Point a file back at an earlier version, returns None if it does not exist.
+
+    Only the version and blob pointers move, a compressed blob is converted
+    to text first so the file's content stays readable in SQL. The version
+    chain is append-only, the next write after a rollback gets the rolled
+    back version as its parent.
+    """
+    target = await conn.fetchrow(
+        """
+        SELECT id, blob_hash, language FROM file_versions
+        WHERE project_id = $1 AND filepath = $2 AND version = $3
+        """,
+        project_id,
+        filepath,
+        version,
+    )
+    if not target:
+        return None
+
+    content = await _materialize_blob(conn, target["blob_hash"])
+    result = await conn.execute(
+        """
+        UPDATE project_files
+        SET current_version_id = $1, blob_hash = $2,
+            language = COALESCE($3, language), updated_at = CURRENT_TIMESTAMP
+        WHERE project_id = $4 AND filepath = $5
+        """,
+        target["id"],
+        target["blob_hash"],
+        target["language"],
+        project_id,
+        filepath,
+    )
+    if result == "UPDATE 0":
+        return None
+    return {
+        "version_id": str(target["id"]),
+        "version": version,
+        "hash": target["blob_hash"],
+        "content": content,
+        "language": target["language"],
+    }
@@ -0,0 +1,298 @@
+"""Shared, content-addressed node_modules store for preview builds.
+
+Store entries are keyed by the resolved dependency set: a hash of the
+package-lock.json npm wrote when installing them. The declared set in
+package.json (where detected packages are "latest") maps to its current
+resolution through ``NODE_MODULES_STORE/.resolutions/{declared hash}``.
+A resolution is trusted for NODE_MODULES_RESOLVE_TTL seconds; after that the
+declared set is installed again, so floating versions are picked up, and if
+npm resolves the same lockfile the existing entry is reused.
+
+A workspace whose node_modules was hydrated from the current resolution skips
+the install entirely. Otherwise node_modules is hydrated from
+``NODE_MODULES_STORE/{resolved hash}`` with hardlinks (``cp -al``, falling back to
+reflink copies across filesystems), so projects with the same dependencies
+share one copy on disk. A missing store entry is installed once in a
+staging directory, using the local npm cache first (``--prefer-offline``,
+or ``--offline`` with NPM_OFFLINE=1 so it works without network).
+
+Build workers share the store, so every entry is guarded by a cross-process
+lock (``app.libs.file_lock``): storing and evicting take it exclusively,
+hydrating shared. Installs of a declared set are serialized by a lock on
+the declared hash. An entry completed by another process in the meantime is
+reused, never reinstalled over.
+
+Store entries are evicted least recently used first once they exceed
+NODE_MODULES_STORE_BUDGET_MB, entries being hydrated from are skipped. Files are shared between workspaces, so
+nothing may modify files inside node_modules in place: the Vite cache
+lives outside node_modules (``cacheDir`` in vite.config.ts).
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+from uuid import uuid4
+
+from app.libs.build_manager import Build, BuildError, run_command
+from app.libs.file_lock import file_lock, lock_path, try_file_lock
+
+NODE_MODULES_STORE = Path(os.environ.get("NODE_MODULES_STORE", "/disk/backend/.node-modules-store"))
+NODE_MODULES_STORE_BUDGET_MB = int(os.environ.get("NODE_MODULES_STORE_BUDGET_MB", 20480))
+NPM_CACHE_DIR = Path(os.environ.get("NPM_CACHE_DIR", "/disk/backend/.npm-cache"))
+NPM_OFFLINE = os.environ.get("NPM_OFFLINE", "").lower() in ("1", "true", "yes")
+NPM_INSTALL_TIMEOUT = float(os.environ.get("NPM_INSTALL_TIMEOUT", 120))
+NODE_MODULES_RESOLVE_TTL = float(os.environ.get("NODE_MODULES_RESOLVE_TTL", 24 * 3600))
+
+# Written into a workspace's node_modules, holds the resolved hash it was hydrated from
+DEPS_MARKER = ".riff-deps-hash"
+# Written into a store entry once its install completed
+COMPLETE_MARKER = ".complete"
+# Declared hash -> resolved hash, see module docstring
+RESOLUTIONS_DIR = ".resolutions"
+
+
+def dependency_hash(package_json: Dict[str, Any]) -> str:
+    """Hash of the declared dependency set, independent of key order."""
+    deps = {
+        "dependencies": package_json.get("dependencies", {}),
+        "devDependencies": package_json.get("devDependencies", {}),
+    }
+    canonical = json.dumps(deps, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def lockfile_hash(lockfile: Path) -> Optional[str]:
+    """Hash of the resolved packages in a package-lock.json, None without one."""
+    try:
+        lock = json.loads(lockfile.read_text())
+    except (OSError, ValueError):
+        return None
+    resolved = lock.get("packages") or lock.get("dependencies") or {}
+    canonical = json.dumps(resolved, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def _dir_size(path: Path) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+class NodeModulesStore:
+    """Installs dependency sets once and hardlinks them into workspaces."""
+
+    def __init__(
+        self,
+        root: Path = NODE_MODULES_STORE,
+        budget_mb: int = NODE_MODULES_STORE_BUDGET_MB,
+    ):
+        self.root = root
+        self.budget_bytes = budget_mb * 1024 * 1024
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self.hits = 0
+        self.misses = 0
+        self.skips = 0
+
+    def _entry(self, key: str) -> Path:
+        return self.root / key
+
+    def _is_complete(self, key: str) -> bool:
+        return (self._entry(key) / COMPLETE_MARKER).exists()
+
+    def _resolution_path(self, declared: str) -> Path:
+        return self.root / RESOLUTIONS_DIR / f"{declared}.json"
+
+    def resolution(self, package_json: Dict[str, Any]) -> Optional[str]:
+        """Resolved hash of the declared set if it is current and stored."""
+        try:
+            data = json.loads(self._resolution_path(dependency_hash(package_json)).read_text())
+        except (OSError, ValueError):
+            return None
+        key = data.get("key")
+        if not key or time.time() - data.get("resolved_at", 0) > NODE_MODULES_RESOLVE_TTL:
+            return None
+        return key if self._is_complete(key) else None
+
+    def _save_resolution(self, declared: str, key: str):
+        path = self._resolution_path(declared)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{path.name}.{uuid4().hex[:8]}")
+        tmp.write_text(json.dumps({"key": key, "resolved_at": time.time()}))
+        os.replace(tmp, path)
+
+    async def ensure(self, build: Build, workspace: Path, package_json: Dict[str, Any]) -> str:
+        """Make workspace/node_modules match package_json.
+
+        Returns "skipped", "hydrated" or "installed".
+        """
+        declared = dependency_hash(package_json)
+        marker = workspace / "node_modules" / DEPS_MARKER
+        key = self.resolution(package_json)
+        if key is not None:
+            try:
+                if marker.read_text().strip() == key:
+                    self.skips += 1
+                    build.log(f"[DEPS] Dependencies unchanged ({key[:12]}), skipping install")
+                    return "skipped"
+            except OSError:
+                pass
+
+        outcome = "hydrated"
+        lock = self._locks.setdefault(declared, asyncio.Lock())
+        async with lock:
+            key = self.resolution(package_json)
+            if key is None:
+                # Exclusive per declared set, other processes install it at most once
+                async with file_lock(lock_path(self.root, f"install-{declared}")):
+                    key = self.resolution(package_json)
+                    if key is None:
+                        self.misses += 1
+                        outcome = "installed"
+                        key = await self._populate(build, declared, package_json)
+                        self._save_resolution(declared, key)
+            else:
+                self.hits += 1
+            # Shared, other processes may hydrate at the same time
+            async with file_lock(lock_path(self.root, key), shared=True):
+                if not self._is_complete(key):
+                    raise BuildError(f"node_modules store entry {key[:12]} was evicted, retry the build")
+                await self._hydrate(build, key, workspace)
+
+        marker.write_text(key)
+        await asyncio.to_thread(self.evict, keep=key)
+        return outcome
+
+    async def _populate(self, build: Build, declared: str, package_json: Dict[str, Any]) -> str:
+        """Install the declared set and store it under its resolved hash.
+
+        The caller holds the declared set's install lock. Returns the
+        resolved hash, an existing entry for it is kept as is.
+        """
+        self.root.mkdir(parents=True, exist_ok=True)
+        NPM_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        staging = self.root / f".staging-{declared[:12]}-{uuid4().hex[:8]}"
+        staging.mkdir()
+        try:
+            (staging / "package.json").write_text(json.dumps(package_json, indent=2))
+            build.log(f"[DEPS] Installing dependency set {declared[:12]} into shared store...")
+            args = [
+                "npm", "install",
+                "--legacy-peer-deps", "--no-audit", "--no-fund",
+                "--cache", str(NPM_CACHE_DIR),
+                "--offline" if NPM_OFFLINE else "--prefer-offline",
+            ]
+            result = await run_command(build, args, cwd=staging, timeout=NPM_INSTALL_TIMEOUT)
+            if result.returncode != 0:
+                raise BuildError(f"npm install failed:\n{result.stderr}")
+            if not (staging / "node_modules").exists():
+                (staging / "node_modules").mkdir()
+
+            key = lockfile_hash(staging / "package-lock.json") or declared
+            async with file_lock(lock_path(self.root, key)):
+                if self._is_complete(key):
+                    build.log(f"[DEPS] Resolved to stored set {key[:12]}, reusing it")
+                    return key
+                size = await asyncio.to_thread(_dir_size, staging)
+                (staging / COMPLETE_MARKER).write_text(json.dumps({"size": size, "created_at": time.time()}))
+                entry = self._entry(key)
+                if entry.exists():
+                    # Incomplete, left over from an interrupted install
+                    await asyncio.to_thread(shutil.rmtree, entry, True)
+                os.replace(staging, entry)
+            build.log(f"[DEPS] Stored {key[:12]} ({size // (1024 * 1024)} MB)")
+            return key
+        finally:
+            if staging.exists():
+                await asyncio.to_thread(shutil.rmtree, staging, True)
+
+    async def _hydrate(self, build: Build, key: str, workspace: Path):
+        """Replace workspace/node_modules with links to the store entry."""
+        entry = self._entry(key)
+        target = workspace / "node_modules"
+        if target.exists() or target.is_symlink():
+            await asyncio.to_thread(shutil.rmtree, target, True)
+
+        source = str(entry / "node_modules")
+        result = await run_command(build, ["cp", "-al", source, str(target)], cwd=workspace)
+        if result.returncode != 0:
+            # Hardlinks do not work across filesystems, copy (reflink if possible)
+            await asyncio.to_thread(shutil.rmtree, target, True)
+            result = await run_command(
+                build, ["cp", "-a", "--reflink=auto", source, str(target)], cwd=workspace
+            )
+            if result.returncode != 0:
+                raise BuildError(f"Failed to hydrate node_modules:\n{result.stderr}")
+
+        lockfile = entry / "package-lock.json"
+        if lockfile.exists():
+            shutil.copyfile(lockfile, workspace / "package-lock.json")
+        # mtime of the entry is its last use, for LRU eviction
+        os.utime(entry)
+        build.log(f"[DEPS] Hydrated node_modules from store ({key[:12]})")
+
+    def evict(self, keep: Optional[str] = None) -> int:
+        """Remove least recently used entries over budget, returns bytes freed."""
+        if not self.root.exists():
+            return 0
+        entries = []
+        for entry in self.root.iterdir():
+            marker = entry / COMPLETE_MARKER
+            if entry.name.startswith(".") or not marker.exists():
+                continue
+            try:
+                size = json.loads(marker.read_text()).get("size", 0)
+                entries.append((entry.stat().st_mtime, entry, size))
+            except (OSError, ValueError):
+                continue
+
+        total = sum(size for _, _, size in entries)
+        freed = 0
+        for _, entry, size in sorted(entries, key=lambda e: e[0]):
+            if total <= self.budget_bytes:
+                break
+            if entry.name == keep:
+                continue
+            with try_file_lock(lock_path(self.root, entry.name)) as locked:
+                if not locked:
+                    # Being hydrated from or installed right now
+                    continue
+                shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+            freed += size
+            print(f"[DEPS] Evicted node_modules store entry {entry.name[:12]}")
+        return freed
+
+    def stats(self) -> Dict[str, Any]:
+        entries = 0
+        total = 0
+        if self.root.exists():
+            for entry in self.root.iterdir():
+                marker = entry / COMPLETE_MARKER
+                if marker.exists():
+                    entries += 1
+                    try:
+                        total += json.loads(marker.read_text()).get("size", 0)
+                    except (OSError, ValueError):
+                        pass
+        return {
+            "entries": entries,
+            "size_mb": round(total / (1024 * 1024), 1),
+            "budget_mb": self.budget_bytes // (1024 * 1024),
+            "hits": self.hits,
+            "misses": self.misses,
+            "skips": self.skips,
+            "offline": NPM_OFFLINE,
+        }
+
+
+node_modules_store = NodeModulesStore()
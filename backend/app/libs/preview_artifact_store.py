@@ -0,0 +1,183 @@
+"""Content-addressed store of built preview dists.
+
+Many builds are byte-for-byte repeats: an auto-heal attempt that changed
+nothing, a trigger_build after a no-op, a project forked from a template.
+Before building, ``compute_build_key()`` hashes everything that determines
+the output, which is every source and config file in the workspace, the
+dependency hash and BUILD_CONFIG_VERSION. If
+``PREVIEW_ARTIFACT_STORE/{key}/dist`` exists the project's preview is
+pointed at it and the build is skipped. Otherwise the finished dist is
+hardlinked into the store under its key.
+
+Entries are evicted least recently used first once the store exceeds
+PREVIEW_ARTIFACT_STORE_BUDGET_MB. Entries still served by a project are
+kept, and so are entries looked up or stored in the last
+PREVIEW_ARTIFACT_MIN_IDLE seconds: the build that did so (possibly in another
+build worker) may not have registered them as its preview yet. Storing and
+evicting an entry take its cross-process lock (``app.libs.file_lock``).
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional, Set
+from uuid import uuid4
+
+from app.libs.file_lock import blocking_file_lock, lock_path, try_file_lock
+
+PREVIEW_ARTIFACT_STORE = Path(os.environ.get("PREVIEW_ARTIFACT_STORE", "/disk/backend/.preview-artifacts"))
+PREVIEW_ARTIFACT_STORE_BUDGET_MB = int(os.environ.get("PREVIEW_ARTIFACT_STORE_BUDGET_MB", 5120))
+PREVIEW_ARTIFACT_MIN_IDLE = float(os.environ.get("PREVIEW_ARTIFACT_MIN_IDLE", 300))
+
+# Bump when the build pipeline changes its output for the same sources
+# (scaffold, Vite config, finalize_dist), so old artifacts are not reused
+BUILD_CONFIG_VERSION = "1"
+
+# Build outputs, caches and bookkeeping, not inputs of the build
+_KEY_EXCLUDED_DIRS = {"node_modules", "dist", ".vite-cache"}
+_KEY_EXCLUDED_FILES = {"package-lock.json"}
+
+COMPLETE_MARKER = ".complete"
+
+
+def compute_build_key(workspace: Path, deps_hash: str) -> str:
+    """Hash of everything that determines the build output.
+
+    Blocking, run it in a thread.
+    """
+    digest = hashlib.sha256()
+    digest.update(f"config:{BUILD_CONFIG_VERSION}\0deps:{deps_hash}\0".encode("utf-8"))
+    paths = []
+    for root, dirs, files in os.walk(workspace):
+        dirs[:] = [d for d in dirs if d not in _KEY_EXCLUDED_DIRS]
+        for name in files:
+            if name in _KEY_EXCLUDED_FILES or name.startswith(".riff-"):
+                continue
+            paths.append(Path(root) / name)
+
+    for path in sorted(paths):
+        digest.update(str(path.relative_to(workspace)).encode("utf-8") + b"\0")
+        digest.update(hashlib.sha256(path.read_bytes()).digest())
+    return digest.hexdigest()
+
+
+def _link_or_copy(src: str, dst: str):
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def _dir_size(path: Path) -> int:
+    return sum(p.stat().st_size for p in path.rglob("*") if p.is_file())
+
+
+class ArtifactStore:
+    """Dists by build key, with LRU eviction under a disk budget."""
+
+    def __init__(
+        self,
+        root: Path = PREVIEW_ARTIFACT_STORE,
+        budget_mb: int = PREVIEW_ARTIFACT_STORE_BUDGET_MB,
+    ):
+        self.root = root
+        self.budget_bytes = budget_mb * 1024 * 1024
+        self.hits = 0
+        self.misses = 0
+
+    def dist_path(self, key: str) -> Path:
+        return self.root / key / "dist"
+
+    def lookup(self, key: str) -> Optional[Path]:
+        """Dist stored for key, counted as a hit or miss."""
+        entry = self.root / key
+        if (entry / COMPLETE_MARKER).exists():
+            self.hits += 1
+            # mtime of the entry is its last use, for LRU eviction
+            os.utime(entry)
+            return entry / "dist"
+        self.misses += 1
+        return None
+
+    def store(self, key: str, dist_dir: Path) -> Path:
+        """Hardlink a finished dist into the store, returns the stored dist.
+
+        Blocking, run it in a thread. Vite replaces files in dist rather
+        than modifying them, so the links are not affected by later builds.
+        """
+        entry = self.root / key
+        if (entry / COMPLETE_MARKER).exists():
+            os.utime(entry)
+            return entry / "dist"
+
+        self.root.mkdir(parents=True, exist_ok=True)
+        with blocking_file_lock(lock_path(self.root, key)):
+            if (entry / COMPLETE_MARKER).exists():
+                # Stored by another build while we waited
+                os.utime(entry)
+                return entry / "dist"
+
+            staging = self.root / f".staging-{key[:12]}-{uuid4().hex[:8]}"
+            try:
+                shutil.copytree(dist_dir, staging / "dist", copy_function=_link_or_copy)
+                size = _dir_size(staging / "dist")
+                (staging / COMPLETE_MARKER).write_text(json.dumps({"size": size, "created_at": time.time()}))
+                if entry.exists():
+                    # Incomplete, left over from an interrupted store
+                    shutil.rmtree(entry, ignore_errors=True)
+                os.replace(staging, entry)
+            finally:
+                if staging.exists():
+                    shutil.rmtree(staging, ignore_errors=True)
+        return entry / "dist"
+
+    def evict(self, in_use: Set[str] = frozenset()) -> int:
+        """Remove least recently used entries over budget, returns bytes freed.
+
+        in_use holds dist paths that are being served and must be kept.
+        Blocking, run it in a thread.
+        """
+        if not self.root.exists():
+            return 0
+        entries = []
+        for entry in self.root.iterdir():
+            marker = entry / COMPLETE_MARKER
+            if entry.name.startswith(".") or not marker.exists():
+                continue
+            try:
+                size = json.loads(marker.read_text()).get("size", 0)
+                entries.append((entry.stat().st_mtime, entry, size))
+            except (OSError, ValueError):
+                continue
+
+        total = sum(size for _, _, size in entries)
+        freed = 0
+        now = time.time()
+        for last_used, entry, size in sorted(entries, key=lambda e: e[0]):
+            if total <= self.budget_bytes:
+                break
+            if str(entry / "dist") in in_use or now - last_used < PREVIEW_ARTIFACT_MIN_IDLE:
+                continue
+            with try_file_lock(lock_path(self.root, entry.name)) as locked:
+                if not locked:
+                    continue
+                shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+            freed += size
+            print(f"[ARTIFACTS] Evicted preview artifact {entry.name[:12]}")
+        return freed
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+            "budget_mb": self.budget_bytes // (1024 * 1024),
+        }
+
+
+artifact_store = ArtifactStore()
@@ -0,0 +1,286 @@
+"""Build-time preparation and cache-friendly serving of preview dists.
+
+``finalize_dist()`` runs once after every successful build, in a child
+process (``python -m app.libs.preview_assets DIST_DIR``) with the build
+command limits so compressing does not slow down the process serving it:
+
+- index.html gets its asset URLs rewritten to PREVIEW_BASE_PLACEHOLDER, the
+  serve endpoint only substitutes the project ID instead of running regexes
+- text assets get gzip variants, and brotli variants when the optional
+  ``brotli`` package is installed, kept only if smaller than the original
+- ``.riff-assets.json`` lists every file with its strong ETag and variants
+
+Serving answers If-None-Match with 304, picks the best variant for
+Accept-Encoding and marks Vite's content-hashed assets immutable. Small
+files are served from an in-memory LRU bounded by PREVIEW_ASSET_CACHE_MB.
+"""
+
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+from fastapi.responses import FileResponse, Response
+
+try:
+    import brotli
+except ImportError:  # Optional, only gzip variants are generated without it
+    brotli = None
+
+PREVIEW_ASSET_CACHE_MB = int(os.environ.get("PREVIEW_ASSET_CACHE_MB", 64))
+PREVIEW_ASSET_CACHE_MAX_ITEM_KB = int(os.environ.get("PREVIEW_ASSET_CACHE_MAX_ITEM_KB", 512))
+
+PREVIEW_BASE_PLACEHOLDER = "__RIFF_PREVIEW_BASE__"
+ASSET_MANIFEST_NAME = ".riff-assets.json"
+PREVIEW_HTML_NAME = ".riff-index.html"
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+_COMPRESSIBLE = {".js", ".mjs", ".css", ".html", ".json", ".svg", ".txt", ".map", ".xml", ".wasm"}
+_COMPRESS_MIN_BYTES = 1024
+_ENCODING_SUFFIX = {"br": ".br", "gzip": ".gz"}
+_ASSET_URL_RE = re.compile(r'(src|href)="(?:\./)?assets/([^"]+)"')
+
+mimetypes.add_type("application/javascript", ".js")
+mimetypes.add_type("application/javascript", ".mjs")
+
+
+def _etag(data: bytes) -> str:
+    return '"' + hashlib.sha256(data).hexdigest()[:32] + '"'
+
+
+def rewrite_index_html(html: str) -> str:
+    """Point asset URLs at the preview base placeholder."""
+    return _ASSET_URL_RE.sub(rf'\1="{PREVIEW_BASE_PLACEHOLDER}/assets/\2"', html)
+
+
+def _write_variants(path: Path, data: bytes) -> Dict[str, int]:
+    variants = {}
+    if path.suffix not in _COMPRESSIBLE or len(data) < _COMPRESS_MIN_BYTES:
+        return variants
+
+    compressed = gzip.compress(data, compresslevel=9, mtime=0)
+    if len(compressed) < len(data):
+        path.with_name(path.name + ".gz").write_bytes(compressed)
+        variants["gzip"] = len(compressed)
+
+    if brotli is not None:
+        compressed = brotli.compress(data, quality=11)
+        if len(compressed) < len(data):
+            path.with_name(path.name + ".br").write_bytes(compressed)
+            variants["br"] = len(compressed)
+    return variants
+
+
+def finalize_dist(dist_dir: Path) -> Dict[str, Any]:
+    """Prepare a dist for serving, returns the asset manifest.
+
+    Blocking, CPU heavy with brotli installed.
+    """
+    index_html = dist_dir / "index.html"
+    if index_html.exists():
+        (dist_dir / PREVIEW_HTML_NAME).write_text(rewrite_index_html(index_html.read_text()))
+
+    files: Dict[str, Dict[str, Any]] = {}
+    for path in sorted(dist_dir.rglob("*")):
+        if not path.is_file() or path.name.startswith(".riff-") or path.suffix in (".gz", ".br"):
+            continue
+        data = path.read_bytes()
+        files[str(path.relative_to(dist_dir))] = {
+            "etag": _etag(data),
+            "size": len(data),
+            "content_type": mimetypes.guess_type(path.name)[0] or "application/octet-stream",
+            "encodings": _write_variants(path, data),
+        }
+
+    preview_html = dist_dir / PREVIEW_HTML_NAME
+    if preview_html.exists():
+        data = preview_html.read_bytes()
+        files[PREVIEW_HTML_NAME] = {
+            "etag": _etag(data),
+            "size": len(data),
+            "content_type": "text/html; charset=utf-8",
+            "encodings": {},
+        }
+
+    manifest = {"files": files}
+    (dist_dir / ASSET_MANIFEST_NAME).write_text(json.dumps(manifest))
+    return manifest
+
+
+def choose_encoding(accept_encoding: Optional[str], available: Dict[str, int]) -> Optional[str]:
+    """Best available encoding the client accepts, br before gzip."""
+    if not accept_encoding or not available:
+        return None
+    accepted = set()
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        if params.replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        accepted.add(name.strip().lower())
+    for encoding in ("br", "gzip"):
+        if encoding in available and (encoding in accepted or "*" in accepted):
+            return encoding
+    return None
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return etag in candidates
+
+
+class AssetCache:
+    """LRU of small file contents bounded by total bytes."""
+
+    def __init__(
+        self,
+        budget_mb: int = PREVIEW_ASSET_CACHE_MB,
+        max_item_kb: int = PREVIEW_ASSET_CACHE_MAX_ITEM_KB,
+    ):
+        self.budget_bytes = budget_mb * 1024 * 1024
+        self.max_item_bytes = max_item_kb * 1024
+        self._items: "OrderedDict[Tuple[str, str], bytes]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, path: Path, etag: str) -> Optional[bytes]:
+        data = self._items.get((str(path), etag))
+        if data is None:
+            self.misses += 1
+            return None
+        self._items.move_to_end((str(path), etag))
+        self.hits += 1
+        return data
+
+    def put(self, path: Path, etag: str, data: bytes):
+        if len(data) > self.max_item_bytes or (str(path), etag) in self._items:
+            return
+        self._items[(str(path), etag)] = data
+        self._bytes += len(data)
+        while self._bytes > self.budget_bytes:
+            _, evicted = self._items.popitem(last=False)
+            self._bytes -= len(evicted)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "items": len(self._items),
+            "size_mb": round(self._bytes / (1024 * 1024), 1),
+            "budget_mb": self.budget_bytes // (1024 * 1024),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+asset_cache = AssetCache()
+
+# Manifests by (dist path, dist content hash)
+_manifests: Dict[Tuple[str, str], Dict[str, Any]] = {}
+
+
+def cached_asset_manifest(dist_dir: Path, content_hash: str) -> Optional[Dict[str, Any]]:
+    """Asset manifest if already loaded, never touches the disk."""
+    return _manifests.get((str(dist_dir), content_hash))
+
+
+def load_asset_manifest(dist_dir: Path, content_hash: str) -> Dict[str, Any]:
+    """Asset manifest of a dist, finalizing it first if that never happened.
+
+    Blocking on a cache miss, run it in a thread.
+    """
+    key = (str(dist_dir), content_hash)
+    manifest = _manifests.get(key)
+    if manifest is None:
+        try:
+            manifest = json.loads((dist_dir / ASSET_MANIFEST_NAME).read_text())
+        except (OSError, ValueError):
+            manifest = finalize_dist(dist_dir)
+        _manifests[key] = manifest
+        # Keep one manifest per dist
+        for stale in [k for k in _manifests if k[0] == key[0] and k != key]:
+            del _manifests[stale]
+    return manifest
+
+
+def _read_cached(path: Path, etag: str) -> bytes:
+    data = asset_cache.get(path, etag)
+    if data is None:
+        data = path.read_bytes()
+        asset_cache.put(path, etag, data)
+    return data
+
+
+def file_response(
+    dist_dir: Path,
+    relpath: str,
+    entry: Dict[str, Any],
+    accept_encoding: Optional[str],
+    if_none_match: Optional[str],
+    cache_control: str,
+) -> Response:
+    """Response for a dist file described by its manifest entry."""
+    encoding = choose_encoding(accept_encoding, entry.get("encodings", {}))
+    # Each representation gets its own strong ETag
+    etag = entry["etag"] if encoding is None else f'{entry["etag"][:-1]}-{encoding}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": cache_control,
+        "Vary": "Accept-Encoding",
+    }
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    path = dist_dir / relpath
+    size = entry["size"]
+    if encoding is not None:
+        path = path.with_name(path.name + _ENCODING_SUFFIX[encoding])
+        headers["Content-Encoding"] = encoding
+        size = entry["encodings"][encoding]
+
+    if size > asset_cache.max_item_bytes:
+        return FileResponse(path, media_type=entry["content_type"], headers=headers)
+    return Response(
+        content=_read_cached(path, etag),
+        media_type=entry["content_type"],
+        headers=headers,
+    )
+
+
+def html_response(
+    dist_dir: Path,
+    entry: Dict[str, Any],
+    project_id: str,
+    base: str,
+    if_none_match: Optional[str],
+) -> Response:
+    """The rewritten index.html with base substituted for the placeholder.
+
+    Artifacts are shared between projects with identical sources, so the
+    ETag covers the project and the base as well as the template.
+    """
+    etag = _etag(f"{entry['etag']}\0{project_id}\0{base}".encode("utf-8"))
+    headers = {"ETag": etag, "Cache-Control": REVALIDATE_CACHE_CONTROL}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    template = _read_cached(dist_dir / PREVIEW_HTML_NAME, entry["etag"]).decode("utf-8")
+    return Response(
+        content=template.replace(PREVIEW_BASE_PLACEHOLDER, base),
+        media_type="text/html; charset=utf-8",
+        headers=headers,
+    )
+
+
+if __name__ == "__main__":
+    import sys
+
+    finalize_dist(Path(sys.argv[1]))
@@ -0,0 +1,369 @@
+"""Durable registry of built previews with disk-budgeted eviction.
+
+Every successful preview build is recorded in ``preview_artifacts`` (dist
+path, workspace path, content hash, sizes, last access), so previews survive
+restarts and are visible to every replica sharing the disk. Lookups read
+through a short-lived in-memory cache (PREVIEW_REGISTRY_CACHE_TTL seconds).
+Like ``project_access_tracker``, serving a preview only records the access
+in memory and a background task writes pending accesses in one batched
+UPDATE.
+
+A janitor evicts the least recently used workspaces once their total size
+exceeds PREVIEW_DISK_BUDGET_MB. Previews used in the last
+PREVIEW_EVICT_MIN_IDLE seconds and projects reported busy (a build or
+watcher running) are never evicted. Builds hold ``workspace_lock()``, an
+advisory lock on a dedicated connection, so workspaces being built by another process (a build
+worker, another replica) are skipped as well. node_modules is not counted since it is
+hardlinked from the shared store, which has its own budget.
+"""
+
+import asyncio
+import hashlib
+import os
+import shutil
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Set, Tuple
+
+from app.libs.database import db_connection, get_db_connection
+
+PREVIEW_DISK_BUDGET_MB = int(os.environ.get("PREVIEW_DISK_BUDGET_MB", 10240))
+PREVIEW_JANITOR_INTERVAL = float(os.environ.get("PREVIEW_JANITOR_INTERVAL", 300))
+PREVIEW_EVICT_MIN_IDLE = float(os.environ.get("PREVIEW_EVICT_MIN_IDLE", 900))
+PREVIEW_REGISTRY_CACHE_TTL = float(os.environ.get("PREVIEW_REGISTRY_CACHE_TTL", 30))
+PREVIEW_ACCESS_FLUSH_INTERVAL = float(os.environ.get("PREVIEW_ACCESS_FLUSH_INTERVAL", 5))
+# How long a build waits for another build of the same workspace
+WORKSPACE_LOCK_TIMEOUT = float(os.environ.get("WORKSPACE_LOCK_TIMEOUT", 900))
+_WORKSPACE_LOCK_POLL = 0.5
+
+# Not counted towards the budget, see module docstring
+_UNCOUNTED_DIRS = {"node_modules"}
+
+
+@dataclass
+class PreviewArtifact:
+    project_id: str
+    build_id: str
+    dist_path: Path
+    workspace_path: Path
+    content_hash: str
+    size_bytes: int
+    workspace_size_bytes: int
+    last_accessed_at: Optional[datetime] = None
+
+
+def hash_directory(path: Path) -> Tuple[str, int]:
+    """Hash of all file paths and contents under path, returns (hash, size)."""
+    digest = hashlib.sha256()
+    size = 0
+    for file in sorted(p for p in path.rglob("*") if p.is_file()):
+        digest.update(str(file.relative_to(path)).encode("utf-8") + b"\0")
+        with open(file, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+                size += len(chunk)
+        digest.update(b"\0")
+    return digest.hexdigest(), size
+
+
+def directory_size(path: Path) -> int:
+    total = 0
+    for root, dirs, files in os.walk(path):
+        dirs[:] = [d for d in dirs if d not in _UNCOUNTED_DIRS]
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+def _workspace_lock_key(project_id: str) -> str:
+    return f"preview_build:{project_id}"
+
+
+@asynccontextmanager
+async def workspace_lock(project_id: str, timeout: float = WORKSPACE_LOCK_TIMEOUT) -> AsyncIterator[None]:
+    """Held while a build uses the project's workspace, across processes.
+
+    The advisory lock lives on a dedicated connection, so a build never
+    holds a pooled one for its whole duration. It is polled with
+    pg_try_advisory_lock, raises asyncio.TimeoutError after timeout seconds.
+    """
+    key = _workspace_lock_key(project_id)
+    conn = await get_db_connection()
+    try:
+        deadline = time.monotonic() + timeout
+        while not await conn.fetchval("SELECT pg_try_advisory_lock(hashtext($1))", key):
+            if time.monotonic() >= deadline:
+                raise asyncio.TimeoutError(
+                    f"Workspace of {project_id} still locked by another build after {timeout:.0f}s"
+                )
+            await asyncio.sleep(_WORKSPACE_LOCK_POLL)
+        yield
+    finally:
+        # Ending the session releases the lock
+        await conn.close()
+
+
+def _to_artifact(row) -> PreviewArtifact:
+    return PreviewArtifact(
+        project_id=row["project_id"],
+        build_id=row["build_id"],
+        dist_path=Path(row["dist_path"]),
+        workspace_path=Path(row["workspace_path"]),
+        content_hash=row["content_hash"],
+        size_bytes=row["size_bytes"],
+        workspace_size_bytes=row["workspace_size_bytes"],
+        last_accessed_at=row["last_accessed_at"],
+    )
+
+
+class PreviewRegistry:
+    """Read-through cache over preview_artifacts plus the eviction janitor."""
+
+    def __init__(
+        self,
+        budget_mb: int = PREVIEW_DISK_BUDGET_MB,
+        cache_ttl: float = PREVIEW_REGISTRY_CACHE_TTL,
+    ):
+        self.budget_bytes = budget_mb * 1024 * 1024
+        self.cache_ttl = cache_ttl
+        self._cache: Dict[str, Tuple[Optional[PreviewArtifact], float]] = {}
+        self._pending_access: Dict[str, datetime] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+        self._janitor_task: Optional[asyncio.Task] = None
+        self._is_busy: Callable[[str], bool] = lambda project_id: False
+        self.janitor_enabled = True
+        self.evictions = 0
+
+    def set_busy_check(self, is_busy: Callable[[str], bool]):
+        """Projects for which is_busy(project_id) is true are never evicted."""
+        self._is_busy = is_busy
+
+    def invalidate(self, project_id: Optional[str] = None):
+        if project_id is None:
+            self._cache.clear()
+        else:
+            self._cache.pop(str(project_id), None)
+
+    async def get(self, project_id: str) -> Optional[PreviewArtifact]:
+        """The project's current preview, None if it has not been built."""
+        project_id = str(project_id)
+        cached = self._cache.get(project_id)
+        if cached is not None and time.monotonic() - cached[1] < self.cache_ttl:
+            artifact = cached[0]
+        else:
+            async with db_connection() as conn:
+                row = await conn.fetchrow(
+                    "SELECT * FROM preview_artifacts WHERE project_id = $1", project_id
+                )
+            artifact = _to_artifact(row) if row else None
+            self._cache[project_id] = (artifact, time.monotonic())
+
+        if artifact is None or not (artifact.dist_path / "index.html").exists():
+            return None
+        return artifact
+
+    async def record(
+        self,
+        project_id: str,
+        build_id: str,
+        dist_dir: Path,
+        workspace: Path,
+        content_hash: Optional[str] = None,
+    ) -> PreviewArtifact:
+        """Register a successful build as the project's current preview.
+
+        The dist is hashed unless its content_hash is already known.
+        """
+        project_id = str(project_id)
+        if content_hash is None:
+            content_hash, size = await asyncio.to_thread(hash_directory, dist_dir)
+        else:
+            size = await asyncio.to_thread(directory_size, dist_dir)
+        workspace_size = await asyncio.to_thread(directory_size, workspace)
+        async with db_connection() as conn:
+            row = await conn.fetchrow(
+                """
+                INSERT INTO preview_artifacts (
+                    project_id, build_id, dist_path, workspace_path, content_hash,
+                    size_bytes, workspace_size_bytes, created_at, last_accessed_at
+                )
+                VALUES ($1, $2, $3, $4, $5, $6, $7, NOW(), NOW())
+                ON CONFLICT (project_id) DO UPDATE SET
+                    build_id = EXCLUDED.build_id,
+                    dist_path = EXCLUDED.dist_path,
+                    workspace_path = EXCLUDED.workspace_path,
+                    content_hash = EXCLUDED.content_hash,
+                    size_bytes = EXCLUDED.size_bytes,
+                    workspace_size_bytes = EXCLUDED.workspace_size_bytes,
+                    created_at = NOW(),
+                    last_accessed_at = NOW()
+                RETURNING *
+                """,
+                project_id,
+                build_id,
+                str(dist_dir),
+                str(workspace),
+                content_hash,
+                size,
+                workspace_size,
+            )
+        artifact = _to_artifact(row)
+        self._cache[project_id] = (artifact, time.monotonic())
+        self.start_janitor()
+        return artifact
+
+    async def referenced_dists(self) -> Set[str]:
+        """Dist paths some project's preview is served from."""
+        async with db_connection() as conn:
+            rows = await conn.fetch("SELECT DISTINCT dist_path FROM preview_artifacts")
+        return {row["dist_path"] for row in rows}
+
+    def touch(self, project_id: str):
+        """Record an access, the database is updated on the next flush."""
+        self._pending_access[str(project_id)] = datetime.now(timezone.utc)
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._run_flush())
+        self.start_janitor()
+
+    async def _run_flush(self):
+        while True:
+            await asyncio.sleep(PREVIEW_ACCESS_FLUSH_INTERVAL)
+            await self.flush()
+
+    async def flush(self):
+        """Write all pending accesses in one UPDATE."""
+        if not self._pending_access:
+            return
+
+        batch = self._pending_access
+        self._pending_access = {}
+        try:
+            async with db_connection() as conn:
+                await conn.execute(
+                    """
+                    UPDATE preview_artifacts AS a
+                    SET last_accessed_at = GREATEST(a.last_accessed_at, t.accessed_at)
+                    FROM unnest($1::text[], $2::timestamptz[]) AS t(project_id, accessed_at)
+                    WHERE a.project_id = t.project_id
+                    """,
+                    list(batch.keys()),
+                    list(batch.values()),
+                )
+        except Exception as e:
+            print(f"[PREVIEW] ⚠️ Failed to flush {len(batch)} access timestamps: {e}")
+            for project_id, accessed_at in batch.items():
+                self._pending_access.setdefault(project_id, accessed_at)
+
+    def start_janitor(self):
+        """Start the eviction janitor if it is not running."""
+        if not self.janitor_enabled:
+            return
+        if self._janitor_task is None or self._janitor_task.done():
+            self._janitor_task = asyncio.create_task(self._run_janitor())
+
+    async def _run_janitor(self):
+        while True:
+            await asyncio.sleep(PREVIEW_JANITOR_INTERVAL)
+            try:
+                await self.evict()
+            except Exception as e:
+                print(f"[PREVIEW] ⚠️ Janitor failed: {e}")
+
+    async def evict(self) -> List[str]:
+        """Remove least recently used workspaces until under budget.
+
+        Returns the evicted project IDs.
+        """
+        await self.flush()
+        async with db_connection() as conn:
+            rows = await conn.fetch(
+                """
+                SELECT project_id, workspace_path, workspace_size_bytes, last_accessed_at
+                FROM preview_artifacts
+                ORDER BY last_accessed_at ASC
+                """
+            )
+
+        total = sum(row["workspace_size_bytes"] for row in rows)
+        now = datetime.now(timezone.utc)
+        evicted = []
+        for row in rows:
+            if total <= self.budget_bytes:
+                break
+            project_id = row["project_id"]
+            last_access = max(
+                row["last_accessed_at"], self._pending_access.get(project_id, row["last_accessed_at"])
+            )
+            if (now - last_access).total_seconds() < PREVIEW_EVICT_MIN_IDLE or self._is_busy(project_id):
+                continue
+
+            lock_key = _workspace_lock_key(project_id)
+            async with db_connection() as conn:
+                # Built right now, possibly by another process
+                if not await conn.fetchval("SELECT pg_try_advisory_lock(hashtext($1))", lock_key):
+                    continue
+                try:
+                    # Only evict if no build replaced the row in the meantime
+                    deleted = await conn.fetchval(
+                        """
+                        DELETE FROM preview_artifacts
+                        WHERE project_id = $1 AND last_accessed_at = $2
+                        RETURNING project_id
+                        """,
+                        project_id,
+                        row["last_accessed_at"],
+                    )
+                    if deleted is not None:
+                        self.invalidate(project_id)
+                        await asyncio.to_thread(shutil.rmtree, row["workspace_path"], True)
+                finally:
+                    await conn.execute("SELECT pg_advisory_unlock(hashtext($1))", lock_key)
+            if deleted is None:
+                continue
+
+            total -= row["workspace_size_bytes"]
+            evicted.append(project_id)
+            self.evictions += 1
+            print(f"[PREVIEW] 🧹 Evicted preview workspace of {project_id} "
+                  f"({row['workspace_size_bytes'] // (1024 * 1024)} MB)")
+        return evicted
+
+    async def stats(self) -> Dict[str, Any]:
+        async with db_connection() as conn:
+            row = await conn.fetchrow(
+                """
+                SELECT COUNT(*) AS previews,
+                       COALESCE(SUM(workspace_size_bytes), 0) AS workspace_bytes,
+                       COALESCE(SUM(size_bytes), 0) AS dist_bytes
+                FROM preview_artifacts
+                """
+            )
+        return {
+            "previews": row["previews"],
+            "workspace_mb": round(row["workspace_bytes"] / (1024 * 1024), 1),
+            "dist_mb": round(row["dist_bytes"] / (1024 * 1024), 1),
+            "budget_mb": self.budget_bytes // (1024 * 1024),
+            "evictions": self.evictions,
+        }
+
+    async def stop(self):
+        """Stop background tasks and write pending accesses."""
+        for task in (self._flush_task, self._janitor_task):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._flush_task = None
+        self._janitor_task = None
+        await self.flush()
+
+
+preview_registry = PreviewRegistry()
@@ -0,0 +1,119 @@
+"""Versioned scaffold template for preview workspaces.
+
+The files every preview needs besides the project's own sources live on
+disk in ``preview_template/``:
+
+- ``base/`` is owned by the scaffold (Vite, Tailwind, PostCSS and TypeScript
+  config, index.html) and always matches the template
+- ``defaults/`` holds fallbacks (main.tsx, the ``app`` stub, UI stubs) that
+  are only added when the project does not provide the file itself
+
+The template version is the hash of the tree. It is staged once under
+PREVIEW_SCAFFOLD_STORE/{version} on the workspace disk and workspaces are
+seeded from there with hardlinks (copies across filesystems). The seeded
+version is recorded in the workspace, so ``base/`` is only re-linked when
+the template changes. Linked files are never modified in place, the
+workspace materializer replaces files atomically.
+
+index.html carries no project specific data, identical sources therefore
+produce identical builds for every project.
+"""
+
+import hashlib
+import os
+import shutil
+from functools import lru_cache
+from pathlib import Path
+from typing import List
+from uuid import uuid4
+
+SCAFFOLD_TEMPLATE_DIR = Path(__file__).parent / "preview_template"
+PREVIEW_SCAFFOLD_STORE = Path(os.environ.get("PREVIEW_SCAFFOLD_STORE", "/disk/backend/.preview-scaffold"))
+
+VERSION_MARKER = ".riff-scaffold-version"
+
+
+@lru_cache(maxsize=None)
+def scaffold_version() -> str:
+    """Hash of every path and file in the template tree."""
+    digest = hashlib.sha256()
+    for path in sorted(p for p in SCAFFOLD_TEMPLATE_DIR.rglob("*") if p.is_file()):
+        digest.update(str(path.relative_to(SCAFFOLD_TEMPLATE_DIR)).encode("utf-8") + b"\0")
+        digest.update(hashlib.sha256(path.read_bytes()).digest())
+    return digest.hexdigest()[:16]
+
+
+@lru_cache(maxsize=None)
+def _template_files(section: str) -> List[str]:
+    root = SCAFFOLD_TEMPLATE_DIR / section
+    return sorted(str(p.relative_to(root)) for p in root.rglob("*") if p.is_file())
+
+
+def _staged_template() -> Path:
+    """The template copied onto the workspace disk, so it can be hardlinked."""
+    staged = PREVIEW_SCAFFOLD_STORE / scaffold_version()
+    if staged.exists():
+        return staged
+
+    PREVIEW_SCAFFOLD_STORE.mkdir(parents=True, exist_ok=True)
+    staging = PREVIEW_SCAFFOLD_STORE / f".staging-{uuid4().hex[:8]}"
+    try:
+        shutil.copytree(SCAFFOLD_TEMPLATE_DIR, staging)
+        os.replace(staging, staged)
+    except OSError:
+        if not staged.exists():
+            raise
+        # Staged concurrently by another build
+    finally:
+        if staging.exists():
+            shutil.rmtree(staging, ignore_errors=True)
+    return staged
+
+
+def _link(src: Path, dst: Path):
+    """Atomically put a link (or copy) of src at dst."""
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    tmp = dst.with_name(f".{dst.name}.{uuid4().hex[:8]}.tmp")
+    try:
+        os.link(src, tmp)
+    except OSError:
+        shutil.copy2(src, tmp)
+    os.replace(tmp, dst)
+
+
+def _same_file(a: Path, b: Path) -> bool:
+    try:
+        return os.path.samefile(a, b) or a.read_bytes() == b.read_bytes()
+    except OSError:
+        return False
+
+
+def seed_workspace(workspace: Path) -> List[str]:
+    """Bring the workspace's scaffold up to the current template.
+
+    Returns the workspace relative paths that were written. Blocking, run
+    it in a thread.
+    """
+    version = scaffold_version()
+    marker = workspace / VERSION_MARKER
+    seeded = marker.read_text().strip() if marker.exists() else None
+    staged = _staged_template()
+    written = []
+
+    if seeded != version:
+        for relpath in _template_files("base"):
+            src, dst = staged / "base" / relpath, workspace / relpath
+            if not _same_file(src, dst):
+                _link(src, dst)
+                written.append(relpath)
+
+    # Defaults the project deleted or never had, one stat per file
+    for relpath in _template_files("defaults"):
+        dst = workspace / relpath
+        if not dst.exists():
+            _link(staged / "defaults" / relpath, dst)
+            written.append(relpath)
+
+    if seeded != version:
+        marker.write_text(version)
+    return written
@@ -0,0 +1,24 @@
+import { defineConfig } from 'vite'
+import react from '@vitejs/plugin-react-swc'
+import path from 'path'
+
+export default defineConfig({
+  plugins: [react()],
+  base: './',  // Use relative paths to avoid Riff routing conflicts
+  resolve: {
+    alias: {
+      '@': path.resolve(__dirname, './src'),
+      'app': path.resolve(__dirname, './src/app.ts'),
+    },
+  },
+  define: {
+    '__API_URL__': JSON.stringify('http://localhost:8000'),
+    '__APP_BASE_PATH__': JSON.stringify('/'),
+  },
+  // node_modules is hardlinked from a shared store, keep Vite's cache out of it
+  cacheDir: '.vite-cache',
+  build: {
+    outDir: 'dist',
+    emptyOutDir: true,
+  },
+})
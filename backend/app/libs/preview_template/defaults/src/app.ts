@@ -0,0 +1,18 @@
+// Stub for Riff 'app' framework module
+export const API_URL = 'http://localhost:8000';
+export const WS_API_URL = 'ws://localhost:8000';
+export const APP_BASE_PATH = '/';
+
+// Mock apiClient
+export const apiClient = {
+  get: async (url: string) => ({ data: { message: 'Mock API Response' } }),
+  post: async (url: string, data?: any) => ({ data: { message: 'Mock API Response' } }),
+  put: async (url: string, data?: any) => ({ data: { message: 'Mock API Response' } }),
+  delete: async (url: string) => ({ data: { message: 'Mock API Response' } }),
+};
+
+export enum Mode {
+  DEV = 'dev',
+  PROD = 'prod'
+}
+export const mode = Mode.DEV;
@@ -0,0 +1,6 @@
+import React from 'react';
+export const Alert = ({ type = 'info', message }: any) => (
+  <div className={`p-4 rounded ${type === 'error' ? 'bg-red-100 text-red-700' : 'bg-blue-100 text-blue-700'}`}>
+    {message}
+  </div>
+);
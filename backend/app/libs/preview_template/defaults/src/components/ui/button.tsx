@@ -0,0 +1,6 @@
+import React from 'react';
+export const Button = ({ children, onClick, className = '' }: any) => (
+  <button onClick={onClick} className={`px-4 py-2 bg-blue-500 text-white rounded hover:bg-blue-600 ${className}`}>
+    {children}
+  </button>
+);
@@ -0,0 +1,3 @@
+export { Button } from './button';
+export { Spinner } from './spinner';
+export { Alert } from './alert';
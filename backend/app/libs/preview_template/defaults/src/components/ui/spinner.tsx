@@ -0,0 +1,5 @@
+import React from 'react';
+export const Spinner = ({ size = 'medium' }: any) => (
+  <div className="animate-spin rounded-full border-4 border-gray-300 border-t-blue-500" 
+       style={{ width: size === 'large' ? '48px' : '24px', height: size === 'large' ? '48px' : '24px' }} />
+);
@@ -0,0 +1,332 @@
+"""Long-lived ``vite build --watch`` processes for actively edited projects.
+
+A cold ``npm run build`` takes tens of seconds. While a project is being
+edited its workspace keeps a Vite watcher running instead, which rebuilds
+incrementally whenever the workspace materializer writes changed files
+(see ``_run_preview_build``). Watcher state is derived from Vite's output:
+
+- ``build started...`` starts a cycle (state "building")
+- ``built in 123ms.`` ends it successfully (state "ready")
+- error output ends it with state "error", the lines are kept in ``errors``
+
+Each finished cycle bumps ``generation`` so callers can wait for the
+rebuild that follows their write. State changes and output are published
+to subscribers (server-sent events in ``app.apis.preview_watch``).
+
+Watchers stop after PREVIEW_WATCH_IDLE_TIMEOUT seconds without activity and
+at most PREVIEW_WATCH_MAX run at once, the least recently used is stopped
+to make room. They run with the build command limits (``command_preexec()``),
+a watcher that used up its CPU time exits and the next build is cold.
+"""
+
+import asyncio
+import os
+import re
+import signal
+import time
+from collections import deque
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set
+
+from app.libs.build_manager import command_preexec, read_lines
+
+PREVIEW_WATCH_IDLE_TIMEOUT = float(os.environ.get("PREVIEW_WATCH_IDLE_TIMEOUT", 600))
+PREVIEW_WATCH_MAX = int(os.environ.get("PREVIEW_WATCH_MAX", 10))
+PREVIEW_WATCH_AUTOSTART = os.environ.get("PREVIEW_WATCH_AUTOSTART", "1").lower() in ("1", "true", "yes")
+PREVIEW_WATCH_REAP_INTERVAL = 30
+# Events kept per subscriber, a slow one loses the oldest
+PREVIEW_WATCH_SUBSCRIBER_BUFFER = int(os.environ.get("PREVIEW_WATCH_SUBSCRIBER_BUFFER", 1000))
+# Files that are not part of Vite's module graph never trigger a rebuild,
+# stop waiting for one if it has not started after this many seconds
+PREVIEW_WATCH_TRIGGER_TIMEOUT = float(os.environ.get("PREVIEW_WATCH_TRIGGER_TIMEOUT", 3))
+# Error output arrives over several lines, give it a moment to complete
+_ERROR_SETTLE_SECONDS = 0.3
+
+_ANSI_RE = re.compile(r"\x1b\[[0-9;]*m")
+_BUILT_RE = re.compile(r"built in ([\d.]+)\s*(ms|s)\b")
+_ERROR_RE = re.compile(r"error during build|RollupError|\[vite:[\w-]+\].*(?:error|failed)|^\s*error\b", re.IGNORECASE)
+
+
+class ViteWatcher:
+    """A ``vite build --watch`` process for one project workspace."""
+
+    def __init__(self, project_id: str, workspace: Path):
+        self.project_id = project_id
+        self.workspace = workspace
+        self.state = "starting"
+        self.generation = 0
+        self.errors: List[str] = []
+        self.output: deque = deque(maxlen=500)
+        self.started_at = time.time()
+        self.last_activity = time.time()
+        self.last_built_at: Optional[float] = None
+        self.last_build_ms: Optional[float] = None
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self._cycle_started: Optional[float] = None
+        self._changed: Optional[asyncio.Condition] = None
+        self._subscribers: Set[asyncio.Queue] = set()
+        self._readers: Optional[asyncio.Future] = None
+
+    @property
+    def running(self) -> bool:
+        return self.process is not None and self.process.returncode is None
+
+    def touch(self):
+        self.last_activity = time.time()
+
+    def subscribe(self) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=PREVIEW_WATCH_SUBSCRIBER_BUFFER)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers.discard(queue)
+
+    def publish(self, event: Dict[str, Any]):
+        event = {"project_id": self.project_id, **event}
+        for queue in list(self._subscribers):
+            if queue.full():
+                # Slow subscriber, drop its oldest event instead of growing without bound
+                queue.get_nowait()
+            queue.put_nowait(event)
+
+    async def start(self):
+        vite = self.workspace / "node_modules" / ".bin" / "vite"
+        if not vite.exists():
+            raise RuntimeError(f"Vite not installed in {self.workspace}, run a preview build first")
+
+        self._changed = asyncio.Condition()
+        self.process = await asyncio.create_subprocess_exec(
+            str(vite), "build", "--watch",
+            cwd=self.workspace,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            # Own process group so esbuild children are stopped with it
+            start_new_session=True,
+            preexec_fn=command_preexec(),
+        )
+        self._readers = asyncio.gather(
+            self._pump(self.process.stdout, "stdout"),
+            self._pump(self.process.stderr, "stderr"),
+        )
+        self._readers.add_done_callback(lambda _: asyncio.ensure_future(self._on_exit()))
+        print(f"[{self.project_id}] 👀 Vite watcher started (PID {self.process.pid})")
+
+    async def _pump(self, stream: asyncio.StreamReader, name: str):
+        # Chunked reads, a single overlong line must not stop draining the pipe
+        async for line in read_lines(stream):
+            line = _ANSI_RE.sub("", line)
+            self.output.append(line)
+            self.publish({"type": "output", "stream": name, "line": line})
+            await self._handle_line(line)
+
+    async def _set_state(self, state: str, finished_cycle: bool = False):
+        self.state = state
+        if finished_cycle:
+            self.generation += 1
+            self.last_built_at = time.time()
+        async with self._changed:
+            self._changed.notify_all()
+        self.publish({
+            "type": "status",
+            "state": state,
+            "generation": self.generation,
+            "build_ms": self.last_build_ms,
+            "errors": self.errors if state == "error" else [],
+        })
+
+    async def _handle_line(self, line: str):
+        if "build started" in line:
+            self.errors = []
+            self._cycle_started = time.time()
+            await self._set_state("building")
+            return
+
+        if self.state == "error":
+            # Continuation of the error report
+            if line.strip() and "watching for file changes" not in line:
+                self.errors.append(line)
+            return
+
+        built = _BUILT_RE.search(line)
+        if built:
+            value, unit = float(built.group(1)), built.group(2)
+            self.last_build_ms = value * 1000 if unit == "s" else value
+            await self._set_state("ready", finished_cycle=True)
+            return
+
+        if _ERROR_RE.search(line):
+            self.errors = [line]
+            await self._set_state("error", finished_cycle=True)
+
+    async def _on_exit(self):
+        if self.process is not None and self.process.returncode is None:
+            await self.process.wait()
+        code = self.process.returncode if self.process else None
+        if self.state != "stopped":
+            print(f"[{self.project_id}] ⚠️ Vite watcher exited with code {code}")
+            await self._set_state("stopped")
+        self.publish({"type": "done", "returncode": code})
+
+    async def _wait_for(self, predicate, timeout: float):
+        async def condition():
+            async with self._changed:
+                await self._changed.wait_for(predicate)
+
+        await asyncio.wait_for(condition(), timeout)
+
+    async def wait_for_build(
+        self,
+        after_generation: int,
+        timeout: float,
+        trigger_timeout: float = PREVIEW_WATCH_TRIGGER_TIMEOUT,
+    ) -> str:
+        """Wait until a build cycle after after_generation finished.
+
+        If no cycle starts within trigger_timeout the written files did not
+        affect the build and the current state is returned. Returns the
+        watcher state ("ready", "error" or "stopped").
+        """
+        try:
+            await self._wait_for(
+                lambda: self.state in ("building", "stopped") or self.generation > after_generation,
+                trigger_timeout,
+            )
+        except asyncio.TimeoutError:
+            return self.state
+
+        await self._wait_for(
+            lambda: self.state == "stopped"
+            or (self.generation > after_generation and self.state != "building"),
+            timeout,
+        )
+        if self.state == "error":
+            await asyncio.sleep(_ERROR_SETTLE_SECONDS)
+        return self.state
+
+    async def wait_until_idle(self, timeout: float) -> str:
+        """Wait for a running build cycle to finish, returns the state."""
+        await self._wait_for(lambda: self.state not in ("building", "starting"), timeout)
+        if self.state == "error":
+            await asyncio.sleep(_ERROR_SETTLE_SECONDS)
+        return self.state
+
+    async def stop(self):
+        if self.state != "stopped":
+            self.state = "stopped"
+            if self._changed is not None:
+                async with self._changed:
+                    self._changed.notify_all()
+            self.publish({"type": "status", "state": "stopped", "generation": self.generation})
+
+        if not self.running:
+            return
+        try:
+            os.killpg(self.process.pid, signal.SIGTERM)
+            await asyncio.wait_for(self.process.wait(), 5)
+        except asyncio.TimeoutError:
+            os.killpg(self.process.pid, signal.SIGKILL)
+            await self.process.wait()
+        except ProcessLookupError:
+            pass
+        print(f"[{self.project_id}] Vite watcher stopped")
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "project_id": self.project_id,
+            "state": self.state,
+            "pid": self.process.pid if self.process else None,
+            "generation": self.generation,
+            "errors": self.errors,
+            "started_at": self.started_at,
+            "last_activity": self.last_activity,
+            "last_built_at": self.last_built_at,
+            "last_build_ms": self.last_build_ms,
+            "idle_seconds": round(time.time() - self.last_activity, 1),
+        }
+
+
+class PreviewWatchManager:
+    """Starts, tracks and reaps Vite watchers, one per project."""
+
+    def __init__(
+        self,
+        max_watchers: int = PREVIEW_WATCH_MAX,
+        idle_timeout: float = PREVIEW_WATCH_IDLE_TIMEOUT,
+    ):
+        self.max_watchers = max_watchers
+        self.idle_timeout = idle_timeout
+        self._watchers: Dict[str, ViteWatcher] = {}
+        self._lock: Optional[asyncio.Lock] = None
+        self._reaper: Optional[asyncio.Task] = None
+
+    def get(self, project_id: str) -> Optional[ViteWatcher]:
+        watcher = self._watchers.get(str(project_id))
+        if watcher is not None and watcher.state == "stopped":
+            self._watchers.pop(watcher.project_id, None)
+            return None
+        return watcher
+
+    async def start(self, project_id: str, workspace: Path) -> ViteWatcher:
+        """Start a watcher for the project, or return the running one."""
+        project_id = str(project_id)
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+
+        async with self._lock:
+            watcher = self.get(project_id)
+            if watcher is not None:
+                watcher.touch()
+                return watcher
+
+            while len(self._watchers) >= self.max_watchers:
+                oldest = min(self._watchers.values(), key=lambda w: w.last_activity)
+                print(f"[{oldest.project_id}] Stopping least recently used Vite watcher")
+                await self.stop(oldest.project_id)
+
+            watcher = ViteWatcher(project_id, workspace)
+            await watcher.start()
+            self._watchers[project_id] = watcher
+
+        if self._reaper is None or self._reaper.done():
+            self._reaper = asyncio.create_task(self._reap())
+        return watcher
+
+    async def stop(self, project_id: str) -> bool:
+        watcher = self._watchers.pop(str(project_id), None)
+        if watcher is None:
+            return False
+        await watcher.stop()
+        return True
+
+    async def stop_all(self):
+        """Stop every watcher, called on shutdown."""
+        if self._reaper is not None:
+            self._reaper.cancel()
+        for project_id in list(self._watchers):
+            await self.stop(project_id)
+
+    async def _reap(self):
+        while self._watchers:
+            await asyncio.sleep(PREVIEW_WATCH_REAP_INTERVAL)
+            now = time.time()
+            for watcher in list(self._watchers.values()):
+                if watcher.state == "stopped":
+                    self._watchers.pop(watcher.project_id, None)
+                elif now - watcher.last_activity > self.idle_timeout:
+                    print(f"[{watcher.project_id}] 💤 Vite watcher idle, stopping")
+                    await self.stop(watcher.project_id)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": len(self._watchers),
+            "max_watchers": self.max_watchers,
+            "idle_timeout": self.idle_timeout,
+            "autostart": PREVIEW_WATCH_AUTOSTART,
+        }
+
+    def list(self) -> List[Dict[str, Any]]:
+        return [watcher.to_dict() for watcher in self._watchers.values()]
+
+
+preview_watchers = PreviewWatchManager()
@@ -0,0 +1,93 @@
+"""Write-behind tracking of projects.last_accessed_at.
+
+Reading a project should not cost a synchronous UPDATE. Instead, reads call
+``project_access_tracker.touch(project_id)`` which only records the timestamp
+in memory. A background task flushes all pending touches in a single batched
+UPDATE every few seconds. On shutdown the app lifespan signals it to stop,
+it finishes a flush that is in progress and then writes the remainder.
+
+Configured through PROJECT_ACCESS_FLUSH_INTERVAL (seconds, default 5).
+"""
+
+import asyncio
+import os
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+from app.libs.database import db_connection
+
+PROJECT_ACCESS_FLUSH_INTERVAL = float(os.environ.get("PROJECT_ACCESS_FLUSH_INTERVAL", 5))
+
+
+class LastAccessTracker:
+    """Coalesces last_accessed_at updates and flushes them in batches."""
+
+    def __init__(self, flush_interval: float = PROJECT_ACCESS_FLUSH_INTERVAL):
+        self.flush_interval = flush_interval
+        self._pending: Dict[str, datetime] = {}
+        # The batch being written, still reported by pending_access()
+        self._flushing: Dict[str, datetime] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._stopping: Optional[asyncio.Event] = None
+
+    def touch(self, project_id: str):
+        """Record an access, the database is updated on the next flush."""
+        self._pending[str(project_id)] = datetime.now(timezone.utc)
+        if self._task is None or self._task.done():
+            self._stopping = asyncio.Event()
+            self._task = asyncio.create_task(self._run(self._stopping))
+
+    def pending_access(self, project_id: str) -> Optional[datetime]:
+        """Access time not yet written to the database, if any."""
+        project_id = str(project_id)
+        return self._pending.get(project_id) or self._flushing.get(project_id)
+
+    async def _run(self, stopping: asyncio.Event):
+        while not stopping.is_set():
+            try:
+                await asyncio.wait_for(stopping.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            await self.flush()
+
+    async def flush(self):
+        """Write all pending touches in one UPDATE."""
+        if not self._pending:
+            return
+
+        batch = self._pending
+        self._pending = {}
+        self._flushing = batch
+        try:
+            async with db_connection() as conn:
+                await conn.execute(
+                    """
+                    UPDATE projects AS p
+                    SET last_accessed_at = GREATEST(p.last_accessed_at, t.accessed_at)
+                    FROM unnest($1::uuid[], $2::timestamptz[]) AS t(id, accessed_at)
+                    WHERE p.id = t.id
+                    """,
+                    list(batch.keys()),
+                    list(batch.values()),
+                )
+        except Exception as e:
+            print(f"[ACCESS] ⚠️ Failed to flush {len(batch)} access timestamps: {e}")
+            # Put the batch back without overwriting newer touches
+            for project_id, accessed_at in batch.items():
+                self._pending.setdefault(project_id, accessed_at)
+        finally:
+            self._flushing = {}
+
+    async def stop(self):
+        """Stop the background flusher and write what is left.
+
+        The flusher is not cancelled, a batch it is writing would be lost.
+        """
+        if self._task is not None:
+            self._stopping.set()
+            await self._task
+            self._task = None
+        await self.flush()
+
+
+project_access_tracker = LastAccessTracker()
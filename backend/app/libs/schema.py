@@ -0,0 +1,425 @@
+"""Schema migrations owned by the Riff backend itself.
+
+Each migration is applied once, in its own transaction, and recorded in
+``app_schema_migrations``. ``apply_migrations()`` runs whenever the shared
+pool is created (see ``init_db_pool()``), so no query ever sees an old
+schema, and is safe to run from several replicas and build workers at once
+(guarded by an advisory lock).
+
+Add new migrations to the end of MIGRATIONS. Editing an applied one only
+changes new databases, so pair such an edit with a migration that brings
+existing ones to the same state (see 0001 and 0010). Migrations must be
+idempotent, a database may have applied an earlier version of one.
+"""
+
+# Arbitrary constant for pg_advisory_lock, shared by all replicas
+_SCHEMA_LOCK_KEY = 734_112_001
+
+MIGRATIONS: list[tuple[str, str]] = [
+    (
+        "0001_project_child_counters",
+        """
+        CREATE OR REPLACE FUNCTION projects_maintain_child_count() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'UPDATE' AND NEW.project_id IS NOT DISTINCT FROM OLD.project_id THEN
+                RETURN NULL;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                EXECUTE format('UPDATE projects SET %1$I = %1$I + 1 WHERE id = $1', TG_ARGV[0])
+                USING NEW.project_id;
+            END IF;
+            IF TG_OP IN ('DELETE', 'UPDATE') THEN
+                EXECUTE format('UPDATE projects SET %1$I = GREATEST(%1$I - 1, 0) WHERE id = $1', TG_ARGV[0])
+                USING OLD.project_id;
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        DO $$
+        BEGIN
+            -- Nothing to count on databases without the project tables
+            IF to_regclass('projects') IS NULL
+               OR to_regclass('project_features') IS NULL
+               OR to_regclass('project_integrations') IS NULL THEN
+                RETURN;
+            END IF;
+
+            ALTER TABLE projects ADD COLUMN IF NOT EXISTS feature_count integer NOT NULL DEFAULT 0;
+            ALTER TABLE projects ADD COLUMN IF NOT EXISTS integration_count integer NOT NULL DEFAULT 0;
+
+            DROP TRIGGER IF EXISTS project_features_count ON project_features;
+            CREATE TRIGGER project_features_count
+                AFTER INSERT OR DELETE OR UPDATE OF project_id ON project_features
+                FOR EACH ROW EXECUTE FUNCTION projects_maintain_child_count('feature_count');
+
+            DROP TRIGGER IF EXISTS project_integrations_count ON project_integrations;
+            CREATE TRIGGER project_integrations_count
+                AFTER INSERT OR DELETE OR UPDATE OF project_id ON project_integrations
+                FOR EACH ROW EXECUTE FUNCTION projects_maintain_child_count('integration_count');
+
+            UPDATE projects p SET
+                feature_count = (SELECT COUNT(*) FROM project_features pf WHERE pf.project_id = p.id),
+                integration_count = (SELECT COUNT(*) FROM project_integrations pi WHERE pi.project_id = p.id);
+        END;
+        $$;
+        """,
+    ),
+    (
+        "0002_generated_files_trgm",
+        """
+        DO $$
+        BEGIN
+            BEGIN
+                CREATE EXTENSION IF NOT EXISTS pg_trgm;
+            EXCEPTION WHEN OTHERS THEN
+                -- Not permitted, or the extension is not installed on the server
+                RAISE NOTICE 'pg_trgm not available (%), code search falls back to sequential scans', SQLERRM;
+            END;
+            -- The index on generated_files.file_content this created is
+            -- dropped by 0011, code search no longer reads generated_files
+        END;
+        $$;
+        """,
+    ),
+    (
+        "0003_file_blobs_and_versions",
+        """
+        CREATE TABLE IF NOT EXISTS file_blobs (
+            hash TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            compression TEXT,
+            data BYTEA NOT NULL,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+        );
+
+        CREATE TABLE IF NOT EXISTS file_versions (
+            id UUID PRIMARY KEY,
+            project_id UUID NOT NULL,
+            filepath TEXT NOT NULL,
+            version INTEGER NOT NULL,
+            blob_hash TEXT NOT NULL REFERENCES file_blobs (hash),
+            parent_id UUID REFERENCES file_versions (id),
+            language TEXT,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+            UNIQUE (project_id, filepath, version)
+        );
+
+        DO $$
+        BEGIN
+            -- Nothing to version on databases without project files
+            IF to_regclass('project_files') IS NOT NULL THEN
+                ALTER TABLE project_files ADD COLUMN IF NOT EXISTS blob_hash TEXT REFERENCES file_blobs (hash);
+                ALTER TABLE project_files ADD COLUMN IF NOT EXISTS current_version_id UUID
+                    REFERENCES file_versions (id) DEFERRABLE INITIALLY DEFERRED;
+
+                -- Existing files become version 1 of their chain
+                INSERT INTO file_blobs (hash, size, data)
+                SELECT DISTINCT ON (h.hash) h.hash, octet_length(h.data), h.data
+                FROM (
+                    SELECT encode(sha256(convert_to(content, 'UTF8')), 'hex') AS hash,
+                           convert_to(content, 'UTF8') AS data
+                    FROM project_files
+                    WHERE content IS NOT NULL
+                ) h
+                ON CONFLICT (hash) DO NOTHING;
+
+                UPDATE project_files
+                SET blob_hash = encode(sha256(convert_to(content, 'UTF8')), 'hex'),
+                    current_version_id = gen_random_uuid()
+                WHERE content IS NOT NULL AND current_version_id IS NULL;
+
+                INSERT INTO file_versions (id, project_id, filepath, version, blob_hash, language)
+                SELECT current_version_id, project_id, filepath, 1, blob_hash, language
+                FROM project_files
+                WHERE current_version_id IS NOT NULL
+                ON CONFLICT DO NOTHING;
+            END IF;
+        END;
+        $$;
+        """,
+    ),
+    (
+        "0004_generated_files_sync_index",
+        """
+        DO $$
+        BEGIN
+            -- Preview builds fetch only rows changed since the last sync
+            IF to_regclass('generated_files') IS NOT NULL THEN
+                CREATE INDEX IF NOT EXISTS idx_generated_files_project_updated
+                    ON generated_files (project_id, updated_at);
+            END IF;
+        END;
+        $$;
+        """,
+    ),
+    (
+        "0005_preview_artifacts",
+        """
+        CREATE TABLE IF NOT EXISTS preview_artifacts (
+            project_id TEXT PRIMARY KEY,
+            build_id TEXT NOT NULL,
+            dist_path TEXT NOT NULL,
+            workspace_path TEXT NOT NULL,
+            content_hash TEXT NOT NULL,
+            size_bytes BIGINT NOT NULL DEFAULT 0,
+            workspace_size_bytes BIGINT NOT NULL DEFAULT 0,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+            last_accessed_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+        );
+
+        CREATE INDEX IF NOT EXISTS idx_preview_artifacts_last_accessed
+            ON preview_artifacts (last_accessed_at);
+        """,
+    ),
+    (
+        "0006_preview_builds",
+        """
+        CREATE TABLE IF NOT EXISTS preview_builds (
+            build_id TEXT PRIMARY KEY,
+            project_id TEXT NOT NULL,
+            status TEXT NOT NULL,
+            build_mode TEXT,
+            artifact_cache TEXT,
+            build_config_version TEXT,
+            queue_ms INTEGER,
+            duration_ms INTEGER,
+            spans JSONB NOT NULL DEFAULT '[]'::jsonb,
+            error TEXT,
+            created_at TIMESTAMPTZ NOT NULL,
+            started_at TIMESTAMPTZ,
+            finished_at TIMESTAMPTZ
+        );
+
+        CREATE INDEX IF NOT EXISTS idx_preview_builds_project_created
+            ON preview_builds (project_id, created_at DESC);
+        """,
+    ),
+    (
+        "0007_preview_build_jobs",
+        """
+        CREATE TABLE IF NOT EXISTS preview_build_jobs (
+            build_id TEXT PRIMARY KEY,
+            project_id TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued',
+            worker_id TEXT,
+            result JSONB,
+            error TEXT,
+            status_code INTEGER,
+            spans JSONB,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+            started_at TIMESTAMPTZ,
+            finished_at TIMESTAMPTZ
+        );
+
+        CREATE INDEX IF NOT EXISTS idx_preview_build_jobs_queued
+            ON preview_build_jobs (created_at)
+            WHERE status = 'queued';
+        """,
+    ),
+    (
+        "0008_project_backend_sessions",
+        """
+        CREATE TABLE IF NOT EXISTS project_backend_sessions (
+            id BIGSERIAL PRIMARY KEY,
+            project_id TEXT NOT NULL,
+            port INTEGER,
+            pid INTEGER,
+            started_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+            ready_at TIMESTAMPTZ,
+            stopped_at TIMESTAMPTZ,
+            stop_reason TEXT,
+            cold_start_ms INTEGER
+        );
+
+        CREATE INDEX IF NOT EXISTS idx_project_backend_sessions_project
+            ON project_backend_sessions (project_id, started_at DESC);
+        """,
+    ),
+    (
+        "0009_project_files_unique_path",
+        """
+        DO $$
+        BEGIN
+            -- Writers upsert with ON CONFLICT (project_id, filepath)
+            IF to_regclass('project_files') IS NOT NULL THEN
+                -- Keep the most recently updated row of duplicated paths
+                DELETE FROM project_files pf
+                USING (
+                    SELECT id, row_number() OVER (
+                        PARTITION BY project_id, filepath
+                        ORDER BY updated_at DESC NULLS LAST, created_at DESC NULLS LAST, id
+                    ) AS rn
+                    FROM project_files
+                ) d
+                WHERE pf.id = d.id AND d.rn > 1;
+
+                CREATE UNIQUE INDEX IF NOT EXISTS idx_project_files_project_path
+                    ON project_files (project_id, filepath);
+            END IF;
+        END;
+        $$;
+        """,
+    ),
+    (
+        "0010_project_listing_index",
+        """
+        DO $$
+        BEGIN
+            IF to_regclass('projects') IS NULL THEN
+                RETURN;
+            END IF;
+
+            -- Bounded copies of the free text columns, so the listing can be
+            -- served by an index-only scan without hitting the btree tuple
+            -- size limit. The list view only shows a two line excerpt
+            ALTER TABLE projects ADD COLUMN IF NOT EXISTS listing_title TEXT
+                GENERATED ALWAYS AS (left(title, 200)) STORED;
+            ALTER TABLE projects ADD COLUMN IF NOT EXISTS listing_description TEXT
+                GENERATED ALWAYS AS (left(description, 300)) STORED;
+
+            -- Replaces the index earlier versions of 0001 created
+            DROP INDEX IF EXISTS idx_projects_user_listing;
+            CREATE INDEX idx_projects_user_listing
+                ON projects (user_id, updated_at DESC, id DESC)
+                INCLUDE (status, created_at, feature_count, integration_count,
+                         listing_title, listing_description)
+                WHERE status <> 'deleted';
+        END;
+        $$;
+        """,
+    ),
+    (
+        "0011_project_files_trgm",
+        """
+        -- Unused since code search reads project_files, it only slowed down writes
+        DROP INDEX IF EXISTS idx_generated_files_content_trgm;
+
+        DO $$
+        BEGIN
+            -- Code search and the code index read project_files, the table
+            -- the file tools write
+            IF EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm')
+               AND to_regclass('project_files') IS NOT NULL THEN
+                CREATE INDEX IF NOT EXISTS idx_project_files_content_trgm
+                    ON project_files USING gin (content gin_trgm_ops);
+            END IF;
+        END;
+        $$;
+        """,
+    ),
+    (
+        "0012_file_blobs_single_source",
+        """
+        -- Blobs are stored as text so file contents can be read in SQL,
+        -- project_files keeps only pointers to its current blob
+        ALTER TABLE file_blobs ADD COLUMN IF NOT EXISTS content TEXT;
+        ALTER TABLE file_blobs ALTER COLUMN data DROP NOT NULL;
+
+        UPDATE file_blobs SET content = convert_from(data, 'UTF8'), data = NULL
+        WHERE compression IS NULL AND content IS NULL;
+
+        DO $$
+        BEGIN
+            IF to_regclass('project_files') IS NULL THEN
+                RETURN;
+            END IF;
+
+            IF EXISTS (
+                SELECT 1 FROM information_schema.columns
+                WHERE table_schema = current_schema()
+                  AND table_name = 'project_files' AND column_name = 'content'
+            ) THEN
+                -- Heads whose blob is compressed, or that were written
+                -- without a version, are stored from the inline copy
+                INSERT INTO file_blobs (hash, size, content)
+                SELECT DISTINCT ON (h.hash) h.hash, octet_length(h.content), h.content
+                FROM (
+                    SELECT encode(sha256(convert_to(content, 'UTF8')), 'hex') AS hash, content
+                    FROM project_files
+                    WHERE content IS NOT NULL
+                ) h
+                ON CONFLICT (hash) DO UPDATE SET
+                    content = EXCLUDED.content, data = NULL, compression = NULL
+                WHERE file_blobs.content IS NULL;
+
+                -- Files written without a version get one for their content
+                WITH stale AS (
+                    SELECT * FROM (
+                        SELECT project_id, filepath, language, blob_hash,
+                               current_version_id AS parent_id,
+                               encode(sha256(convert_to(content, 'UTF8')), 'hex') AS hash
+                        FROM project_files
+                        WHERE content IS NOT NULL
+                    ) f
+                    WHERE f.blob_hash IS DISTINCT FROM f.hash
+                ), added AS (
+                    INSERT INTO file_versions (id, project_id, filepath, version, blob_hash, parent_id, language)
+                    SELECT gen_random_uuid(), s.project_id, s.filepath,
+                           COALESCE((
+                               SELECT MAX(v.version) FROM file_versions v
+                               WHERE v.project_id = s.project_id AND v.filepath = s.filepath
+                           ), 0) + 1,
+                           s.hash, s.parent_id, s.language
+                    FROM stale s
+                    RETURNING id, project_id, filepath, blob_hash
+                )
+                UPDATE project_files pf
+                SET blob_hash = a.blob_hash, current_version_id = a.id
+                FROM added a
+                WHERE pf.project_id = a.project_id AND pf.filepath = a.filepath;
+
+                -- Also drops idx_project_files_content_trgm
+                ALTER TABLE project_files DROP COLUMN content;
+            END IF;
+
+            CREATE OR REPLACE VIEW project_file_contents AS
+            SELECT pf.*, b.content
+            FROM project_files pf
+            LEFT JOIN file_blobs b ON b.hash = pf.blob_hash;
+        END;
+        $$;
+
+        DO $$
+        BEGIN
+            -- Code search reads file contents from file_blobs
+            IF EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm') THEN
+                CREATE INDEX IF NOT EXISTS idx_file_blobs_content_trgm
+                    ON file_blobs USING gin (content gin_trgm_ops);
+            END IF;
+        END;
+        $$;
+        """,
+    ),
+]
+
+
+async def apply_migrations(conn):
+    """Apply all migrations that have not been applied yet, on conn."""
+    await conn.execute("SELECT pg_advisory_lock($1)", _SCHEMA_LOCK_KEY)
+    try:
+        await conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS app_schema_migrations (
+                name TEXT PRIMARY KEY,
+                applied_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+            )
+            """
+        )
+        applied = {
+            row["name"]
+            for row in await conn.fetch("SELECT name FROM app_schema_migrations")
+        }
+
+        for name, sql in MIGRATIONS:
+            if name in applied:
+                continue
+            async with conn.transaction():
+                await conn.execute(sql)
+                await conn.execute(
+                    "INSERT INTO app_schema_migrations (name) VALUES ($1)",
+                    name,
+                )
+            print(f"[DB] ✅ Applied schema migration {name}")
+    finally:
+        await conn.execute("SELECT pg_advisory_unlock($1)", _SCHEMA_LOCK_KEY)
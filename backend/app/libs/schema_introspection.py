@@ -0,0 +1,243 @@
+"""Cached database schema introspection for the AI tools.
+
+``get_sql_schema`` is called over and over during an AI session, so the
+schema is loaded with a single pg_catalog query (tables, columns, types,
+defaults, primary keys, foreign keys and indexes) and cached per project and
+database.
+
+The cache is invalidated:
+- explicitly through ``invalidate_schema_cache()`` after a successful migration
+- when a DDL event is seen: an event trigger NOTIFYs ``riff_schema_changed``
+  and a dedicated LISTEN connection drops the cached entries. A background
+  task keeps that connection open, reconnecting with backoff (up to
+  SCHEMA_LISTENER_MAX_BACKOFF seconds) and dropping the cache whenever it
+  was lost, since notifications may have been missed meanwhile
+- after SCHEMA_CACHE_TTL seconds as a safety net (e.g. listener not available)
+"""
+
+import asyncio
+import json
+import os
+import time
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import urlparse
+
+import asyncpg
+
+from app.libs.database import db_connection, get_db_connection
+
+SCHEMA_CACHE_TTL = float(os.environ.get("SCHEMA_CACHE_TTL", 300))
+SCHEMA_CHANGED_CHANNEL = "riff_schema_changed"
+SCHEMA_LISTENER_MAX_BACKOFF = float(os.environ.get("SCHEMA_LISTENER_MAX_BACKOFF", 60))
+
+SCHEMA_QUERY = """
+SELECT
+    c.relname AS table_name,
+    (
+        SELECT json_agg(
+            json_build_object(
+                'name', a.attname,
+                'type', format_type(a.atttypid, a.atttypmod),
+                'nullable', NOT a.attnotnull,
+                'default', pg_get_expr(d.adbin, d.adrelid)
+            )
+            ORDER BY a.attnum
+        )
+        FROM pg_attribute a
+        LEFT JOIN pg_attrdef d ON d.adrelid = a.attrelid AND d.adnum = a.attnum
+        WHERE a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped
+    ) AS columns,
+    (
+        SELECT json_agg(a.attname ORDER BY array_position(con.conkey, a.attnum))
+        FROM pg_constraint con
+        JOIN pg_attribute a ON a.attrelid = con.conrelid AND a.attnum = ANY(con.conkey)
+        WHERE con.conrelid = c.oid AND con.contype = 'p'
+    ) AS primary_key,
+    (
+        SELECT json_agg(
+            json_build_object(
+                'name', con.conname,
+                'references', con.confrelid::regclass::text,
+                'definition', pg_get_constraintdef(con.oid)
+            )
+            ORDER BY con.conname
+        )
+        FROM pg_constraint con
+        WHERE con.conrelid = c.oid AND con.contype = 'f'
+    ) AS foreign_keys,
+    (
+        SELECT json_agg(
+            json_build_object(
+                'name', ic.relname,
+                'unique', i.indisunique,
+                'primary', i.indisprimary,
+                'definition', pg_get_indexdef(i.indexrelid)
+            )
+            ORDER BY ic.relname
+        )
+        FROM pg_index i
+        JOIN pg_class ic ON ic.oid = i.indexrelid
+        WHERE i.indrelid = c.oid
+    ) AS indexes
+FROM pg_class c
+JOIN pg_namespace n ON n.oid = c.relnamespace
+WHERE n.nspname = 'public' AND c.relkind IN ('r', 'p')
+ORDER BY c.relname
+"""
+
+# (project_id, database) -> (loaded_at, schema)
+_schema_cache: Dict[Tuple[str, str], Tuple[float, Dict[str, Any]]] = {}
+
+_listener_conn: Optional[asyncpg.Connection] = None
+_listener_task: Optional[asyncio.Task] = None
+
+
+def _database_name() -> str:
+    """Identify the database behind DATABASE_URL (host + db name)."""
+    url = urlparse(os.environ.get("DATABASE_URL", ""))
+    return f"{url.hostname or ''}{url.path or ''}"
+
+
+async def load_schema(conn: asyncpg.Connection) -> Dict[str, Any]:
+    """Load the public schema in one round trip."""
+    rows = await conn.fetch(SCHEMA_QUERY)
+    return {
+        row["table_name"]: {
+            "columns": json.loads(row["columns"]) if row["columns"] else [],
+            "primary_key": json.loads(row["primary_key"]) if row["primary_key"] else [],
+            "foreign_keys": json.loads(row["foreign_keys"]) if row["foreign_keys"] else [],
+            "indexes": json.loads(row["indexes"]) if row["indexes"] else [],
+        }
+        for row in rows
+    }
+
+
+async def get_cached_schema(project_id: str) -> Tuple[Dict[str, Any], bool]:
+    """Get the schema for a project, returns (schema, served_from_cache)."""
+    key = (str(project_id), _database_name())
+    cached = _schema_cache.get(key)
+    if cached and time.monotonic() - cached[0] < SCHEMA_CACHE_TTL:
+        return cached[1], True
+
+    async with db_connection() as conn:
+        schema = await load_schema(conn)
+    _schema_cache[key] = (time.monotonic(), schema)
+    return schema, False
+
+
+def invalidate_schema_cache(project_id: Optional[str] = None):
+    """Drop cached schemas.
+
+    All projects share the same database, so DDL from any project changes
+    what every project sees. Without project_id every entry for the current
+    database is dropped.
+    """
+    database = _database_name()
+    for key in list(_schema_cache):
+        if key[1] != database:
+            continue
+        if project_id is None or key[0] == str(project_id):
+            _schema_cache.pop(key, None)
+
+
+def _on_schema_changed(conn, pid, channel, payload):
+    invalidate_schema_cache()
+
+
+async def _install_ddl_event_trigger(conn: asyncpg.Connection):
+    """Create the DDL event trigger, needs superuser or equivalent rights."""
+    await conn.execute(
+        f"""
+        CREATE OR REPLACE FUNCTION riff_notify_schema_changed() RETURNS event_trigger AS $$
+        BEGIN
+            PERFORM pg_notify('{SCHEMA_CHANGED_CHANNEL}', current_database());
+        END;
+        $$ LANGUAGE plpgsql;
+        """
+    )
+    exists = await conn.fetchval(
+        "SELECT 1 FROM pg_event_trigger WHERE evtname = 'riff_schema_changed'"
+    )
+    if not exists:
+        await conn.execute(
+            """
+            CREATE EVENT TRIGGER riff_schema_changed ON ddl_command_end
+            EXECUTE FUNCTION riff_notify_schema_changed()
+            """
+        )
+
+
+async def _listen() -> asyncio.Event:
+    """Open the LISTEN connection, returns an event set when it is lost."""
+    global _listener_conn
+
+    lost = asyncio.Event()
+    conn = await get_db_connection()
+    try:
+        try:
+            await _install_ddl_event_trigger(conn)
+        except asyncpg.PostgresError as e:
+            # Managed databases often refuse event triggers, fall back to
+            # migration-based invalidation and the TTL
+            print(f"[SCHEMA] ⚠️ DDL event trigger not installed: {e}")
+        conn.add_termination_listener(lambda _: lost.set())
+        await conn.add_listener(SCHEMA_CHANGED_CHANNEL, _on_schema_changed)
+    except BaseException:
+        conn.terminate()
+        raise
+    _listener_conn = conn
+    return lost
+
+
+async def _run_listener():
+    """Keep the LISTEN connection open, reconnecting with backoff."""
+    global _listener_conn
+
+    backoff = 1.0
+    while True:
+        try:
+            lost = await _listen()
+        except (OSError, asyncio.TimeoutError, asyncpg.PostgresError, asyncpg.InterfaceError) as e:
+            print(f"[SCHEMA] ⚠️ Schema change listener failed, retrying in {backoff:.0f}s: {e}")
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, SCHEMA_LISTENER_MAX_BACKOFF)
+            continue
+
+        print(f"[SCHEMA] Listening on {SCHEMA_CHANGED_CHANNEL}")
+        backoff = 1.0
+        await lost.wait()
+        _listener_conn = None
+        # DDL while disconnected went unnoticed
+        invalidate_schema_cache()
+        print("[SCHEMA] ⚠️ Schema change listener disconnected, reconnecting")
+
+
+async def start_schema_change_listener():
+    """Keep a dedicated LISTEN connection open for DDL notifications."""
+    global _listener_task
+
+    if (_listener_task is not None and not _listener_task.done()) or not os.environ.get("DATABASE_URL"):
+        return
+    _listener_task = asyncio.create_task(_run_listener())
+
+
+async def stop_schema_change_listener():
+    global _listener_conn, _listener_task
+
+    task = _listener_task
+    _listener_task = None
+    if task is not None:
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    conn = _listener_conn
+    _listener_conn = None
+    if conn is None or conn.is_closed():
+        return
+    try:
+        await conn.remove_listener(SCHEMA_CHANGED_CHANNEL, _on_schema_changed)
+    finally:
+        await conn.close()
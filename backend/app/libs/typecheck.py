@@ -0,0 +1,280 @@
+"""Incremental TypeScript type checking for preview workspaces.
+
+Vite only transpiles, so type errors used to be found by scraping build
+output. Each workspace now gets a long-lived node process running
+``typecheck_worker.cjs``, which keeps a TypeScript builder program in memory
+and answers "these files changed" with structured diagnostics (file, line,
+column, code, message) of the files affected by the change. The builder
+state is persisted to ``.riff-tsbuildinfo``, so a new checker (after a
+restart, or in another build worker) only re-checks what changed since.
+
+``report_diagnostics()`` writes them to the errors table: open type errors
+of every re-checked file are resolved and the current ones inserted.
+
+At most TYPECHECK_MAX_SERVERS checkers run per process, the least recently
+used is stopped to make room and idle ones stop after
+TYPECHECK_IDLE_TIMEOUT seconds. Checkers run with the build command limits
+(``command_preexec()``).
+"""
+
+import asyncio
+import json
+import os
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from app.libs.build_manager import command_preexec
+from app.libs.database import db_connection
+
+TYPECHECK_ENABLED = os.environ.get("TYPECHECK_ENABLED", "1").lower() in ("1", "true", "yes")
+TYPECHECK_TIMEOUT = float(os.environ.get("TYPECHECK_TIMEOUT", 120))
+TYPECHECK_MAX_SERVERS = int(os.environ.get("TYPECHECK_MAX_SERVERS", 4))
+TYPECHECK_IDLE_TIMEOUT = float(os.environ.get("TYPECHECK_IDLE_TIMEOUT", 600))
+TYPECHECK_REAP_INTERVAL = 30
+
+WORKER_SCRIPT = Path(__file__).parent / "typecheck_worker.cjs"
+# Marks errors written by the checker in errors.context
+DIAGNOSTIC_SOURCE = "tsc"
+
+
+@dataclass
+class Diagnostic:
+    file: Optional[str]
+    line: Optional[int]
+    column: Optional[int]
+    code: int
+    message: str
+    category: str = "error"
+
+
+@dataclass
+class TypeCheckResult:
+    affected: List[str]
+    diagnostics: List[Diagnostic] = field(default_factory=list)
+    duration_ms: int = 0
+
+
+class TypeCheckError(Exception):
+    pass
+
+
+class TypeCheckServer:
+    """A typecheck_worker.cjs process for one workspace."""
+
+    def __init__(self, project_id: str, workspace: Path):
+        self.project_id = project_id
+        self.workspace = workspace
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self.last_activity = time.time()
+        self.checks = 0
+        self._next_id = 0
+        self._lock = asyncio.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self.process is not None and self.process.returncode is None
+
+    async def start(self):
+        if not (self.workspace / "node_modules" / "typescript").exists():
+            raise TypeCheckError("TypeScript is not installed in the workspace")
+        self.process = await asyncio.create_subprocess_exec(
+            "node", str(WORKER_SCRIPT), str(self.workspace),
+            cwd=self.workspace,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+            # Responses for large projects are long lines
+            limit=16 * 1024 * 1024,
+            preexec_fn=command_preexec(),
+        )
+        print(f"[{self.project_id}] 🔎 Type checker started (PID {self.process.pid})")
+
+    async def check(self, changed: List[str], timeout: float = TYPECHECK_TIMEOUT) -> TypeCheckResult:
+        """Diagnostics of the files affected by changed (workspace relative)."""
+        async with self._lock:
+            self.last_activity = time.time()
+            if not self.running:
+                await self.start()
+
+            self._next_id += 1
+            request = {"id": self._next_id, "changed": changed}
+            try:
+                self.process.stdin.write((json.dumps(request) + "\n").encode("utf-8"))
+                await self.process.stdin.drain()
+                response = await asyncio.wait_for(self._read_response(request["id"]), timeout)
+            except (asyncio.TimeoutError, ConnectionError) as e:
+                await self.stop()
+                raise TypeCheckError(f"Type checker did not answer: {e or 'timeout'}")
+            if response is None:
+                await self.stop()
+                raise TypeCheckError("Type checker exited")
+
+            if response.get("error"):
+                raise TypeCheckError(response["error"])
+            self.checks += 1
+            return TypeCheckResult(
+                affected=response["affected"],
+                diagnostics=[
+                    Diagnostic(
+                        file=d["file"],
+                        line=d["line"],
+                        column=d["column"],
+                        code=d["code"],
+                        message=d["message"],
+                        category=d["category"],
+                    )
+                    for d in response["diagnostics"]
+                ],
+                duration_ms=response.get("duration_ms", 0),
+            )
+
+    async def _read_response(self, request_id: int) -> Optional[Dict[str, Any]]:
+        """The response to request_id, None if the checker exited.
+
+        Answers to earlier checks that were cancelled while the checker was
+        still working are skipped.
+        """
+        while True:
+            line = await self.process.stdout.readline()
+            if not line:
+                return None
+            response = json.loads(line)
+            if response.get("id") == request_id:
+                return response
+
+    async def stop(self):
+        if not self.running:
+            return
+        self.process.stdin.close()
+        try:
+            await asyncio.wait_for(self.process.wait(), 5)
+        except asyncio.TimeoutError:
+            self.process.kill()
+            await self.process.wait()
+        print(f"[{self.project_id}] Type checker stopped")
+
+
+class TypeCheckManager:
+    """One type checker per project, bounded and reaped when idle."""
+
+    def __init__(
+        self,
+        max_servers: int = TYPECHECK_MAX_SERVERS,
+        idle_timeout: float = TYPECHECK_IDLE_TIMEOUT,
+    ):
+        self.max_servers = max_servers
+        self.idle_timeout = idle_timeout
+        self._servers: Dict[str, TypeCheckServer] = {}
+        self._reaper: Optional[asyncio.Task] = None
+
+    def _server(self, project_id: str, workspace: Path) -> TypeCheckServer:
+        server = self._servers.get(project_id)
+        if server is not None and server.workspace == workspace:
+            return server
+
+        while len(self._servers) >= self.max_servers:
+            oldest = min(self._servers.values(), key=lambda s: s.last_activity)
+            self._servers.pop(oldest.project_id, None)
+            asyncio.create_task(oldest.stop())
+
+        server = TypeCheckServer(project_id, workspace)
+        self._servers[project_id] = server
+        if self._reaper is None or self._reaper.done():
+            self._reaper = asyncio.create_task(self._reap())
+        return server
+
+    async def check(self, project_id: str, workspace: Path, changed: List[str]) -> TypeCheckResult:
+        return await self._server(str(project_id), workspace).check(changed)
+
+    async def _reap(self):
+        while self._servers:
+            await asyncio.sleep(TYPECHECK_REAP_INTERVAL)
+            now = time.time()
+            for server in list(self._servers.values()):
+                if now - server.last_activity > self.idle_timeout and not server._lock.locked():
+                    self._servers.pop(server.project_id, None)
+                    await server.stop()
+
+    async def stop_all(self):
+        """Stop every checker, called on shutdown."""
+        if self._reaper is not None:
+            self._reaper.cancel()
+        servers = list(self._servers.values())
+        self._servers = {}
+        for server in servers:
+            await server.stop()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": TYPECHECK_ENABLED,
+            "running": sum(1 for s in self._servers.values() if s.running),
+            "max_servers": self.max_servers,
+            "checks": sum(s.checks for s in self._servers.values()),
+        }
+
+
+typecheck_servers = TypeCheckManager()
+
+
+def _snippet(workspace: Path, file_path: str, line_number: Optional[int]) -> Optional[str]:
+    if not line_number:
+        return None
+    try:
+        lines = (workspace / file_path).read_text().splitlines()
+    except (OSError, UnicodeDecodeError):
+        return None
+    start = max(0, line_number - 3)
+    return "\n".join(lines[start:line_number + 2])
+
+
+async def report_diagnostics(project_id: str, workspace: Path, result: TypeCheckResult) -> Dict[str, int]:
+    """Sync the errors table with a check result, returns counts.
+
+    Open type errors of the re-checked files are resolved, the current
+    diagnostics inserted as open build errors.
+    """
+    if not result.affected and not result.diagnostics:
+        return {"reported": 0, "resolved": 0}
+    rows = [
+        (
+            project_id,
+            f"TS{d.code}: {d.message}",
+            d.file,
+            d.line,
+            _snippet(workspace, d.file, d.line) if d.file else None,
+            json.dumps({"error_code": f"TS{d.code}", "source": DIAGNOSTIC_SOURCE, "column": d.column}),
+        )
+        for d in result.diagnostics
+    ]
+    async with db_connection() as conn:
+        async with conn.transaction():
+            resolved = await conn.fetchval(
+                """
+                WITH resolved AS (
+                    UPDATE errors
+                    SET status = 'resolved', resolved_at = NOW(), updated_at = NOW()
+                    WHERE project_id = $1 AND status = 'open' AND error_type = 'build'
+                      AND context->>'source' = $2
+                      AND (file_path = ANY($3::text[]) OR file_path IS NULL)
+                    RETURNING 1
+                )
+                SELECT COUNT(*) FROM resolved
+                """,
+                project_id,
+                DIAGNOSTIC_SOURCE,
+                result.affected,
+            )
+            if rows:
+                await conn.executemany(
+                    """
+                    INSERT INTO errors (
+                        project_id, error_type, message, file_path, line_number,
+                        code_snippet, context, status
+                    )
+                    VALUES ($1, 'build', $2, $3, $4, $5, $6, 'open')
+                    """,
+                    rows,
+                )
+    return {"reported": len(rows), "resolved": resolved}
@@ -0,0 +1,161 @@
+// Long-lived incremental type checker for one preview workspace.
+//
+// Started by app/libs/typecheck.py with the workspace as argument. Reads one
+// JSON request per line on stdin, {"id": 1, "changed": ["src/App.tsx"]},
+// and answers with one JSON line on stdout:
+//
+//   {"id": 1, "affected": [...], "diagnostics": [...], "duration_ms": 12}
+//
+// Only files affected by the changes since the previous check are checked,
+// the builder state is kept in memory and persisted to .riff-tsbuildinfo so
+// a restarted checker resumes incrementally.
+'use strict';
+
+const fs = require('fs');
+const path = require('path');
+const readline = require('readline');
+
+const workspace = path.resolve(process.argv[2] || '.');
+const ts = require(require.resolve('typescript', { paths: [workspace] }));
+
+const OPTION_OVERRIDES = {
+  incremental: true,
+  noEmit: true,
+  tsBuildInfoFile: path.join(workspace, '.riff-tsbuildinfo'),
+  // Style checks, not errors worth reporting
+  noUnusedLocals: false,
+  noUnusedParameters: false,
+};
+
+// Parsed source files by path, reused while the file's mtime is unchanged
+const sourceFiles = new Map();
+let builder;
+
+function parseConfig() {
+  return ts.getParsedCommandLineOfConfigFile(path.join(workspace, 'tsconfig.json'), OPTION_OVERRIDES, {
+    ...ts.sys,
+    onUnRecoverableConfigFileDiagnostic: (diagnostic) => {
+      throw new Error(ts.flattenDiagnosticMessageText(diagnostic.messageText, '\n'));
+    },
+  });
+}
+
+function createHost(options) {
+  const host = ts.createIncrementalCompilerHost(options);
+  const getSourceFile = host.getSourceFile;
+  host.getSourceFile = (fileName, languageVersion, onError, shouldCreate) => {
+    let mtimeMs;
+    try {
+      mtimeMs = fs.statSync(fileName).mtimeMs;
+    } catch {
+      sourceFiles.delete(fileName);
+      return undefined;
+    }
+    const cached = sourceFiles.get(fileName);
+    if (cached && cached.mtimeMs === mtimeMs) {
+      return cached.sourceFile;
+    }
+    const sourceFile = getSourceFile(fileName, languageVersion, onError, shouldCreate);
+    if (sourceFile) {
+      sourceFiles.set(fileName, { mtimeMs, sourceFile });
+    }
+    return sourceFile;
+  };
+  return host;
+}
+
+function relative(fileName) {
+  const rel = path.relative(workspace, fileName);
+  return rel.startsWith('..') || rel.split(path.sep).includes('node_modules') ? null : rel;
+}
+
+function toJson(diagnostic) {
+  const result = {
+    file: diagnostic.file ? relative(diagnostic.file.fileName) : null,
+    line: null,
+    column: null,
+    code: diagnostic.code,
+    category: ts.DiagnosticCategory[diagnostic.category].toLowerCase(),
+    message: ts.flattenDiagnosticMessageText(diagnostic.messageText, '\n'),
+  };
+  if (diagnostic.file && diagnostic.start !== undefined) {
+    const { line, character } = diagnostic.file.getLineAndCharacterOfPosition(diagnostic.start);
+    result.line = line + 1;
+    result.column = character + 1;
+  }
+  return result;
+}
+
+function check(changed) {
+  for (const file of changed) {
+    sourceFiles.delete(path.resolve(workspace, file));
+  }
+
+  const parsed = parseConfig();
+  const host = createHost(parsed.options);
+  const oldProgram = builder || ts.readBuilderProgram(parsed.options, host);
+  builder = ts.createEmitAndSemanticDiagnosticsBuilderProgram(
+    parsed.fileNames,
+    parsed.options,
+    host,
+    oldProgram,
+    ts.getConfigFileParsingDiagnostics(parsed),
+    parsed.projectReferences,
+  );
+
+  const affected = new Set();
+  const diagnostics = [
+    ...builder.getConfigFileParsingDiagnostics(),
+    ...builder.getOptionsDiagnostics(),
+    ...builder.getGlobalDiagnostics(),
+  ];
+  for (;;) {
+    const next = builder.getSemanticDiagnosticsOfNextAffectedFile();
+    if (!next) {
+      break;
+    }
+    if (next.affected.kind === ts.SyntaxKind.SourceFile) {
+      affected.add(next.affected.fileName);
+      diagnostics.push(...builder.getSyntacticDiagnostics(next.affected), ...next.result);
+    } else {
+      // Options changed, the whole program was checked
+      for (const sourceFile of builder.getSourceFiles()) {
+        affected.add(sourceFile.fileName);
+        diagnostics.push(...builder.getSyntacticDiagnostics(sourceFile));
+      }
+      diagnostics.push(...next.result);
+    }
+  }
+  // With noEmit this only writes the .tsbuildinfo, like tsc --incremental
+  builder.emit();
+
+  return {
+    affected: [...affected].map(relative).filter(Boolean).sort(),
+    diagnostics: diagnostics
+      .filter((diagnostic) => diagnostic.category === ts.DiagnosticCategory.Error)
+      .map(toJson)
+      .filter((diagnostic) => diagnostic.file !== null || !diagnostic.line),
+  };
+}
+
+const input = readline.createInterface({ input: process.stdin });
+input.on('line', (line) => {
+  let request;
+  try {
+    request = JSON.parse(line);
+  } catch {
+    return;
+  }
+  const started = Date.now();
+  let response;
+  try {
+    response = { id: request.id, ...check(request.changed || []) };
+  } catch (error) {
+    // Start from scratch on the next request
+    builder = undefined;
+    response = { id: request.id, error: String(error && error.stack || error) };
+  }
+  response.duration_ms = Date.now() - started;
+  process.stdout.write(JSON.stringify(response) + '\n');
+});
+input.on('close', () => process.exit(0));
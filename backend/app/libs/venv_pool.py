@@ -0,0 +1,255 @@
+"""Pool of ready-made virtual environments for project backends.
+
+Every project backend needs the same heavy base dependency group (FastAPI,
+OpenAI, Anthropic, Scrapy, ...). Installing it per project took minutes.
+Instead, a golden venv with BASE_DEPENDENCIES is built once per dependency
+set and Python version (``base_key()``) under VENV_POOL_DIR, and
+VENV_POOL_SIZE clones of it are kept ready:
+
+- ``claim(target)`` renames a ready venv into the workspace (one atomic
+  rename, safe across processes), or clones the golden venv with hardlinks
+  (``cp -al``) when the pool is empty, or builds one from scratch when
+  there is no golden venv yet
+- after each claim, and on startup, the pool is replenished in the
+  background
+
+Venvs are created with ``uv venv --relocatable --seed`` so they still work
+after being moved, and installed with UV_LINK_MODE=hardlink from the shared
+UV_CACHE_DIR, which makes even a from-scratch build mostly linking. Without
+uv, ``python -m venv`` and pip are used (project backends run
+``.venv/bin/python -m uvicorn``, which does not depend on script paths).
+"""
+
+import asyncio
+import hashlib
+import os
+import shutil
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+from uuid import uuid4
+
+VENV_POOL_DIR = Path(os.environ.get("VENV_POOL_DIR", "/disk/backend/.venv-pool"))
+VENV_POOL_SIZE = int(os.environ.get("VENV_POOL_SIZE", 2))
+VENV_PYTHON = os.environ.get("VENV_PYTHON", sys.executable)
+VENV_CREATE_TIMEOUT = float(os.environ.get("VENV_CREATE_TIMEOUT", 900))
+UV_CACHE_DIR = os.environ.get("UV_CACHE_DIR", "/disk/backend/.uv-cache")
+UV_BIN = os.environ.get("UV_BIN") or shutil.which("uv")
+
+# The base dependency group of every project backend
+BASE_DEPENDENCIES = [
+    "databutton==0.39.0",
+    "uvicorn[standard]>=0.34.0",
+    "fastapi>=0.115.7",
+    "pydantic>=2.10.5",
+    "httpx>=0.28.1",
+    "python-multipart>=0.0.9",
+    "pyjwt>=2.10.1",
+    "cryptography>=44.0.0",
+    "asyncpg>=0.30.0",
+    "dotenv>=0.9.9",
+    "openai",
+    "beautifulsoup4",
+    "requests",
+    "anthropic",
+    "scrapy",
+    "psutil",
+    "toml",
+]
+
+
+class VenvError(Exception):
+    pass
+
+
+def base_key() -> str:
+    """Identifies the base venv: dependency set and Python version."""
+    digest = hashlib.sha256()
+    digest.update(f"{VENV_PYTHON}\0{sys.version_info[:2]}\0".encode("utf-8"))
+    digest.update("\0".join(sorted(BASE_DEPENDENCIES)).encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+async def _run(args: Sequence[str], timeout: float = VENV_CREATE_TIMEOUT):
+    env = {**os.environ, "UV_CACHE_DIR": UV_CACHE_DIR, "UV_LINK_MODE": "hardlink"}
+    process = await asyncio.create_subprocess_exec(
+        *args,
+        env=env,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    try:
+        stdout, stderr = await asyncio.wait_for(process.communicate(), timeout)
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+        raise VenvError(f"{Path(args[0]).name} timed out after {timeout:.0f}s")
+    if process.returncode != 0:
+        output = (stderr or stdout).decode("utf-8", errors="replace")
+        raise VenvError(f"{' '.join(args[:3])} failed: {output[-2000:]}")
+
+
+async def build_venv(target: Path):
+    """Create a venv with the base dependencies at target."""
+    if UV_BIN:
+        await _run([UV_BIN, "venv", "--relocatable", "--seed", "--python", VENV_PYTHON, str(target)])
+        await _run([UV_BIN, "pip", "install", "--python", str(target / "bin" / "python"), *BASE_DEPENDENCIES])
+    else:
+        await _run([VENV_PYTHON, "-m", "venv", str(target)])
+        await _run([str(target / "bin" / "python"), "-m", "pip", "install", "--quiet", *BASE_DEPENDENCIES])
+
+
+async def _clone(source: Path, target: Path):
+    """Hardlink copy of a venv, falling back to a plain copy."""
+    try:
+        await _run(["cp", "-al", str(source), str(target)])
+    except VenvError:
+        shutil.rmtree(target, ignore_errors=True)
+        await _run(["cp", "-a", str(source), str(target)])
+
+
+async def _staged(target: Path, create) -> Path:
+    """Create a venv next to target with create(path), then move it there."""
+    staging = target.with_name(f".staging-{target.name}-{uuid4().hex[:8]}")
+    try:
+        await create(staging)
+        os.replace(staging, target)
+    finally:
+        if staging.exists():
+            await asyncio.to_thread(shutil.rmtree, staging, True)
+    return target
+
+
+class VenvPool:
+    """Golden venv plus a pool of ready clones, replenished in the background."""
+
+    def __init__(self, size: int = VENV_POOL_SIZE, root: Path = VENV_POOL_DIR):
+        self.size = size
+        self.root = root
+        self.key = base_key()
+        self.claimed = 0
+        self.cloned = 0
+        self.built = 0
+        self._replenisher: Optional[asyncio.Task] = None
+        self._claims: Dict[str, asyncio.Task] = {}
+
+    @property
+    def golden(self) -> Path:
+        return self.root / f"golden-{self.key}"
+
+    @property
+    def ready_dir(self) -> Path:
+        return self.root / "ready"
+
+    def ready(self) -> List[Path]:
+        if not self.ready_dir.exists():
+            return []
+        return sorted(p for p in self.ready_dir.glob(f"{self.key}-*") if p.is_dir())
+
+    async def claim(self, target: Path) -> str:
+        """Provide a base venv at target, returns how ("pool", "clone", "built", "exists").
+
+        Concurrent claims for the same target share one.
+        """
+        key = str(target)
+        task = self._claims.get(key)
+        if task is None:
+            task = asyncio.create_task(self._claim(target))
+            self._claims[key] = task
+            task.add_done_callback(lambda _: self._claims.pop(key, None))
+        return await task
+
+    async def _claim(self, target: Path) -> str:
+        if (target / "bin" / "python").exists():
+            return "exists"
+        target.parent.mkdir(parents=True, exist_ok=True)
+        outcome = None
+        for candidate in self.ready():
+            try:
+                os.rename(candidate, target)
+            except OSError:
+                # Claimed by another process in the meantime
+                continue
+            outcome = "pool"
+            self.claimed += 1
+            break
+
+        if outcome is None and self.golden.exists():
+            await _staged(target, lambda path: _clone(self.golden, path))
+            outcome = "clone"
+            self.cloned += 1
+        elif outcome is None:
+            await _staged(target, build_venv)
+            outcome = "built"
+            self.built += 1
+
+        self.replenish()
+        return outcome
+
+    def replenish(self):
+        """Refill the pool in the background if it is not already refilling."""
+        if self.size <= 0:
+            return
+        if self._replenisher is None or self._replenisher.done():
+            self._replenisher = asyncio.create_task(self._replenish())
+
+    async def _replenish(self):
+        try:
+            self.ready_dir.mkdir(parents=True, exist_ok=True)
+            await self._remove_stale()
+            if not self.golden.exists():
+                started = time.perf_counter()
+                print(f"[VENV] Building golden venv {self.key}...")
+                await _staged(self.golden, build_venv)
+                print(f"[VENV] ✅ Golden venv ready in {time.perf_counter() - started:.0f}s")
+
+            while len(self.ready()) < self.size:
+                target = self.ready_dir / f"{self.key}-{uuid4().hex[:8]}"
+                await _staged(target, lambda path: _clone(self.golden, path))
+            print(f"[VENV] Pool has {len(self.ready())} ready venvs")
+        except Exception as e:
+            print(f"[VENV] ⚠️ Replenishing the venv pool failed: {e}")
+
+    async def _remove_stale(self):
+        """Venvs of other base dependency sets and interrupted stagings."""
+
+        def interrupted(path: Path) -> bool:
+            # Other processes may still be staging
+            return path.name.startswith(".staging-") and time.time() - path.stat().st_mtime > VENV_CREATE_TIMEOUT
+
+        stale = [
+            path for path in self.root.iterdir()
+            if interrupted(path) or (path.name.startswith("golden-") and path != self.golden)
+        ]
+        stale += [
+            path for path in self.ready_dir.iterdir()
+            if interrupted(path)
+            or not (path.name.startswith(".staging-") or path.name.startswith(f"{self.key}-"))
+        ]
+        for path in stale:
+            await asyncio.to_thread(shutil.rmtree, path, True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "key": self.key,
+            "size": self.size,
+            "ready": len(self.ready()),
+            "golden": self.golden.exists(),
+            "uv": UV_BIN is not None,
+            "claimed": self.claimed,
+            "cloned": self.cloned,
+            "built": self.built,
+        }
+
+    async def stop(self):
+        if self._replenisher is not None:
+            self._replenisher.cancel()
+            try:
+                await self._replenisher
+            except asyncio.CancelledError:
+                pass
+            self._replenisher = None
+
+
+venv_pool = VenvPool()
@@ -0,0 +1,103 @@
+"""Incremental materialization of project files into a build workspace.
+
+Each workspace keeps a manifest (``.riff-manifest.json``) of workspace path
+to content hash for every file written from the database. Preview builds
+compare it with the hashes of the active files in the database and only
+fetch files whose hash differs. A sync only writes files whose hash changed
+and removes files that were deleted, so untouched files keep their mtimes and Vite/tsc caches
+stay valid. Writes go through a temp file and rename so watchers never see
+half-written files.
+"""
+
+import json
+import os
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterable, List
+
+from app.libs.file_store import content_hash
+
+MANIFEST_NAME = ".riff-manifest.json"
+
+
+@dataclass
+class SyncResult:
+    written: List[str] = field(default_factory=list)
+    deleted: List[str] = field(default_factory=list)
+    unchanged: int = 0
+    bytes_written: int = 0
+
+    @property
+    def changed(self) -> List[str]:
+        return self.written + self.deleted
+
+
+def load_manifest(workspace: Path) -> Dict[str, Any]:
+    try:
+        manifest = json.loads((workspace / MANIFEST_NAME).read_text())
+    except (OSError, ValueError):
+        return {"files": {}}
+    manifest.setdefault("files", {})
+    # Written by earlier versions, which fetched rows by timestamp
+    manifest.pop("synced_at", None)
+    return manifest
+
+
+def save_manifest(workspace: Path, manifest: Dict[str, Any]):
+    _atomic_write(workspace / MANIFEST_NAME, json.dumps(manifest, default=str))
+
+
+def _atomic_write(path: Path, content: str) -> int:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    data = content.encode("utf-8")
+    tmp = path.with_name(f".{path.name}.tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+    return len(data)
+
+
+def write_if_changed(path: Path, content: str) -> bool:
+    """Write a file only if its content differs, returns True if written."""
+    try:
+        if path.read_text(encoding="utf-8") == content:
+            return False
+    except (OSError, UnicodeDecodeError):
+        pass
+    _atomic_write(path, content)
+    return True
+
+
+def sync_files(
+    workspace: Path,
+    manifest: Dict[str, Any],
+    files: Dict[str, str],
+    deleted: Iterable[str] = (),
+) -> SyncResult:
+    """Write changed files and remove deleted ones, updating the manifest.
+
+    files maps workspace relative paths to content, deleted lists workspace
+    relative paths that no longer exist in the project.
+    """
+    result = SyncResult()
+    hashes: Dict[str, str] = manifest["files"]
+
+    for rel_path, content in files.items():
+        digest = content_hash(content)
+        target = workspace / rel_path
+        if hashes.get(rel_path) == digest and target.exists():
+            result.unchanged += 1
+            continue
+        result.bytes_written += _atomic_write(target, content)
+        hashes[rel_path] = digest
+        result.written.append(rel_path)
+
+    for rel_path in deleted:
+        if rel_path in files:
+            continue
+        hashes.pop(rel_path, None)
+        target = workspace / rel_path
+        if target.exists():
+            target.unlink()
+            result.deleted.append(rel_path)
+
+    return result
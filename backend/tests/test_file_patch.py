@@ -0,0 +1,102 @@
+import time
+
+import pytest
+
+from app.libs import file_patch
+from app.libs.file_patch import (
+    PatchError,
+    apply_search_replace,
+    apply_unified_diff,
+    find_block,
+    parse_unified_diff,
+)
+
+
+def test_removed_line_starting_with_dashes():
+    content = "SELECT 1;\n-- old comment\nSELECT 2;\n"
+    diff = (
+        "--- a/query.sql\n"
+        "+++ b/query.sql\n"
+        "@@ -2,1 +2,1 @@\n"
+        "--- old comment\n"
+        "+-- new comment\n"
+    )
+
+    hunks = parse_unified_diff(diff)
+
+    assert hunks[0].lines == [("-", "-- old comment"), ("+", "-- new comment")]
+    assert apply_unified_diff(content, diff) == "SELECT 1;\n-- new comment\nSELECT 2;\n"
+
+
+def test_fuzzy_search_is_bounded(monkeypatch):
+    monkeypatch.setattr(file_patch, "PATCH_FUZZY_TIME_BUDGET", 0.5)
+    lines = [f"const value{i} = compute({i}, {i * 7});" for i in range(3000)]
+    block = [f"let missing{i} = other({i});" for i in range(20)]
+
+    started = time.monotonic()
+    assert find_block(lines, block, hint=1500) is None
+    assert time.monotonic() - started < 5
+
+
+def test_fuzzy_match_near_hint():
+    lines = [f"line {i}" for i in range(50)]
+    lines[30] = "    return   value + 1"
+    block = ["line 29", "return value + 1", "line 31"]
+
+    assert find_block(lines, block, hint=28, window=10) == 29
+
+
+def test_stale_removed_line_is_rejected():
+    content = "MAX_RETRIES = 10\nTIMEOUT = 30\n"
+    diff = (
+        "@@ -1,2 +1,2 @@\n"
+        "-MAX_RETRIES = 15\n"
+        "+MAX_RETRIES = 20\n"
+        " TIMEOUT = 30\n"
+    )
+
+    with pytest.raises(PatchError):
+        apply_unified_diff(content, diff)
+
+
+def test_stale_search_text_is_rejected():
+    content = "MAX_RETRIES = 10\nTIMEOUT = 30\n"
+
+    with pytest.raises(PatchError):
+        apply_search_replace(content, [("MAX_RETRIES = 15", "MAX_RETRIES = 20")])
+
+
+def test_search_text_matches_up_to_whitespace():
+    content = "def f():\n    return 1\n"
+
+    result = apply_search_replace(content, [("def f():\n  return 1", "def f():\n    return 2")])
+
+    assert result == "def f():\n    return 2\n"
+
+
+def test_fuzzy_context_with_exact_removed_line():
+    content = "# retries\nMAX_RETRIES = 10\nTIMEOUT = 30\n"
+    diff = (
+        "@@ -1,3 +1,3 @@\n"
+        " # retry count\n"
+        "-MAX_RETRIES = 10\n"
+        "+MAX_RETRIES = 20\n"
+        " TIMEOUT = 30\n"
+    )
+
+    assert apply_unified_diff(content, diff) == "# retries\nMAX_RETRIES = 20\nTIMEOUT = 30\n"
+
+
+def test_hunk_ends_at_header_counts():
+    content = "a\nb\nc\n"
+    diff = (
+        "--- a/file.txt\n"
+        "+++ b/file.txt\n"
+        "@@ -2,1 +2,1 @@\n"
+        "-b\n"
+        "+B\n"
+        "\n"
+    )
+
+    assert parse_unified_diff(diff)[0].lines == [("-", "b"), ("+", "B")]
+    assert apply_unified_diff(content, diff) == "a\nB\nc\n"
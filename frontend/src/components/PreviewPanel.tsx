@@ -18,7 +18,7 @@ export function PreviewPanel({ projectId }: { projectId: string }) {
 
     try {
       console.log('[BUILD] Starting build for project:', projectId);
-      const response = await fetch(`${API_URL}/preview/build/${projectId}`, {
+      const response = await fetch(`${API_URL}/preview/build/${projectId}?wait=true`, {
         method: 'POST',
         credentials: 'include',
       });